@@ -0,0 +1,76 @@
+"""
+Check that the compact frames reproduce the insertion panels of the float64 frames, and compare their memory.
+
+Run from the repository root, on the CSV files or on an insertion store:
+
+    python -m benchmarks.compact_frames --genes 300
+    python -m benchmarks.compact_frames --store ./data/1_insertion_store --genes 300
+
+The baseline panels are built by get_insertions_in_genes from the frames of
+read_data(compact=False) read from the CSV files; the compact panels by
+get_insertions_in_gene_list from the compact frames through the gene index,
+as on the curve plot page. M, Padj, G and weights must be identical.
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.compact_frames import memory_footprint
+from src.extract_DIT_HAP_data import build_gene_insertion_index, get_insertions_in_gene_list, get_insertions_in_genes
+from src.load_basic_data import read_data
+
+
+def compare_panels(baseline, compact):
+    """
+    Assert that the (insertion_GMs, gene_level_GMs, insertion_last_tp) panels of a gene are identical.
+    """
+    for baseline_frame, compact_frame in zip(baseline, compact):
+        pd.testing.assert_frame_equal(
+            compact_frame[baseline_frame.columns].astype(object), baseline_frame.astype(object),
+            check_exact=True, check_index_type=False,
+        )
+
+
+def main(args):
+
+    start = time.perf_counter()
+    baseline_frames = read_data(args.insertion_LFCs_file, args.gene_level_LFCs_file, args.insertion_annotations_file, args.timepoint_file, None, compact=False)
+    print(f"baseline load from CSV: {time.perf_counter() - start:.2f} s")
+    start = time.perf_counter()
+    compact_frames = read_data(args.insertion_LFCs_file, args.gene_level_LFCs_file, args.insertion_annotations_file, args.timepoint_file, args.insertion_store_dir, compact=True)
+    print(f"compact load{' from the store' if args.insertion_store_dir is not None else ''}: {time.perf_counter() - start:.2f} s")
+
+    names = ["insertion_LFCs", "gene_level_LFCs", "insertion_annotations"]
+    footprint = memory_footprint(dict(zip(names, baseline_frames))).merge(
+        memory_footprint(dict(zip(names, compact_frames))), on="Frame", suffixes=(" baseline", " compact")
+    )
+    print(footprint.to_string(index=False))
+
+    insertion_LFCs, gene_level_LFCs, insertion_annotations, timepoints = compact_frames
+    gene_index = build_gene_insertion_index(insertion_annotations, insertion_LFCs, dataset_key=f"compact|{args.insertion_store_dir}")
+    genes = np.array(sorted(gene_index[2]))
+    sysIDs = np.random.default_rng(args.seed).choice(genes, size=min(args.n_genes, len(genes)), replace=False).tolist()
+    compact_panels = get_insertions_in_gene_list(sysIDs, gene_level_LFCs, timepoints, gene_index)
+
+    for sysID in sysIDs:
+        compare_panels(get_insertions_in_genes(sysID, baseline_frames[2], baseline_frames[0], baseline_frames[1], baseline_frames[3]), compact_panels[sysID])
+    print(f"panels of {len(sysIDs)} genes match the float64 frames")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Check the compact frames against the float64 frames.")
+    parser.add_argument("-l", "--insertion-LFCs", dest="insertion_LFCs_file", type=Path, default=Path("./data/0_raw/insertions_LFC.csv"), help="File of insertion LFCs")
+    parser.add_argument("-g", "--gene-level-LFCs", dest="gene_level_LFCs_file", type=Path, default=Path("./data/0_raw/GWMs.csv"), help="File of gene-level LFCs")
+    parser.add_argument("-a", "--insertion-annotations", dest="insertion_annotations_file", type=Path, default=Path("./data/0_raw/DIT_HAP_20241001.annotated.csv"), help="File of insertion annotations")
+    parser.add_argument("-t", "--timepoints", dest="timepoint_file", type=Path, default=Path("./data/0_raw/samples_timepoints.csv"), help="File of sample timepoints")
+    parser.add_argument("--store", dest="insertion_store_dir", type=Path, default=None, help="Insertion store the compact frames are read from, the CSV files by default")
+    parser.add_argument("-n", "--genes", dest="n_genes", type=int, default=300, help="Number of random genes compared")
+    parser.add_argument("-s", "--seed", dest="seed", type=int, default=0, help="Seed of the gene sample")
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,96 @@
+"""
+Benchmark the vectorized protein-domain assignment against the row-wise reference.
+
+Run from the repository root, either on real files:
+
+    python -m benchmarks.domain_annotation -i <insertion dir> -d <domain file>
+
+or on a synthetic insertion set built from the genes in GWMs.csv:
+
+    python -m benchmarks.domain_annotation --n-insertions 20000
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.add_domain_annotation_for_insertion import assign_protein_domain, assign_protein_domains, build_domain_intervals
+
+
+def make_synthetic_data(n_insertions, genes, seed=0):
+    rng = np.random.default_rng(seed)
+
+    domain_rows = []
+    for gene in genes:
+        for domain_idx in range(rng.integers(0, 4)):
+            starts = np.sort(rng.integers(1, 800, rng.integers(1, 3)))
+            residues = ",".join(f"{start}-{start + rng.integers(10, 200)}" for start in starts)
+            domain_rows.append((gene, f"{gene}_D{domain_idx}", residues))
+    domains = pd.DataFrame(domain_rows, columns=["Systematic ID", "domain_id", "domain_residues"])
+
+    insertion_annotations = pd.DataFrame({
+        "#Chr": "I",
+        "Coordinate": np.arange(n_insertions),
+        "Strand": rng.choice(["+", "-"], n_insertions),
+        "Target": "Target",
+        "Systematic ID": rng.choice(genes, n_insertions),
+        "Residue_affected": rng.integers(1, 1000, n_insertions).astype(float),
+    }).set_index(["#Chr", "Coordinate", "Strand", "Target"])
+
+    return insertion_annotations, domains
+
+
+def load_data(insertion_dir, domain_file):
+    domains = pd.read_csv(domain_file, header=[0], sep="\t")
+    insertion_annotations = pd.concat(
+        [pd.read_csv(file, index_col=[0, 1, 2, 3], header=0) for file in insertion_dir.glob("*annotated_insertions.csv")],
+        axis=0
+    ).drop_duplicates()
+    return insertion_annotations, domains
+
+
+def main(args):
+
+    if args.insertion_dir is not None and args.domain_file is not None:
+        insertion_annotations, domains = load_data(args.insertion_dir, args.domain_file)
+    else:
+        genes = pd.read_csv(args.gene_file, index_col=0).index.to_numpy()
+        insertion_annotations, domains = make_synthetic_data(args.n_insertions, genes)
+
+    print(f"{len(insertion_annotations)} insertions, {len(domains)} domains")
+
+    start = time.perf_counter()
+    domain_intervals = build_domain_intervals(domains)
+    vectorized = assign_protein_domains(insertion_annotations, domain_intervals)
+    vectorized_time = time.perf_counter() - start
+    print(f"vectorized interval join: {vectorized_time:.3f} s")
+
+    # the row-wise implementation is too slow for a genome-wide set, so time it on a subset
+    subset = insertion_annotations.iloc[:args.n_reference]
+    start = time.perf_counter()
+    reference = subset.apply(lambda row: assign_protein_domain(row, domains), axis=1, result_type="expand")
+    reference_time = time.perf_counter() - start
+    reference.columns = ["domain_id", "domain_residues"]
+    print(f"row-wise apply on {len(subset)} insertions: {reference_time:.3f} s "
+          f"(~{reference_time * len(insertion_annotations) / max(len(subset), 1):.1f} s extrapolated)")
+
+    pd.testing.assert_frame_equal(
+        vectorized.iloc[:len(subset)].astype(object), reference.astype(object), check_names=False
+    )
+    print("results match the row-wise implementation")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark protein-domain assignment.")
+    parser.add_argument("-i", "--insertion-dir", dest="insertion_dir", type=Path, help="Dir of insertion")
+    parser.add_argument("-d", "--domain-file", dest="domain_file", type=Path, help="File of domain")
+    parser.add_argument("-g", "--gene-file", dest="gene_file", type=Path, default=Path("data/0_raw/GWMs.csv"), help="Genes of the synthetic data")
+    parser.add_argument("-n", "--n-insertions", dest="n_insertions", type=int, default=200000, help="Number of synthetic insertions")
+    parser.add_argument("-r", "--n-reference", dest="n_reference", type=int, default=5000, help="Insertions run through the row-wise implementation")
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,235 @@
+"""
+Load test of the shared dataset against per-session copies.
+
+Starts several server-like processes, each running simulated sessions in
+threads that load the basic data and look up genes, and reports the memory
+of the processes while every session holds its frames:
+
+    python -m benchmarks.shared_dataset --processes 4 --sessions 8
+
+In "copy" mode every session unpickles its own frames, as st.cache_data
+does; in "shared" mode each process memory-maps the dataset published by
+src.shared_dataset once and all of its sessions use those frames. PSS
+(proportional set size) splits shared pages between the processes mapping
+them, so PSS per session is the memory a session really costs. Memory is
+read from /proc/self/smaps_rollup (Linux).
+"""
+import argparse
+import multiprocessing
+import pickle
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.load_basic_data import read_data, shared_basic_data
+
+MODES = ["copy", "shared"]
+
+
+def memory_usage():
+    """
+    Returns:
+        dict: RSS, PSS and USS (private pages) of the calling process in MB.
+    """
+    fields = {}
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "RSS": fields["Rss"],
+        "PSS": fields["Pss"],
+        "USS": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def run_session(get_frames, n_queries, seed, loaded, release):
+    insertion_LFCs, gene_level_LFCs, insertion_annotations, timepoints = get_frames()
+    genes = insertion_annotations["Systematic ID"].dropna().unique()
+    rng = np.random.default_rng(seed)
+    for gene in rng.choice(genes, size=min(n_queries, len(genes)), replace=False):
+        annotations = insertion_annotations[insertion_annotations["Systematic ID"] == gene]
+        insertion_LFCs.loc[insertion_LFCs.index.intersection(annotations.index)]
+    loaded.wait()
+    # hold the frames until the process has been measured
+    release.wait()
+
+
+def run_process(mode, data_args, shared_dataset_dir, n_sessions, n_queries, process_id, processes_loaded, results):
+    baseline = memory_usage()
+
+    if mode == "copy":
+        # st.cache_data keeps the pickled value and unpickles it on every call
+        pickled = pickle.dumps(read_data(*data_args))
+
+        def get_frames():
+            return pickle.loads(pickled)
+    else:
+        frames = shared_basic_data(*data_args, shared_dataset_dir, attach_only=True)
+
+        def get_frames():
+            return frames
+
+    loaded = threading.Barrier(n_sessions + 1)
+    release = threading.Event()
+    start = time.perf_counter()
+    sessions = [
+        threading.Thread(target=run_session, args=(get_frames, n_queries, process_id * n_sessions + session, loaded, release))
+        for session in range(n_sessions)
+    ]
+    for session in sessions:
+        session.start()
+    loaded.wait()
+    seconds = time.perf_counter() - start
+
+    # measure once every process holds all of its sessions, so shared pages are split between them
+    processes_loaded.wait()
+    usage = memory_usage()
+    processes_loaded.wait()
+    release.set()
+    for session in sessions:
+        session.join()
+
+    results.put({
+        "process": process_id, "seconds": seconds,
+        **usage, **{f"baseline_{key}": value for key, value in baseline.items()},
+    })
+
+
+def load_test(mode, data_args, shared_dataset_dir, n_processes, n_sessions, n_queries):
+    context = multiprocessing.get_context("spawn")
+    processes_loaded = context.Barrier(n_processes)
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_process, args=(mode, data_args, shared_dataset_dir, n_sessions, n_queries, process_id, processes_loaded, results))
+        for process_id in range(n_processes)
+    ]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    rows = pd.DataFrame(rows)
+    data_MB = {key: (rows[key] - rows[f"baseline_{key}"]).mean() for key in ["RSS", "PSS", "USS"]}
+    return {
+        "mode": mode,
+        "processes": n_processes,
+        "sessions/process": n_sessions,
+        "load+queries (s)": rows["seconds"].mean(),
+        "RSS/process (MB)": rows["RSS"].mean(),
+        "PSS/process (MB)": rows["PSS"].mean(),
+        "USS/process (MB)": rows["USS"].mean(),
+        "data RSS/session (MB)": data_MB["RSS"] / n_sessions,
+        "data PSS/session (MB)": data_MB["PSS"] / n_sessions,
+    }
+
+
+def main(args):
+
+    data_args = (args.insertion_LFCs_file, args.gene_level_LFCs_file, args.insertion_annotations_file, args.timepoint_file, args.insertion_store_dir, True)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        shared_dataset_dir = args.shared_dataset_dir or tmp_dir
+        # publish before the processes start, so that they only attach
+        shared_basic_data(*data_args, shared_dataset_dir)
+        results = pd.DataFrame([
+            load_test(mode, data_args, shared_dataset_dir, args.processes, args.sessions, args.queries)
+            for mode in args.modes
+        ])
+
+    print(results.round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Memory of concurrent sessions with per-session copies or the shared dataset.")
+    parser.add_argument(
+        "-l",
+        "--insertion-LFCs",
+        dest="insertion_LFCs_file",
+        default=Path("./data/0_raw/insertions_LFC.csv"),
+        type=Path,
+        help="File of insertion LFCs",
+    )
+    parser.add_argument(
+        "-g",
+        "--gene-level-LFCs",
+        dest="gene_level_LFCs_file",
+        default=Path("./data/0_raw/GWMs.csv"),
+        type=Path,
+        help="File of gene-level LFCs",
+    )
+    parser.add_argument(
+        "-a",
+        "--insertion-annotations",
+        dest="insertion_annotations_file",
+        default=Path("./data/0_raw/DIT_HAP_20241001.annotated.csv"),
+        type=Path,
+        help="File of insertion annotations",
+    )
+    parser.add_argument(
+        "-t",
+        "--timepoints",
+        dest="timepoint_file",
+        default=Path("./data/0_raw/samples_timepoints.csv"),
+        type=Path,
+        help="File of sample timepoints",
+    )
+    parser.add_argument(
+        "--store",
+        dest="insertion_store_dir",
+        default=None,
+        type=Path,
+        help="Columnar insertion store used instead of the insertion CSV files",
+    )
+    parser.add_argument(
+        "-d",
+        "--shared-dataset-dir",
+        dest="shared_dataset_dir",
+        default=None,
+        type=Path,
+        help="Directory of the shared datasets (a temporary directory by default)",
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        dest="processes",
+        default=4,
+        type=int,
+        help="Server processes",
+    )
+    parser.add_argument(
+        "-s",
+        "--sessions",
+        dest="sessions",
+        default=8,
+        type=int,
+        help="Concurrent sessions per process",
+    )
+    parser.add_argument(
+        "-q",
+        "--queries",
+        dest="queries",
+        default=20,
+        type=int,
+        help="Genes looked up by every session",
+    )
+    parser.add_argument(
+        "-m",
+        "--modes",
+        dest="modes",
+        nargs="+",
+        default=MODES,
+        choices=MODES,
+        help="Modes to compare",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,102 @@
+"""
+Benchmark the STRING client against the local stub server.
+
+Runs the enrichment of the first clusters of the cluster file against all
+clustered genes with an empty cache, then again from the cache, and with
+concurrent requests:
+
+    python -m benchmarks.string_client --n-sets 8 --delay 0.2
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.string_stub_server import start_stub_server
+from src.result_cache import ResultCache
+from src.string_client import StringClient
+from src.utils_functions import load_cluster_info
+
+
+def run(label, client, server, function):
+    served = server.requests_served
+    start = time.perf_counter()
+    function()
+    print(f"{label:<32} {time.perf_counter() - start:8.2f} s  {server.requests_served - served:4d} requests")
+
+
+def main(args):
+
+    bg_genes, cluster_info_grouped = load_cluster_info(args.cluster_file)
+    query_sets = dict(list(cluster_info_grouped.items())[:args.n_sets])
+
+    server = start_stub_server(recordings_dir=args.recordings_dir, synthetic=True, delay=args.delay, fail_rate=args.fail_rate)
+    print(f"{len(query_sets)} query sets, {len(bg_genes)} background genes, {args.delay} s per response")
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            client = StringClient(base_url=server.base_url, cache=ResultCache(cache_dir), backoff_factor=0.01)
+            run("sequential, empty cache", client, server, lambda: [client.enrichment(genes, bg_genes) for genes in query_sets.values()])
+            run("sequential, cached", client, server, lambda: [client.enrichment(genes, bg_genes) for genes in query_sets.values()])
+
+            fresh_client = StringClient(base_url=server.base_url, cache=ResultCache(cache_dir), backoff_factor=0.01)
+            run("new process, cached", fresh_client, server, lambda: [fresh_client.enrichment(genes, bg_genes) for genes in query_sets.values()])
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            client = StringClient(base_url=server.base_url, cache=ResultCache(cache_dir), pool_size=args.pool_size, backoff_factor=0.01)
+            run(f"concurrent ({args.pool_size}), empty cache", client, server, lambda: client.enrichment_many(query_sets, bg_genes))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the STRING client against the local stub server.")
+    parser.add_argument(
+        "-c",
+        "--cluster-file",
+        dest="cluster_file",
+        default=Path("./data/0_raw/clustered_GWMs_customed_distance_1000_renamed.csv"),
+        type=Path,
+        help="File of clusters (Systematic ID,revised_cluster)",
+    )
+    parser.add_argument(
+        "-r",
+        "--recordings",
+        dest="recordings_dir",
+        default=None,
+        type=Path,
+        help="Dir of recorded STRING responses",
+    )
+    parser.add_argument(
+        "-n",
+        "--n-sets",
+        dest="n_sets",
+        default=8,
+        type=int,
+        help="Number of clusters queried",
+    )
+    parser.add_argument(
+        "--delay",
+        dest="delay",
+        default=0.2,
+        type=float,
+        help="Seconds added to every stub response",
+    )
+    parser.add_argument(
+        "--fail-rate",
+        dest="fail_rate",
+        default=0.0,
+        type=float,
+        help="Fraction of stub responses failing with 503",
+    )
+    parser.add_argument(
+        "--pool-size",
+        dest="pool_size",
+        default=4,
+        type=int,
+        help="Concurrent requests",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
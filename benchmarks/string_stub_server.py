@@ -0,0 +1,173 @@
+"""
+Local stand-in for the STRING API, to benchmark and test the STRING client offline.
+
+Calls are answered from the responses recorded by StringClient(record_dir=...)
+and, with --synthetic, unrecorded get_string_ids and enrichment calls get
+deterministic made-up answers in the format of the real API.
+
+    python -m benchmarks.string_stub_server --recordings <dir> --synthetic --port 8765
+    STRING_BASE_URL=http://127.0.0.1:8765 streamlit run main_page.py
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from src.string_client import STRING_SPECIES, request_fingerprint
+
+STUB_VERSION = "12.0"
+
+
+def _split_identifiers(identifiers):
+    return [item for item in identifiers.replace("%0d", "\r").replace("\n", "\r").split("\r") if item]
+
+
+def synthetic_string_ids(data):
+    lines = ["queryIndex\tqueryItem\tstringId\tncbiTaxonId\ttaxonName\tpreferredName\tannotation"]
+    for idx, gene in enumerate(_split_identifiers(data.get("identifiers", ""))):
+        lines.append(f"{idx}\t{gene}\t{STRING_SPECIES}.{gene}.1\t{STRING_SPECIES}\tSchizosaccharomyces pombe\t{gene}\t-")
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_enrichment(data, n_terms=40):
+    genes = sorted(_split_identifiers(data.get("identifiers", "")))
+    background_n = len(_split_identifiers(data.get("background_string_identifiers", "")))
+    rng = random.Random(hashlib.sha256("\r".join(genes).encode()).hexdigest())
+    lines = ["category\tterm\tnumber_of_genes\tnumber_of_genes_in_background\tncbiTaxonId\tinputGenes\tpreferredNames\tp_value\tfdr\tdescription"]
+    categories = ["Process", "Component", "Function", "KEGG", "InterPro"]
+    for idx in range(min(n_terms, len(genes))):
+        term_genes = sorted(rng.sample(genes, rng.randint(1, max(1, len(genes) // 4))))
+        p_value = rng.random() ** 4
+        lines.append("\t".join([
+            categories[idx % len(categories)], f"STUB:{idx:05d}", str(len(term_genes)),
+            str(max(len(term_genes), background_n // 20)), str(STRING_SPECIES),
+            ",".join(f"{STRING_SPECIES}.{gene}.1" for gene in term_genes), ",".join(term_genes),
+            f"{p_value:.3g}", f"{min(1.0, p_value * n_terms):.3g}", f"Stub term {idx}",
+        ]))
+    return "\n".join(lines) + "\n"
+
+
+SYNTHETIC_RESPONSES = {
+    "get_string_ids": synthetic_string_ids,
+    "enrichment": synthetic_enrichment,
+}
+
+
+class StringStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, recordings_dir=None, synthetic=False, delay=0.0, fail_rate=0.0):
+        super().__init__(address, StringStubHandler)
+        self.recordings_dir = Path(recordings_dir) if recordings_dir is not None else None
+        self.synthetic = synthetic
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.requests_served = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class StringStubHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        data = {key: values[0] for key, values in parse_qs(body, keep_blank_values=True).items()}
+        method = self.path.rstrip("/").split("/")[-1]
+
+        with self.server.lock:
+            self.server.requests_served += 1
+            failed = random.random() < self.server.fail_rate
+        time.sleep(self.server.delay)
+        if failed:
+            return self._reply(503, "Service Unavailable\n")
+
+        if method == "version":
+            return self._reply(200, f"string_version\tstable_address\n{STUB_VERSION}\t{self.server.base_url}\n")
+
+        if self.server.recordings_dir is not None:
+            recording = self.server.recordings_dir / f"{method}_{request_fingerprint(method, data)}.tsv"
+            if recording.exists():
+                return self._reply(200, recording.read_text())
+        if self.server.synthetic and method in SYNTHETIC_RESPONSES:
+            return self._reply(200, SYNTHETIC_RESPONSES[method](data))
+        self._reply(404, f"No recorded response for {method}\n")
+
+    do_GET = do_POST
+
+    def _reply(self, status, text):
+        content = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/tab-separated-values")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(recordings_dir=None, synthetic=True, delay=0.0, fail_rate=0.0, port=0):
+    """
+    Serve the stub from a daemon thread; port 0 picks a free port.
+
+    Returns:
+        StringStubServer: Call shutdown() to stop it; its base_url goes to StringClient.
+    """
+    server = StringStubServer(("127.0.0.1", port), recordings_dir, synthetic, delay, fail_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Local stand-in STRING server replaying recorded responses.")
+    parser.add_argument(
+        "-r",
+        "--recordings",
+        dest="recordings_dir",
+        default=None,
+        type=Path,
+        help="Dir of responses recorded by StringClient(record_dir=...)",
+    )
+    parser.add_argument(
+        "--synthetic",
+        dest="synthetic",
+        action="store_true",
+        help="Make up answers to calls without a recording",
+    )
+    parser.add_argument(
+        "--delay",
+        dest="delay",
+        default=0.0,
+        type=float,
+        help="Seconds added to every response, to emulate the network",
+    )
+    parser.add_argument(
+        "--fail-rate",
+        dest="fail_rate",
+        default=0.0,
+        type=float,
+        help="Fraction of calls answered with 503, to exercise the retries",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        dest="port",
+        default=8765,
+        type=int,
+        help="Port to listen on",
+    )
+
+    args = parser.parse_args()
+
+    server = StringStubServer(("127.0.0.1", args.port), args.recordings_dir, args.synthetic, args.delay, args.fail_rate)
+    print(f"STRING stub serving on {server.base_url}")
+    server.serve_forever()
@@ -4,13 +4,15 @@ st.set_page_config(layout="wide")
 # st.logo("./images/DNA-grey-on-blue.jpg", size="large")
 
 plot_page = st.Page("pages/plot_page.py", title="Curve plot", icon=":material/timeline:")
+genome_browser_page = st.Page("pages/genome_browser.py", title="Genome browser", icon=":material/view_timeline:")
 GOEA_page = st.Page("pages/GOEA_page.py", title="Enrichment analysis", icon=":material/search_insights:")
 gene_similarity_page = st.Page("pages/gene_similarity.py", title="Gene similarity", icon=":material/difference:")
+complex_coherence_page = st.Page("pages/complex_coherence.py", title="Complex coherence", icon=":material/hub:")
 
 pg = st.navigation(
         {
-            "Visualization": [plot_page],
-            "Analysis": [GOEA_page, gene_similarity_page],
+            "Visualization": [plot_page, genome_browser_page],
+            "Analysis": [GOEA_page, gene_similarity_page, complex_coherence_page],
         }
     )
 pg.run()
\ No newline at end of file
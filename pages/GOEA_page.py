@@ -1,29 +1,39 @@
 import pandas as pd
-from src.enrichment_analysis import load_GO_data, GOEA, format_GOEA_results, display_GOEA_results, parse_string_enrichment, display_string_enrichment
+from src.enrichment_analysis import load_GO_data, load_enrichment_engine, load_result_cache, cached_GOEA, format_GOEA_results, display_GOEA_results, load_string_client, display_string_enrichment, display_string_error, run_concurrently
+from src.string_client import STRING_BASE_URL
 import streamlit as st
 import altair as alt
 import requests ## python -m pip install requests 
+from requests.exceptions import RequestException
 import json
+from src.gene_resolver import load_gene_resolver
 from src.utils_functions import gene_information, get_gene_list_from_text_area, load_cluster_info
 import io
+import os
 from pathlib import Path
 
 gene_info_file = Path(
     "./references/pombase_annotation/20241001/gene_IDs_names_products.tsv")
 gene_id_to_name, coding_genes = gene_information(gene_info_file)
-name_to_id = {v: k for k, v in gene_id_to_name.items()}
+uniprot_mapping_file = Path(
+    "./references/pombase_annotation/20241001/uniprot_id_mapping.tsv")
+gene_resolver = load_gene_resolver(gene_info_file, uniprot_mapping_file)
 
 st.title("Enrichment analysis")
 st.divider()
-st.cache_data.clear()
+result_cache = load_result_cache("./data/2_result_cache")
+# compiled once per ontology version with `python -m src.ontology_snapshot`, or on first use
+snapshot_dir = "./data/3_ontology_snapshots"
+# STRING_BASE_URL can point to a local stand-in server (benchmarks/string_stub_server.py)
+string_client = load_string_client(result_cache, os.environ.get("STRING_BASE_URL", STRING_BASE_URL))
 # get query genes
 input_container = st.container()
 query_container, bg_container = input_container.columns(2)
 query_container.header("Enter the list of the query genes")
-query_genes, _ = get_gene_list_from_text_area(query_container, "query_genes", gene_id_to_name, name_to_id)
+query_genes, _ = get_gene_list_from_text_area(query_container, "query_genes", gene_resolver)
 
 bg_container.header("Enter the list of the background genes")
-bg_genes, _ = get_gene_list_from_text_area(bg_container, "bg_genes", gene_id_to_name, name_to_id)
+bg_genes, _ = get_gene_list_from_text_area(bg_container, "bg_genes", gene_resolver)
 
 # load GWMs
 coding_genes_in_DIT_HAP, cluster_info_grouped = load_cluster_info("./data/0_raw/clustered_GWMs_customed_distance_1000_renamed.csv")
@@ -53,32 +63,72 @@ else:
     )
     query_genes = gene_sets_with_size[query_gene_set]
 
-ontology_tab = st.tabs(["GO enrichment", "FYPO enrichment", "STRING enrichment"])
-with ontology_tab[0]:
-    with st.spinner("Performing ontology enrichment analysis..."):
-        obo_file = Path(
-                "./references/pombase_annotation/20241001/go-basic.obo")
-        gaf_file = Path(
-            "./references/pombase_annotation/20241001/go_style_gaf.tsv")
-        godag, ns2assoc = load_GO_data(obo_file, gaf_file)
-        go_sig = GOEA(query_genes, bg_genes, godag, ns2assoc)
-        go_sig_results, reorder_columns = format_GOEA_results(go_sig, gene_id_to_name)
-        go_sig_results = display_GOEA_results(ontology_tab[0], go_sig_results, reorder_columns)
-with ontology_tab[1]:
-    with st.spinner("Performing FYPO enrichment analysis..."):
-        FYPO_file = Path(
-                "./references/pombase_annotation/20241001/fypo-simple.obo")
-        FYPO_gaf_file = Path(
-            "./references/pombase_annotation/phaf_go_style_gaf.tsv")
-        FYPOdag, ns2FYPOassoc = load_GO_data(FYPO_file, FYPO_gaf_file)
-        fy_sig = GOEA(query_genes, bg_genes, FYPOdag, ns2FYPOassoc)
-        fy_sig_results, reorder_columns = format_GOEA_results(fy_sig, gene_id_to_name)
-        fy_sig_results = display_GOEA_results(ontology_tab[1], fy_sig_results, reorder_columns)
-with ontology_tab[2]:
-    with st.spinner("Performing STRING enrichment analysis..."):
-        string_sig = parse_string_enrichment(query_genes, bg_genes)
-        string_sig_results = display_string_enrichment(ontology_tab[2], string_sig)
+st.sidebar.markdown("- **Ontology setting:**")
+propagate_counts = st.sidebar.toggle(
+    "Propagate annotations to ancestor terms", value=True,
+    help="True path rule: genes annotated to a term also count towards its is_a and part_of ancestors"
+)
 
+obo_file = Path(
+        "./references/pombase_annotation/20241001/go-basic.obo")
+gaf_file = Path(
+    "./references/pombase_annotation/20241001/go_style_gaf.tsv")
+FYPO_file = Path(
+        "./references/pombase_annotation/20241001/fypo-simple.obo")
+FYPO_gaf_file = Path(
+    "./references/pombase_annotation/phaf_go_style_gaf.tsv")
+
+# cached per process; loaded in the script thread because the analyses below run in other threads
+with st.spinner("Loading the ontologies..."):
+    godag, ns2assoc = load_GO_data(obo_file, gaf_file, snapshot_dir)
+    go_engine = load_enrichment_engine(obo_file, gaf_file, snapshot_dir)
+    FYPOdag, ns2FYPOassoc = load_GO_data(FYPO_file, FYPO_gaf_file, snapshot_dir)
+    FYPO_engine = load_enrichment_engine(FYPO_file, FYPO_gaf_file, snapshot_dir)
+
+# the three analyses run concurrently and every tab is filled as soon as its result is ready
+analyses = {
+    "GO enrichment": lambda: format_GOEA_results(
+        cached_GOEA(query_genes, bg_genes, godag, ns2assoc, result_cache, [obo_file, gaf_file], engine=go_engine, propagate_counts=propagate_counts),
+        gene_id_to_name),
+    "FYPO enrichment": lambda: format_GOEA_results(
+        cached_GOEA(query_genes, bg_genes, FYPOdag, ns2FYPOassoc, result_cache, [FYPO_file, FYPO_gaf_file], engine=FYPO_engine, propagate_counts=propagate_counts),
+        gene_id_to_name),
+    "STRING enrichment": lambda: string_client.enrichment(query_genes, bg_genes),
+}
+ontology_tab = dict(zip(analyses, st.tabs(list(analyses))))
+running = {name: tab.empty() for name, tab in ontology_tab.items()}
+for name in analyses:
+    running[name].info(f"Running the {name}...")
+
+timings = {}
+for name, result, error, seconds in run_concurrently(analyses):
+    timings[name] = seconds
+    running[name].empty()
+    with ontology_tab[name]:
+        # a failed analysis is shown in its tab, the other tabs are still filled
+        if isinstance(error, RequestException) and name == "STRING enrichment":
+            display_string_error(st, string_client, error)
+        elif error is not None:
+            st.exception(error)
+        elif name == "STRING enrichment":
+            string_sig_results = display_string_enrichment(ontology_tab[name], result)
+        else:
+            sig_results, reorder_columns = result
+            display_GOEA_results(ontology_tab[name], sig_results, reorder_columns)
+        st.caption(f"Computed in {seconds:.2f} s")
+
+st.sidebar.markdown("- **Analysis time:**")
+st.sidebar.dataframe(
+    pd.DataFrame({"Analysis": list(timings), "Seconds": [round(seconds, 2) for seconds in timings.values()]}),
+    hide_index=True, use_container_width=True
+)
+
+cache_stats = result_cache.stats()
+st.sidebar.markdown("- **Result cache:**")
+st.sidebar.caption(
+    f"{cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+    f"{cache_stats['entries']} entries ({cache_stats['size_MB']} MB)"
+)
 
 # with ontology_tab[3]:
 #     with st.spinner("Generating STRING network..."):
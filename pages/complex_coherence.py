@@ -0,0 +1,55 @@
+import time
+from pathlib import Path
+
+import streamlit as st
+
+from src.complex_coherence import load_complex_coherence, read_complexes
+from src.depletion_curve import get_depletion_curve_data, plot_depletion_curve
+from src.similarity_engine import METRICS
+from src.utils_functions import gene_information
+
+GWMs_file = Path("./data/0_raw/GWMs.csv")
+timepoint_file = Path("./data/0_raw/samples_timepoints.csv")
+complex_file = Path("./references/pombase_annotation/20241001/Complex_annotation.tsv")
+gene_info_file = Path("./references/pombase_annotation/20241001/gene_IDs_names_products.tsv")
+gene_id_to_name, coding_genes = gene_information(gene_info_file)
+
+st.title("Protein complex coherence")
+st.caption("Complexes whose subunits have closer depletion curves than random gene sets of the same size")
+st.divider()
+
+st.sidebar.header("Configuration:")
+metric = st.sidebar.selectbox("Distance", METRICS, index=0)
+weighted = st.sidebar.toggle("Weight timepoints by -log10(pvalue)", value=True, disabled=(metric == "custom"))
+n_permutations = st.sidebar.select_slider("Random gene sets per complex size", options=[1000, 2000, 5000, 10000, 20000, 50000], value=10000)
+seed = st.sidebar.number_input("Seed", min_value=0, value=0)
+jobs = st.sidebar.number_input("Processes", min_value=1, max_value=32, value=1)
+max_FDR = st.sidebar.slider("Highest FDR", min_value=0.0, max_value=1.0, value=1.0, step=0.01)
+
+start = time.perf_counter()
+with st.spinner("Scoring the complexes..."):
+    scores = load_complex_coherence(GWMs_file, complex_file, metric, weighted, n_permutations, seed, jobs)
+st.sidebar.caption(f"Scored in {time.perf_counter() - start:.2f} s")
+
+shown_scores = scores[scores["FDR"] <= max_FDR]
+st.subheader(f"Ranked complexes ({len(shown_scores)} of {len(scores)})")
+st.dataframe(
+    shown_scores.round({"mean_distance": 3, "null_mean": 3, "null_std": 3, "z_score": 2}),
+    hide_index=True, use_container_width=True,
+    column_config={
+        "pvalue": st.column_config.NumberColumn(format="%.2e"),
+        "FDR": st.column_config.NumberColumn(format="%.2e"),
+    }
+)
+
+# depletion curves of the subunits of one complex
+complex_labels = {f"{row['GO term']} {row['GO_name']} ({row['subunits']})": row["GO term"] for _, row in shown_scores.iterrows()}
+if len(complex_labels) > 0:
+    complex_label = st.selectbox("Plot the subunits of", complex_labels.keys())
+    complexes = read_complexes(complex_file)
+    subunit_sysIDs = complexes.loc[complexes["acc"] == complex_labels[complex_label], "systematic_id"].tolist()
+
+    LFCs = get_depletion_curve_data(GWMs_file, timepoint_file, shared_dataset_dir="./data/4_shared_dataset")
+    subunit_LFCs = LFCs.query("Gene in @subunit_sysIDs").copy()
+    subunit_LFCs["Gene"] = subunit_LFCs["Gene"].map(gene_id_to_name)
+    st.altair_chart(plot_depletion_curve(subunit_LFCs), use_container_width=False, theme=None)
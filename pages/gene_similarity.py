@@ -3,19 +3,24 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import altair as alt
+from src.gene_resolver import load_gene_resolver
+from src.compact_frames import memory_footprint
 from src.utils_functions import get_gene_list_from_text_area, gene_information, load_cluster_info
-from src.depletion_curve import get_depletion_curve_data, plot_depletion_curve
+from src.depletion_curve import MAX_GENES_PER_CURVE_PLOT, get_depletion_curve_data, plot_depletion_curve
+from src.similarity_engine import METRICS, load_similarity_index, top_k_neighbours
+from src.cofitness_network import MAX_GENES_PER_NETWORK_PLOT, interaction_enrichment, load_cofitness_network, neighbourhood, network_edges, network_layout
 # Sidebar
 st.title("The similarity analysis of the depletion curve")
 st.divider()
-st.cache_data.clear()
 
 gene_info_file = Path(
     "./references/pombase_annotation/20241001/gene_IDs_names_products.tsv")
 gene_id_to_name, coding_genes = gene_information(gene_info_file)
-name_to_id = {v: k for k, v in gene_id_to_name.items()}
+uniprot_mapping_file = Path(
+    "./references/pombase_annotation/20241001/uniprot_id_mapping.tsv")
+gene_resolver = load_gene_resolver(gene_info_file, uniprot_mapping_file)
 
-LFCs = get_depletion_curve_data("./data/0_raw/GWMs.csv", "./data/0_raw/samples_timepoints.csv")
+LFCs = get_depletion_curve_data("./data/0_raw/GWMs.csv", "./data/0_raw/samples_timepoints.csv", shared_dataset_dir="./data/4_shared_dataset")
 coding_genes_in_DIT_HAP, cluster_info_grouped = load_cluster_info("./data/0_raw/clustered_GWMs_customed_distance_1000_renamed.csv")
 gene_sets = {"Coding genes in DIT_HAP": coding_genes_in_DIT_HAP, **cluster_info_grouped}
 gene_sets_with_size = {f"{k} ({len(v)})": v for k, v in gene_sets.items()}
@@ -23,7 +28,7 @@ gene_sets_with_size = {f"{k} ({len(v)})": v for k, v in gene_sets.items()}
 use_customed_gene_list = st.sidebar.toggle("Use customed gene list", value=False)
 if use_customed_gene_list:
     st.sidebar.subheader("Enter the list of the query genes")
-    query_sysIDs, _ = get_gene_list_from_text_area(st.sidebar, "input genes", gene_id_to_name, name_to_id)
+    query_sysIDs, _ = get_gene_list_from_text_area(st.sidebar, "input genes", gene_resolver)
 else:
     gene_set = st.sidebar.selectbox(
         "Please select the gene set",
@@ -31,12 +36,95 @@ else:
         index=11
     )
     query_sysIDs = gene_sets_with_size[gene_set]
+
+st.sidebar.markdown("- **Similar genes:**")
+find_neighbours = st.sidebar.toggle("Add the most similar genes", value=False)
+if find_neighbours:
+    metric = st.sidebar.selectbox("Distance", METRICS, index=0)
+    weighted = st.sidebar.toggle("Weight timepoints by -log10(pvalue)", value=True, disabled=(metric == "custom"))
+    n_neighbours = st.sidebar.number_input("Neighbours per query gene", min_value=1, max_value=100, value=10)
+
+    similarity_index = load_similarity_index("./data/0_raw/GWMs.csv")
+    neighbours = top_k_neighbours(similarity_index, query_sysIDs, k=n_neighbours, metric=metric, weighted=weighted)
+    neighbours["Query name"] = neighbours["Query"].map(gene_id_to_name)
+    neighbours["Neighbour name"] = neighbours["Neighbour"].map(gene_id_to_name)
+    with st.expander("Most similar genes", expanded=False):
+        st.dataframe(
+            neighbours[["Query", "Query name", "rank", "Neighbour", "Neighbour name", "distance"]].round({"distance": 3}),
+            hide_index=True, use_container_width=True
+        )
+    query_sysIDs = list(dict.fromkeys([*query_sysIDs, *neighbours["Neighbour"]]))
+st.sidebar.markdown("- **Co-fitness network:**")
+show_network = st.sidebar.toggle("Show the co-fitness network", value=False)
+if show_network:
+    network_k = st.sidebar.number_input("Neighbours per gene in the network", min_value=1, max_value=50, value=10)
+    min_correlation = st.sidebar.slider("Lowest correlation of an edge", min_value=0.5, max_value=1.0, value=0.9, step=0.01)
+    hops = st.sidebar.number_input("Hops from the query genes", min_value=0, max_value=3, value=1)
+st.sidebar.markdown("- **Plot setting:**")
+max_genes = st.sidebar.number_input(
+    "Summarize the curves above this number of genes", min_value=1, value=MAX_GENES_PER_CURVE_PLOT,
+    help="Larger gene sets are drawn as quantile ribbons and density bins"
+)
+highlight_genes = []
+if len(query_sysIDs) > max_genes:
+    highlight_genes = st.sidebar.multiselect(
+        "Highlight genes",
+        sorted(gene_id_to_name.get(sysID, sysID) for sysID in query_sysIDs),
+    )
+
+with st.sidebar.expander("Memory footprint of the loaded data"):
+    st.dataframe(memory_footprint({"depletion curves": LFCs}), hide_index=True, use_container_width=True)
+
 with st.spinner("Plot the depletion curve..."):
     query_LFCs = LFCs.query("Gene in @query_sysIDs").copy()
     query_LFCs["Gene"] = query_LFCs["Gene"].map(gene_id_to_name)
-    line_point_plot = plot_depletion_curve(query_LFCs)
+    line_point_plot = plot_depletion_curve(query_LFCs, highlight_genes, max_genes)
     st.altair_chart(line_point_plot, use_container_width=False, theme=None)
 
 
 
 
+
+if show_network:
+    physical_interaction_file = "./references/pombase_annotation/20241001/pombase-go-physical-interactions.tsv"
+    interaction_file = "./references/pombase_annotation/20241001/pombase-interactions-since-v62-2017-01-30"
+    with st.spinner("Build the co-fitness network..."):
+        network, interactions = load_cofitness_network("./data/0_raw/GWMs.csv", physical_interaction_file, interaction_file, network_k, min_correlation)
+
+    st.subheader("Co-fitness network")
+    st.dataframe(interaction_enrichment(network).round(5), hide_index=True, use_container_width=True)
+
+    network_genes = neighbourhood(network, query_sysIDs, hops=hops)
+    if len(network_genes) >= MAX_GENES_PER_NETWORK_PLOT:
+        st.caption(f"Only the first {MAX_GENES_PER_NETWORK_PLOT} genes reached from the query genes are drawn")
+    edges = network_edges(network, network_genes)
+    edges["interaction"] = np.select([edges["physical"], edges["genetic"]], ["physical", "genetic"], default="none")
+    positions = network_layout(edges, network_genes)
+
+    nodes = positions.rename_axis("Gene").reset_index()
+    nodes["Name"] = nodes["Gene"].map(gene_id_to_name).fillna(nodes["Gene"])
+    nodes["Query"] = nodes["Gene"].isin(query_sysIDs)
+    edges = edges.join(positions, on="Gene A").join(positions.add_suffix("2"), on="Gene B")
+    edges["Name A"] = edges["Gene A"].map(gene_id_to_name).fillna(edges["Gene A"])
+    edges["Name B"] = edges["Gene B"].map(gene_id_to_name).fillna(edges["Gene B"])
+
+    axis = alt.Axis(labels=False, ticks=False, grid=False, title=None)
+    edge_plot = alt.Chart(edges).mark_rule().encode(
+        x=alt.X("x:Q", axis=axis), y=alt.Y("y:Q", axis=axis), x2="x2:Q", y2="y2:Q",
+        color=alt.Color("interaction:N", scale=alt.Scale(domain=["physical", "genetic", "none"], range=["firebrick", "steelblue", "lightgray"]), legend=alt.Legend(orient="top")),
+        strokeWidth=alt.condition(alt.datum.interaction == "none", alt.value(1), alt.value(3)),
+        tooltip=["Name A", "Name B", alt.Tooltip("correlation:Q", format=".3f"), "interaction"]
+    )
+    node_plot = alt.Chart(nodes).mark_circle(size=80, opacity=1).encode(
+        x="x:Q", y="y:Q",
+        color=alt.condition(alt.datum.Query, alt.value("black"), alt.value("gray")),
+        tooltip=["Gene", "Name"]
+    )
+    label_plot = alt.Chart(nodes).mark_text(dy=-9, fontSize=10).encode(x="x:Q", y="y:Q", text="Name:N")
+    st.altair_chart((edge_plot + node_plot + label_plot).properties(height=700), use_container_width=True, theme=None)
+
+    with st.expander("Edges of the network", expanded=False):
+        st.dataframe(
+            edges[["Gene A", "Name A", "Gene B", "Name B", "correlation", "physical", "genetic"]].round({"correlation": 3}),
+            hide_index=True, use_container_width=True
+        )
@@ -0,0 +1,129 @@
+import time
+from pathlib import Path
+
+import altair as alt
+import streamlit as st
+
+from src.load_basic_data import basic_data_files, load_data, load_additional_info
+from src.gene_resolver import load_gene_resolver
+from src.shared_dataset import dataset_fingerprint
+from src.genome_browser import (
+    DEFAULT_N_BINS, MAX_INSERTIONS_PER_POINT_PLOT, binned_insertion_LFCs, count_insertions_in_window,
+    gene_window, insertions_in_window, load_genome_index, regions_in_window
+)
+
+insertion_LFCs_file = "./data/0_raw/insertions_LFC.csv"
+gene_level_LFCs_file = "./data/0_raw/GWMs.csv"
+insertion_annotations_file = "./data/0_raw/DIT_HAP_20241001.annotated.csv"
+timepoint_file = "./data/0_raw/samples_timepoints.csv"
+insertion_store_dir = "./data/1_insertion_store"
+shared_dataset_dir = "./data/4_shared_dataset"
+
+gene_description_file = "./references/pombase_annotation/20241001/gene_IDs_names_products.tsv"
+gene_essentiality_file = "./references/Hayles_2013_OB_merged_categories.xlsx"
+genome_region_file = "./references/Genome_regions_CDS_intron_IGR_annotated.bed"
+
+insertion_LFCs, gene_level_LFCs, insertion_annotations, timepoints = load_data(
+    insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir,
+    shared_dataset_dir=shared_dataset_dir
+)
+merged_gene_info, genome_regions = load_additional_info(
+    gene_description_file, gene_essentiality_file, genome_region_file, shared_dataset_dir=shared_dataset_dir
+)
+dataset_version = dataset_fingerprint([
+    *basic_data_files(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir),
+    genome_region_file
+])
+genome_index = load_genome_index(genome_regions, insertion_annotations, insertion_LFCs, timepoints, dataset_version)
+
+gene_info_file = Path(
+    "./references/pombase_annotation/20241001/gene_IDs_names_products.tsv")
+uniprot_mapping_file = Path(
+    "./references/pombase_annotation/20241001/uniprot_id_mapping.tsv")
+gene_resolver = load_gene_resolver(gene_info_file, uniprot_mapping_file)
+
+st.title("Genome browser")
+st.divider()
+
+# Window
+st.sidebar.subheader("Genome window")
+gene_query = st.sidebar.text_input("Go to gene (ID, name, synonym or UniProt ID)")
+chromosomes = list(genome_index.chromosome_lengths)
+window = None
+if gene_query:
+    sysID, _ = gene_resolver.resolve(gene_query.strip())
+    window = gene_window(genome_index, sysID) if sysID is not None else None
+    if window is None:
+        st.sidebar.warning(f"No genome region found for {gene_query}")
+
+if window is not None:
+    chrom, default_start, default_end = window
+else:
+    chrom = st.sidebar.selectbox("Chromosome", chromosomes)
+    default_start, default_end = 0, min(genome_index.chromosome_lengths[chrom], 50000)
+chrom_length = genome_index.chromosome_lengths[chrom]
+start = st.sidebar.number_input("Start", min_value=0, max_value=chrom_length - 1, value=default_start, step=1000, key=f"start_{chrom}_{gene_query}")
+end = st.sidebar.number_input("End", min_value=1, max_value=chrom_length, value=default_end, step=1000, key=f"end_{chrom}_{gene_query}")
+if end <= start:
+    st.error("The end of the window must be after its start")
+    st.stop()
+
+timepoint = st.sidebar.selectbox("Timepoint", genome_index.timepoints, index=len(genome_index.timepoints) - 1)
+n_bins = st.sidebar.number_input("Bins for wide windows", min_value=10, max_value=2000, value=DEFAULT_N_BINS)
+
+# Queries
+query_start = time.perf_counter()
+window_regions = regions_in_window(genome_index, chrom, start, end)
+n_insertions = count_insertions_in_window(genome_index, chrom, start, end)
+binned = n_insertions > MAX_INSERTIONS_PER_POINT_PLOT
+if binned:
+    window_LFCs = binned_insertion_LFCs(genome_index, chrom, start, end, n_bins)
+    window_LFCs = window_LFCs[window_LFCs["Timepoint"] == timepoint]
+else:
+    window_LFCs = insertions_in_window(genome_index, chrom, start, end)
+query_ms = (time.perf_counter() - query_start) * 1000
+
+st.caption(
+    f"{chrom}:{start:,}-{end:,} ({end - start:,} bp), {len(window_regions)} regions, {n_insertions} insertions"
+    f"{f', averaged in {n_bins} bins' if binned else ''}; queried in {query_ms:.1f} ms"
+)
+
+# Plots
+x_scale = alt.Scale(domain=(start, end))
+region_track = alt.Chart(window_regions.assign(Start=window_regions["Start"].clip(lower=start), End=window_regions["End"].clip(upper=end))).mark_rect().encode(
+    x=alt.X("Start:Q", scale=x_scale, title=f"Position on chromosome {chrom}"),
+    x2="End:Q",
+    y=alt.Y("Type:N", title=None),
+    color=alt.Color("Type:N", legend=alt.Legend(orient="top")),
+    tooltip=["Systematic ID", "Name", "Type", "Strand", "Start", "End", "Essentiality"]
+).properties(height=80)
+
+if binned:
+    LFC_track = alt.Chart(window_LFCs).mark_area(opacity=0.3, color="gray").encode(
+        x=alt.X("bin_start:Q", scale=x_scale, title=None),
+        y=alt.Y("min_M:Q", title=f"M ({timepoint})"),
+        y2="max_M:Q",
+    ) + alt.Chart(window_LFCs).mark_line(point=True).encode(
+        x=alt.X("bin_start:Q", scale=x_scale),
+        y=alt.Y("mean_M:Q"),
+        tooltip=["bin_start", "bin_end", "insertions", "mean_M", "min_M", "max_M"]
+    )
+    count_track = alt.Chart(window_LFCs).mark_bar().encode(
+        x=alt.X("bin_start:Q", scale=x_scale, title=None),
+        x2="bin_end:Q",
+        y=alt.Y("insertions:Q", title="Insertions"),
+    ).properties(height=80)
+    tracks = [LFC_track.properties(height=250), count_track, region_track]
+else:
+    LFC_track = alt.Chart(window_LFCs).mark_circle(opacity=0.7).encode(
+        x=alt.X("Coordinate:Q", scale=x_scale, title=None),
+        y=alt.Y(f"{timepoint}:Q", title=f"M ({timepoint})"),
+        color=alt.Color("Type:N", legend=None),
+        tooltip=["#Chr", "Coordinate", "Strand", "Systematic ID", "Type"] + genome_index.timepoints
+    ).properties(height=250)
+    tracks = [LFC_track, region_track]
+
+st.altair_chart(alt.vconcat(*tracks).resolve_scale(x="shared"), use_container_width=True, theme=None)
+
+with st.expander("Regions in the window"):
+    st.dataframe(window_regions, hide_index=True, use_container_width=True)
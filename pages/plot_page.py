@@ -1,13 +1,22 @@
 # %%
 from pathlib import Path
+import math
 import sys
+import uuid
 import altair as alt
 import streamlit as st
 sys.path.append("/data/c/yangyusheng_optimized/DIT_HAP_visualization/Streamlit_DEseq2")
-from src.load_basic_data import load_data, load_additional_info
-from src.extract_DIT_HAP_data import get_insertions_in_genes
-from src.plot_insertion import combine_plots
+from src.load_basic_data import basic_data_files, load_data, load_additional_info
+from src.extract_DIT_HAP_data import build_gene_insertion_index
+from src.gene_panel_cache import load_gene_panel_cache
+from src.curve_fitting import load_curve_fits
+from src.protein_features import gene_feature_summary, load_feature_summary
+from src.plot_insertion import feature_track_plot
+from src.peptide_index import load_peptide_reader
 from src.link_with_known_information import display_basic_information
+from src.gene_resolver import load_gene_resolver
+from src.compact_frames import memory_footprint
+from src.shared_dataset import dataset_fingerprint
 from src.utils_functions import get_gene_list_from_text_area, gene_information
 # Set page configuration
 
@@ -16,10 +25,18 @@ insertion_LFCs_file = "./data/0_raw/insertions_LFC.csv"
 gene_level_LFCs_file = "./data/0_raw/GWMs.csv"
 insertion_annotations_file = "./data/0_raw/DIT_HAP_20241001.annotated.csv"
 timepoint_file = "./data/0_raw/samples_timepoints.csv"
+# built once with `python -m src.insertion_store -l <insertion LFCs> -a <insertion annotations> -o <store>`
+insertion_store_dir = "./data/1_insertion_store"
+# processed frames published once and memory-mapped by every server process
+shared_dataset_dir = "./data/4_shared_dataset"
 
 gene_description_file = "./references/pombase_annotation/20241001/gene_IDs_names_products.tsv"
 gene_essentiality_file = "./references/Hayles_2013_OB_merged_categories.xlsx"
 genome_region_file = "./references/Genome_regions_CDS_intron_IGR_annotated.bed"
+protein_feature_file = "./references/pombase_annotation/20241001/ProteinFeatures.tsv"
+disordered_region_file = "./references/pombase_annotation/20241001/disordered_regions.tsv"
+# indexed once (peptide.fa.fai) and read through a memory map
+peptide_file = "./references/pombase_annotation/20241001/peptide.fa"
 
 
 (
@@ -27,12 +44,20 @@ genome_region_file = "./references/Genome_regions_CDS_intron_IGR_annotated.bed"
     gene_level_LFCs,
     insertion_annotations,
     timepoints  
-) = load_data(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file)
+) = load_data(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir, shared_dataset_dir=shared_dataset_dir)
+
+# the input files, or the store partitions replacing the insertion CSVs, identify the data derived from these frames
+basic_data_sources = basic_data_files(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir)
+
+gene_index = build_gene_insertion_index(
+    insertion_annotations, insertion_LFCs,
+    dataset_key=dataset_fingerprint(basic_data_sources)
+)
 
 (
     merged_gene_info,
     genome_regions,
-) = load_additional_info(gene_description_file, gene_essentiality_file, genome_region_file)
+) = load_additional_info(gene_description_file, gene_essentiality_file, genome_region_file, shared_dataset_dir=shared_dataset_dir)
 
 
 # %%
@@ -44,20 +69,73 @@ st.divider()
 gene_info_file = Path(
     "./references/pombase_annotation/20241001/gene_IDs_names_products.tsv")
 gene_id_to_name, coding_genes = gene_information(gene_info_file)
-name_to_id = {v: k for k, v in gene_id_to_name.items()}
+uniprot_mapping_file = Path(
+    "./references/pombase_annotation/20241001/uniprot_id_mapping.tsv")
+gene_resolver = load_gene_resolver(gene_info_file, uniprot_mapping_file)
+
+with st.sidebar.expander("Memory footprint of the loaded data"):
+    st.dataframe(memory_footprint({
+        "insertion_LFCs": insertion_LFCs,
+        "gene_level_LFCs": gene_level_LFCs,
+        "insertion_annotations": insertion_annotations,
+        "merged_gene_info": merged_gene_info,
+        "genome_regions": genome_regions,
+    }), hide_index=True, use_container_width=True)
 
 # Get query gene
 st.sidebar.subheader("Enter the list of the query genes")
-query_sysIDs, _ = get_gene_list_from_text_area(st.sidebar, "input genes", gene_id_to_name, name_to_id)
+query_sysIDs, _ = get_gene_list_from_text_area(st.sidebar, "input genes", gene_resolver)
+gene_prefix = st.sidebar.text_input("Look up genes by ID, name, synonym or UniProt ID prefix")
+if gene_prefix:
+    st.sidebar.dataframe(gene_resolver.search(gene_prefix), hide_index=True, use_container_width=True)
+
+# only the genes of the current page are computed, the next page is prefetched in the background
+genes_per_page = st.sidebar.number_input("Genes per page", min_value=1, max_value=50, value=10)
+n_pages = max(1, math.ceil(len(query_sysIDs) / genes_per_page))
+page = st.sidebar.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1)
+page_start, page_stop = (page - 1) * genes_per_page, page * genes_per_page
+page_sysIDs = query_sysIDs[page_start:page_stop]
+
+dataset_version = dataset_fingerprint([*basic_data_sources, peptide_file])
+# weighted M versus G fits of all insertions and genes, computed once per dataset version
+insertion_fits, gene_fits = load_curve_fits(
+    insertion_LFCs, gene_level_LFCs, timepoints, tuple(map(str, basic_data_sources)),
+    curve_fit_dir=shared_dataset_dir
+)
+indexed_annotations, indexed_LFCs, gene_offsets = gene_index
+# insertion summaries of every protein feature and disordered region, computed once per dataset version
+features, feature_summary, feature_offsets = load_feature_summary(
+    protein_feature_file, disordered_region_file, insertion_annotations, insertion_LFCs, timepoints,
+    tuple(map(str, basic_data_sources)),
+    feature_summary_dir=shared_dataset_dir
+)
+show_feature_tracks = st.sidebar.toggle("Show protein feature tracks", value=True)
+feature_timepoint = st.sidebar.selectbox("Timepoint of the feature tracks", timepoints.index[1:], index=len(timepoints) - 2)
+peptides = load_peptide_reader(peptide_file)
+panel_cache = load_gene_panel_cache(gene_level_LFCs, timepoints, gene_index, dataset_version, peptides)
+panel_specs = panel_cache.get_many(page_sysIDs)
+# the next page only; a new page only replaces the queue of this session
+prefetch_owner = st.session_state.setdefault("gene_panel_prefetch_owner", uuid.uuid4().hex)
+panel_cache.prefetch(query_sysIDs[page_stop:page_stop + genes_per_page], owner=prefetch_owner)
+
+if n_pages > 1:
+    st.caption(f"Genes {page_start + 1}-{min(page_stop, len(query_sysIDs))} of {len(query_sysIDs)}")
 
-for query in query_sysIDs:
+for query in page_sysIDs:
     
     igene = st.container()
-    sysID, gene_col = display_basic_information(igene, query, merged_gene_info)
-    if sysID in gene_level_LFCs.index:
-        insertion_GMs, gene_level_GMs, insertion_last_tp = get_insertions_in_genes(sysID, insertion_annotations, insertion_LFCs, gene_level_LFCs, timepoints)
-        combined_plot = combine_plots(insertion_GMs, gene_level_GMs, insertion_last_tp)
-        gene_col.altair_chart(combined_plot, use_container_width=True, theme=None)
+    sysID, gene_col = display_basic_information(igene, query, merged_gene_info, gene_resolver)
+    if panel_specs.get(sysID) is not None:
+        gene_col.vega_lite_chart(panel_specs[sysID], use_container_width=True, theme=None)
+        if show_feature_tracks:
+            gene_features = gene_feature_summary(feature_summary, feature_offsets, sysID, feature_timepoint)
+            if len(gene_features) > 0:
+                gene_col.altair_chart(feature_track_plot(gene_features), use_container_width=True, theme=None)
+        with gene_col.expander("Depletion curve fits (M = intercept + DR * G)"):
+            if sysID in gene_fits.index:
+                st.dataframe(gene_fits.loc[[sysID]], use_container_width=True)
+            gene_insertions = indexed_LFCs.index[slice(*gene_offsets.get(sysID, (0, 0)))]
+            st.dataframe(insertion_fits.loc[gene_insertions], use_container_width=True)
     else:
         st.warning(f"No data found for {query}")
-    igene.divider()
\ No newline at end of file
+    igene.divider()
@@ -1,11 +1,25 @@
 import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from src.peptide_index import PeptideReader, add_residue_context
+
+# Annotated insertions shared by the DDR merges of one process. Worker
+# processes memory-map them from an Arrow IPC file instead of receiving a
+# pickled copy with every sample, and keep their columns as Arrow arrays
+# over the mapped buffers, so a worker does not hold a private copy.
+_insertion_annotations = None
 
 def main(args):
 
+    global _insertion_annotations
+
     domains = pd.read_csv(args.domain_file, header=[0], sep="\t")
 
     insertion_annotation_list = []
@@ -18,23 +32,112 @@ def main(args):
 
     insertion_annotations.drop_duplicates(inplace=True)
 
-    insertion_annotations[["domain_id", "domain_residues"]] = insertion_annotations.apply(
-        lambda row: assign_protein_domain(row, domains), axis=1, result_type="expand"
-    )
+    domain_intervals = build_domain_intervals(domains)
+    insertion_annotations[["domain_id", "domain_residues"]] = assign_protein_domains(insertion_annotations, domain_intervals).to_numpy()
+    if args.peptide_file is not None:
+        residue_context = add_residue_context(insertion_annotations, PeptideReader(args.peptide_file))
+        insertion_annotations[residue_context.columns] = residue_context.to_numpy()
+
+    ddr_files = sorted(args.ddr_dir.glob("*.csv"))
+
+    if args.jobs > 1:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shared_file = Path(tmp_dir) / "insertion_annotations.arrow"
+            feather.write_feather(
+                pa.Table.from_pandas(insertion_annotations.reset_index(), preserve_index=False),
+                shared_file, compression="uncompressed"
+            )
+            del insertion_annotations
+
+            with ProcessPoolExecutor(max_workers=args.jobs, initializer=_attach_insertion_annotations, initargs=(shared_file,)) as executor:
+                futures = {
+                    executor.submit(merge_DDR_sample, file, args.output_folder, args.chunk_size): file
+                    for file in ddr_files
+                }
+                for finished, future in enumerate(as_completed(futures), start=1):
+                    sample = future.result()
+                    print(f"[{finished}/{len(ddr_files)}] {sample} done")
+    else:
+        _insertion_annotations = insertion_annotations.reset_index()
+        for finished, file in enumerate(ddr_files, start=1):
+            sample = merge_DDR_sample(file, args.output_folder, args.chunk_size)
+            print(f"[{finished}/{len(ddr_files)}] {sample} done")
+
+
+def _attach_insertion_annotations(shared_file):
+    global _insertion_annotations
+    # pd.ArrowDtype columns wrap the mapped buffers; numpy columns would be copied
+    _insertion_annotations = feather.read_table(shared_file, memory_map=True).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def merge_DDR_sample(DDR_file, output_folder, chunk_size):
+    """
+    Merge the DDRs of one sample onto the shared annotated insertions and write the result.
+    """
+    sample = DDR_file.name.split(".")[0]
+    DDRs = pd.read_csv(DDR_file, header=0)
+
+    insertion_annotation_with_domain = _insertion_annotations.merge(DDRs.reset_index(), on=["Systematic ID", "domain_id", "domain_residues"], how="left").set_index(["#Chr", "Coordinate", "Strand","Target"])
+    DDR_ratio = insertion_annotation_with_domain["DR"] / insertion_annotation_with_domain.groupby("Systematic ID")["DR"].transform("max")
+
+    insertion_annotation_with_domain["DDR_ratio"] = DDR_ratio.round(3)
+
+    insertion_annotation_with_domain.to_csv(output_folder / f"{sample}_with_domain_insertion_annotation.csv", chunksize=chunk_size)
+
+    return sample
+
+
+def build_domain_intervals(domains):
+    """
+    Explode the comma-separated domain_residues into one row per residue interval.
 
-    insertion_annotation_with_domain = {}
-    for file in args.ddr_dir.glob("*.csv"):
-        sample = file.name.split(".")[0]
-        DDRs = pd.read_csv(file, header=0)
+    The rows keep the order in which assign_protein_domain scans them (domain
+    table order, then interval order within domain_residues), stored as rank.
+    """
+    domain_intervals = domains.loc[domains["Systematic ID"].notna(), ["Systematic ID", "domain_id", "domain_residues"]].copy()
+    domain_intervals["interval"] = domain_intervals["domain_residues"].str.split(",")
+    domain_intervals = domain_intervals.explode("interval", ignore_index=True)
+    bounds = domain_intervals["interval"].str.split("-", expand=True)
+    domain_intervals["domain_start"] = bounds[0].str.strip().astype(int)
+    domain_intervals["domain_end"] = bounds[1].str.strip().astype(int)
+    domain_intervals["rank"] = np.arange(len(domain_intervals))
 
-        insertion_annotation_with_domain[sample] = insertion_annotations.reset_index().merge(DDRs.reset_index(), on=["Systematic ID", "domain_id", "domain_residues"], how="left").set_index(["#Chr", "Coordinate", "Strand","Target"])
-        DDR_ratio = insertion_annotation_with_domain[sample] .groupby("Systematic ID")["DR"].transform(lambda x: x / x.max()).rename("DDR_ratio")
+    return domain_intervals.drop(columns="interval").sort_values(["Systematic ID", "rank"], ignore_index=True)
 
-        insertion_annotation_with_domain[sample]["DDR_ratio"] = DDR_ratio.round(3)
 
-        insertion_annotation_with_domain[sample].to_csv(args.output_folder / f"{sample}_with_domain_insertion_annotation.csv")
+def assign_protein_domains(insertion_annotations, domain_intervals):
+    """
+    Vectorized assign_protein_domain: join the insertions with the intervals of their gene
+    and keep, for each insertion, the first interval (by rank) containing the affected residue.
+
+    Returns:
+        pd.DataFrame: domain_id and domain_residues per insertion, NaN when no domain matches.
+    """
+    insertions = pd.DataFrame({
+        "row": np.arange(len(insertion_annotations)),
+        "Systematic ID": insertion_annotations["Systematic ID"].to_numpy(),
+        "residue": np.trunc(pd.to_numeric(insertion_annotations["Residue_affected"], errors="coerce").to_numpy(dtype=float)),
+    })
+    insertions = insertions[insertions["Systematic ID"].notna() & insertions["residue"].notna()]
+
+    candidates = insertions.merge(domain_intervals, on="Systematic ID", how="inner")
+    hits = candidates[(candidates["residue"] >= candidates["domain_start"]) & (candidates["residue"] <= candidates["domain_end"])]
+    first_hits = hits.sort_values(["row", "rank"]).drop_duplicates("row").set_index("row")
+
+    assigned_domains = pd.DataFrame(
+        {"domain_id": np.nan, "domain_residues": np.nan},
+        index=np.arange(len(insertion_annotations)), dtype=object
+    )
+    assigned_domains.loc[first_hits.index, "domain_id"] = first_hits["domain_id"].to_numpy()
+    assigned_domains.loc[first_hits.index, "domain_residues"] = first_hits["domain_residues"].to_numpy()
+    assigned_domains.index = insertion_annotations.index
+
+    return assigned_domains
+
 
 def assign_protein_domain(row, domain):
+    # Row-wise reference implementation, kept for benchmarks/domain_annotation.py
+
     Gene = row["Systematic ID"]
     if Gene in domain["Systematic ID"].values:
         residue = int(row["Residue_affected"])
@@ -69,6 +172,14 @@ if __name__ == "__main__":
         type=Path,
         help="File of domain",
     )
+    parser.add_argument(
+        "-p",
+        "--peptides",
+        dest="peptide_file",
+        default=None,
+        type=Path,
+        help="Peptide FASTA (e.g. peptide.fa), adds the residue context of the insertions",
+    )
     parser.add_argument(
         "-ddr",
         "--DDR-dir",
@@ -85,6 +196,21 @@ if __name__ == "__main__":
         type=Path,
         help="Output Folder",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        default=1,
+        type=int,
+        help="Number of DDR samples processed in parallel",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        default=100000,
+        type=int,
+        help="Rows written per chunk of the output CSV",
+    )
 
     args = parser.parse_args()
 
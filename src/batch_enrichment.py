@@ -0,0 +1,129 @@
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from src.enrichment_analysis import load_enrichment_engine
+from src.enrichment_engine import run_batch_enrichment
+from src.utils_functions import load_cluster_info
+
+# Ontologies of the enrichment page
+ONTOLOGIES = {
+    "GO": (
+        Path("./references/pombase_annotation/20241001/go-basic.obo"),
+        Path("./references/pombase_annotation/20241001/go_style_gaf.tsv"),
+    ),
+    "FYPO": (
+        Path("./references/pombase_annotation/20241001/fypo-simple.obo"),
+        Path("./references/pombase_annotation/phaf_go_style_gaf.tsv"),
+    ),
+}
+
+
+def main(args):
+
+    coding_genes_in_DIT_HAP, cluster_info_grouped = load_cluster_info(args.cluster_file)
+    if args.background_file is not None:
+        bg_genes = pd.read_csv(args.background_file, header=None)[0].str.strip().tolist()
+    else:
+        bg_genes = coding_genes_in_DIT_HAP
+
+    ontologies = dict(ONTOLOGIES)
+    for ontology in args.ontology:
+        name, obo_file, gaf_file = ontology.split(",")
+        ontologies[name] = (Path(obo_file), Path(gaf_file))
+    if args.only is not None:
+        ontologies = {name: files for name, files in ontologies.items() if name in args.only}
+
+    results = []
+    for name, (obo_file, gaf_file) in ontologies.items():
+        start = time.perf_counter()
+        engine = load_enrichment_engine(obo_file, gaf_file, args.snapshot_dir)
+        ontology_results = run_batch_enrichment(
+            cluster_info_grouped, bg_genes, engine,
+            alpha=args.alpha, significant_only=not args.all_terms,
+            propagate_counts=not args.no_propagate
+        )
+        ontology_results.insert(0, "ontology", name)
+        results.append(ontology_results)
+        print(f"{name}: {len(cluster_info_grouped)} query sets, {len(ontology_results)} terms reported in {time.perf_counter() - start:.2f} s")
+
+    results = pd.concat(results, axis=0, ignore_index=True)
+    sep = "\t" if args.output.suffix in [".tsv", ".txt"] else ","
+    results.to_csv(args.output, sep=sep, index=False)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="GO and FYPO enrichment of every cluster against one background.")
+    parser.add_argument(
+        "-c",
+        "--cluster-file",
+        dest="cluster_file",
+        default=Path("./data/0_raw/clustered_GWMs_customed_distance_1000_renamed.csv"),
+        type=Path,
+        help="File of clusters (Systematic ID,revised_cluster)",
+    )
+    parser.add_argument(
+        "-b",
+        "--background-file",
+        dest="background_file",
+        default=None,
+        type=Path,
+        help="File of background genes, one per line (default: all genes in the cluster file)",
+    )
+    parser.add_argument(
+        "--ontology",
+        dest="ontology",
+        default=[],
+        action="append",
+        help="Extra ontology as name,obo_file,gaf_file (can be repeated)",
+    )
+    parser.add_argument(
+        "--only",
+        dest="only",
+        default=None,
+        nargs="+",
+        help="Only run these ontologies",
+    )
+    parser.add_argument(
+        "-s",
+        "--snapshot-dir",
+        dest="snapshot_dir",
+        default=Path("./data/3_ontology_snapshots"),
+        type=Path,
+        help="Folder of the binary ontology snapshots",
+    )
+    parser.add_argument(
+        "-a",
+        "--alpha",
+        dest="alpha",
+        default=0.05,
+        type=float,
+        help="Cut-off on the BH-adjusted p-value",
+    )
+    parser.add_argument(
+        "--no-propagate",
+        dest="no_propagate",
+        action="store_true",
+        help="Only count direct annotations, without propagating them to ancestor terms",
+    )
+    parser.add_argument(
+        "--all-terms",
+        dest="all_terms",
+        action="store_true",
+        help="Report every tested term, not only the significantly enriched ones",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        required=True,
+        type=Path,
+        help="Output file (long format, one row per cluster and term)",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
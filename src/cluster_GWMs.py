@@ -0,0 +1,186 @@
+import argparse
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import fcluster, linkage
+
+from src.similarity_engine import METRICS, build_similarity_index, pairwise_distances
+
+# Similarity index and condensed distance file of the worker processes
+_index = None
+_condensed_file = None
+
+
+def _attach(GWMs_file, condensed_file):
+    global _index, _condensed_file
+    _index = build_similarity_index(pd.read_csv(GWMs_file, index_col=0))
+    _condensed_file = condensed_file
+
+
+def _condensed_offset(row, n_genes):
+    # position of the pair (row, row + 1) in scipy's condensed distance vector
+    return row * n_genes - row * (row + 1) // 2
+
+
+def compute_distance_block(start, stop, metric, weighted):
+    """
+    Distances of genes start..stop-1 to every later gene, written into the shared condensed vector.
+    """
+    n_genes = len(_index.genes)
+    condensed = np.memmap(_condensed_file, dtype=np.float64, mode="r+", shape=(n_genes * (n_genes - 1) // 2,))
+    distances = pairwise_distances(_index, np.arange(start, stop), np.arange(start, n_genes), metric, weighted)
+    for offset, row in enumerate(range(start, stop)):
+        first = _condensed_offset(row, n_genes)
+        condensed[first:first + n_genes - row - 1] = distances[offset, offset + 1:]
+    condensed.flush()
+    return stop - start
+
+
+def name_clusters(cluster_ids, min_cluster_size):
+    """
+    Rename the clusters level_0, level_1, ... by decreasing size; clusters smaller than min_cluster_size become Miscellaneous.
+    """
+    sizes = pd.Series(cluster_ids).value_counts(sort=False)
+    sizes = sizes.sort_values(ascending=False, kind="stable")
+    names = {}
+    for level, (cluster_id, size) in enumerate(sizes[sizes >= min_cluster_size].items()):
+        names[cluster_id] = f"level_{level}"
+    return np.array([names.get(cluster_id, "Miscellaneous") for cluster_id in cluster_ids], dtype=object)
+
+
+def main(args):
+
+    timings = {}
+    start = time.perf_counter()
+    GWMs = pd.read_csv(args.GWMs_file, index_col=0)
+    n_genes = len(GWMs)
+    timings["load"] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        condensed_file = Path(tmp_dir) / "condensed_distances.dat"
+        np.memmap(condensed_file, dtype=np.float64, mode="w+", shape=(n_genes * (n_genes - 1) // 2,)).flush()
+
+        # rows near the top have more later genes; blocks of equal row counts are still balanced enough
+        blocks = [(block_start, min(block_start + args.block_size, n_genes)) for block_start in range(0, n_genes, args.block_size)]
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=_attach, initargs=(args.GWMs_file, condensed_file)) as executor:
+            futures = [executor.submit(compute_distance_block, block_start, block_stop, args.metric, not args.unweighted) for block_start, block_stop in blocks]
+            for future in futures:
+                future.result()
+        condensed = np.memmap(condensed_file, dtype=np.float64, mode="r", shape=(n_genes * (n_genes - 1) // 2,))
+        timings["distances"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tree = linkage(condensed, method=args.method)
+        timings["linkage"] = time.perf_counter() - start
+        del condensed
+
+    start = time.perf_counter()
+    cluster_ids = fcluster(tree, t=args.n_clusters, criterion="maxclust")
+    clusters = pd.DataFrame({
+        "Systematic ID": GWMs.index,
+        "revised_cluster": name_clusters(cluster_ids, args.min_cluster_size),
+    })
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    clusters.to_csv(args.output, index=False)
+    timings["cut_and_write"] = time.perf_counter() - start
+
+    print(clusters["revised_cluster"].value_counts().to_string())
+    for stage, seconds in timings.items():
+        print(f"{stage}: {seconds:.2f} s")
+
+    if args.timings_file is not None:
+        row = pd.DataFrame([{
+            "n_genes": n_genes, "metric": args.metric, "method": args.method,
+            "jobs": args.jobs, "block_size": args.block_size, **timings
+        }])
+        row.to_csv(args.timings_file, mode="a", header=not args.timings_file.exists(), index=False)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Hierarchical clustering of the depletion curves in GWMs.csv.")
+    parser.add_argument(
+        "-i",
+        "--GWMs-file",
+        dest="GWMs_file",
+        default=Path("./data/0_raw/GWMs.csv"),
+        type=Path,
+        help="File of gene-level LFCs and p-values",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        required=True,
+        type=Path,
+        help="Output file (Systematic ID,revised_cluster)",
+    )
+    parser.add_argument(
+        "-m",
+        "--metric",
+        dest="metric",
+        default="custom",
+        choices=METRICS,
+        help="Distance between depletion curves",
+    )
+    parser.add_argument(
+        "--unweighted",
+        dest="unweighted",
+        action="store_true",
+        help="Do not weight the timepoints by -log10(pvalue) (euclidean and correlation)",
+    )
+    parser.add_argument(
+        "--method",
+        dest="method",
+        default="average",
+        choices=["average", "complete", "single", "weighted"],
+        help="Linkage method",
+    )
+    parser.add_argument(
+        "-k",
+        "--n-clusters",
+        dest="n_clusters",
+        default=15,
+        type=int,
+        help="Maximum number of clusters cut from the tree",
+    )
+    parser.add_argument(
+        "--min-cluster-size",
+        dest="min_cluster_size",
+        default=20,
+        type=int,
+        help="Smaller clusters are labelled Miscellaneous",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        default=4,
+        type=int,
+        help="Processes computing distance blocks",
+    )
+    parser.add_argument(
+        "-b",
+        "--block-size",
+        dest="block_size",
+        default=512,
+        type=int,
+        help="Genes per distance block",
+    )
+    parser.add_argument(
+        "-t",
+        "--timings-file",
+        dest="timings_file",
+        default=None,
+        type=Path,
+        help="CSV to which the stage timings of this run are appended",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,304 @@
+import argparse
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import streamlit as st
+
+from src.similarity_engine import build_similarity_index, load_similarity_index, top_k_neighbours
+
+# Experimental systems of the PomBase/BioGRID interaction file that are
+# genetic; all the other ones are physical.
+GENETIC_INTERACTION_TYPES = {
+    "Dosage Growth Defect", "Dosage Lethality", "Dosage Rescue", "Negative Genetic", "Positive Genetic",
+    "Phenotypic Enhancement", "Phenotypic Suppression", "Synthetic Growth Defect", "Synthetic Lethality",
+    "Synthetic Rescue", "Synthetic Haploinsufficiency",
+}
+INTERACTION_TYPES = ["physical", "genetic"]
+# Genes drawn in the network view
+MAX_GENES_PER_NETWORK_PLOT = 300
+
+
+class CofitnessNetwork(NamedTuple):
+    """
+    Sparse graph of the genes with the most correlated depletion curves, with the known interactions of the same genes.
+
+    All matrices are symmetric CSR matrices over genes: correlations holds
+    the correlation of every kept edge, physical and genetic are True for
+    the gene pairs with a known interaction of that type.
+    """
+    genes: np.ndarray
+    gene_index: dict
+    correlations: sp.csr_matrix
+    physical: sp.csr_matrix
+    genetic: sp.csr_matrix
+
+
+def read_interactions(physical_interaction_file, interaction_file) -> pd.DataFrame:
+    """
+    Known interactions of pombase-go-physical-interactions.tsv and pombase-interactions-since-v62-2017-01-30.
+
+    Returns:
+        pd.DataFrame: Gene A, Gene B (Gene A < Gene B), Interaction type (physical or genetic), Evidence and Reference.
+    """
+    go_physical = pd.read_csv(physical_interaction_file, sep="\t", header=None, usecols=[0, 1, 2], names=["Gene A", "Gene B", "Reference"])
+    go_physical["Evidence"] = "GO physical interaction"
+    go_physical["Interaction type"] = "physical"
+
+    curated = pd.read_csv(interaction_file, sep="\t", header=None, usecols=[0, 1, 4, 5], names=["Gene A", "Gene B", "Evidence", "Reference"])
+    curated["Interaction type"] = np.where(curated["Evidence"].isin(GENETIC_INTERACTION_TYPES), "genetic", "physical")
+
+    interactions = pd.concat([go_physical, curated], ignore_index=True)
+    interactions = interactions[interactions["Gene A"] != interactions["Gene B"]]
+    gene_a, gene_b = interactions["Gene A"].to_numpy(dtype=object), interactions["Gene B"].to_numpy(dtype=object)
+    swapped = gene_a > gene_b
+    interactions["Gene A"] = np.where(swapped, gene_b, gene_a)
+    interactions["Gene B"] = np.where(swapped, gene_a, gene_b)
+    return interactions.drop_duplicates(ignore_index=True)[["Gene A", "Gene B", "Interaction type", "Evidence", "Reference"]]
+
+
+def _symmetric_matrix(rows, cols, values, n_genes, dtype):
+    return sp.csr_matrix(
+        (np.concatenate([values, values]), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+        shape=(n_genes, n_genes), dtype=dtype
+    )
+
+
+def interaction_matrix(interactions, gene_index, interaction_type) -> sp.csr_matrix:
+    """
+    Symmetric boolean matrix of the gene pairs with a known interaction of interaction_type.
+    """
+    typed = interactions[interactions["Interaction type"] == interaction_type]
+    rows = typed["Gene A"].map(gene_index)
+    cols = typed["Gene B"].map(gene_index)
+    known = rows.notna() & cols.notna()
+    pairs = np.unique(np.stack([rows[known].to_numpy(dtype=np.int64), cols[known].to_numpy(dtype=np.int64)], axis=1), axis=0).reshape(-1, 2)
+    return _symmetric_matrix(pairs[:, 0], pairs[:, 1], np.ones(len(pairs), dtype=bool), len(gene_index), bool)
+
+
+def build_cofitness_network(similarity_index, interactions, k=10, min_correlation=0.9, weighted=True, block_size=2048) -> CofitnessNetwork:
+    """
+    Keep, for every gene, the k genes with the most correlated curves among those above min_correlation.
+
+    The all-vs-all correlations are computed by top_k_neighbours in blocks
+    of block_size x block_size genes, so memory grows with the number of
+    genes times k rather than with its square. An edge is kept when either
+    gene is among the k nearest of the other.
+
+    Args:
+        similarity_index (SimilarityIndex): Curves of all the genes of GWMs.csv.
+        interactions (pd.DataFrame): Known interactions from read_interactions.
+        k (int): Neighbours per gene.
+        min_correlation (float): Lowest (weighted) Pearson correlation of an edge.
+        weighted (bool): Weight the timepoints by -log10(pvalue).
+    """
+    genes = similarity_index.genes
+    n_genes = len(genes)
+    neighbours = top_k_neighbours(similarity_index, genes, k=k, metric="correlation", weighted=weighted, block_size=block_size)
+    neighbours = neighbours[1 - neighbours["distance"] >= min_correlation]
+
+    gene_rows = pd.Index(genes)
+    rows = gene_rows.get_indexer(neighbours["Query"])
+    cols = gene_rows.get_indexer(neighbours["Neighbour"])
+    lower, upper = np.minimum(rows, cols), np.maximum(rows, cols)
+    _, first = np.unique(lower.astype(np.int64) * n_genes + upper, return_index=True)
+    correlations = _symmetric_matrix(lower[first], upper[first], 1 - neighbours["distance"].to_numpy()[first], n_genes, np.float64)
+
+    return CofitnessNetwork(
+        genes=genes,
+        gene_index=similarity_index.gene_index,
+        correlations=correlations,
+        physical=interaction_matrix(interactions, similarity_index.gene_index, "physical"),
+        genetic=interaction_matrix(interactions, similarity_index.gene_index, "genetic"),
+    )
+
+
+@st.cache_resource
+def load_cofitness_network(GWMs_file, physical_interaction_file, interaction_file, k=10, min_correlation=0.9, weighted=True):
+    interactions = read_interactions(physical_interaction_file, interaction_file)
+    network = build_cofitness_network(load_similarity_index(GWMs_file), interactions, k, min_correlation, weighted)
+    return network, interactions
+
+
+def neighbourhood(network, sysIDs, hops=1, max_genes=MAX_GENES_PER_NETWORK_PLOT) -> list:
+    """
+    The genes and their neighbours up to hops edges away, in the order they are reached.
+
+    Every hop reads the rows of the current frontier from the CSR matrix, so
+    the cost only depends on the size of the neighbourhood.
+    """
+    visited = dict.fromkeys(network.gene_index[sysID] for sysID in sysIDs if sysID in network.gene_index)
+    frontier = np.fromiter(visited, dtype=np.int64)
+    indptr, indices = network.correlations.indptr, network.correlations.indices
+    for _ in range(hops):
+        if len(visited) >= max_genes or len(frontier) == 0:
+            break
+        reached = np.concatenate([indices[indptr[row]:indptr[row + 1]] for row in frontier] + [np.empty(0, dtype=indices.dtype)])
+        new_rows = [row for row in dict.fromkeys(reached.tolist()) if row not in visited]
+        visited.update(dict.fromkeys(new_rows))
+        frontier = np.array(new_rows, dtype=np.int64)
+    return network.genes[list(visited)[:max_genes]].tolist()
+
+
+def network_edges(network, sysIDs=None) -> pd.DataFrame:
+    """
+    Edges between the genes (all genes when sysIDs is None), once per pair, with their known interactions.
+
+    Returns:
+        pd.DataFrame: Gene A, Gene B, correlation, physical and genetic.
+    """
+    rows = np.arange(len(network.genes)) if sysIDs is None else np.array([network.gene_index[sysID] for sysID in sysIDs if sysID in network.gene_index], dtype=np.int64)
+    edges = sp.triu(network.correlations[rows][:, rows], k=1).tocoo()
+    physical = network.physical[rows][:, rows]
+    genetic = network.genetic[rows][:, rows]
+    return pd.DataFrame({
+        "Gene A": network.genes[rows[edges.row]],
+        "Gene B": network.genes[rows[edges.col]],
+        "correlation": edges.data,
+        "physical": np.asarray(physical[edges.row, edges.col]).ravel().astype(bool),
+        "genetic": np.asarray(genetic[edges.row, edges.col]).ravel().astype(bool),
+    })
+
+
+def interaction_enrichment(network) -> pd.DataFrame:
+    """
+    Fraction of the co-fitness edges with a known interaction, against the fraction among all gene pairs.
+
+    Returns:
+        pd.DataFrame: One row per interaction type with edges, edges with an interaction, their fraction, the expected fraction and the fold enrichment.
+    """
+    n_pairs = len(network.genes) * (len(network.genes) - 1) / 2
+    n_edges = network.correlations.nnz / 2
+    summary = []
+    for interaction_type in INTERACTION_TYPES:
+        known = getattr(network, interaction_type)
+        edges_with_interaction = network.correlations.multiply(known).nnz / 2
+        expected = known.nnz / 2 / n_pairs if n_pairs > 0 else np.nan
+        observed = edges_with_interaction / n_edges if n_edges > 0 else np.nan
+        summary.append({
+            "Interaction type": interaction_type,
+            "edges": int(n_edges),
+            "edges with interaction": int(edges_with_interaction),
+            "fraction": observed,
+            "expected fraction": expected,
+            "fold enrichment": observed / expected if expected > 0 else np.nan,
+        })
+    return pd.DataFrame(summary)
+
+
+def network_layout(edges, genes, iterations=200, seed=0) -> pd.DataFrame:
+    """
+    Force-directed (Fruchterman-Reingold) positions of the genes, with dense numpy updates.
+
+    Returns:
+        pd.DataFrame: x and y per gene, indexed by gene.
+    """
+    n_genes = len(genes)
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(-1, 1, size=(n_genes, 2))
+    if n_genes < 2:
+        return pd.DataFrame(positions, index=genes, columns=["x", "y"])
+
+    gene_rows = pd.Index(genes)
+    adjacency = np.zeros((n_genes, n_genes))
+    rows, cols = gene_rows.get_indexer(edges["Gene A"]), gene_rows.get_indexer(edges["Gene B"])
+    adjacency[rows, cols] = adjacency[cols, rows] = 1
+
+    optimal_distance = np.sqrt(4 / n_genes)
+    temperature = 0.1
+    for _ in range(iterations):
+        delta = positions[:, None, :] - positions[None, :, :]
+        distance = np.maximum(np.linalg.norm(delta, axis=2), 0.01)
+        force = optimal_distance ** 2 / distance ** 2 - adjacency * distance / optimal_distance
+        displacement = (delta * force[:, :, None]).sum(axis=1)
+        length = np.maximum(np.linalg.norm(displacement, axis=1), 0.01)
+        positions += displacement / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature -= 0.1 / (iterations + 1)
+    return pd.DataFrame(positions, index=genes, columns=["x", "y"])
+
+
+def main(args):
+
+    start = time.perf_counter()
+    similarity_index = build_similarity_index(pd.read_csv(args.GWMs_file, index_col=0))
+    interactions = read_interactions(args.physical_interaction_file, args.interaction_file)
+    network = build_cofitness_network(similarity_index, interactions, args.k, args.min_correlation, not args.unweighted, args.block_size)
+    print(f"{len(network.genes)} genes, {network.correlations.nnz // 2} edges in {time.perf_counter() - start:.2f} s")
+    print(interaction_enrichment(network).to_string(index=False))
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    network_edges(network).to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Sparse co-fitness network of the genes with correlated depletion curves.")
+    parser.add_argument(
+        "-g",
+        "--GWMs",
+        dest="GWMs_file",
+        default=Path("./data/0_raw/GWMs.csv"),
+        type=Path,
+        help="File of gene-level LFCs",
+    )
+    parser.add_argument(
+        "-p",
+        "--physical-interactions",
+        dest="physical_interaction_file",
+        default=Path("./references/pombase_annotation/20241001/pombase-go-physical-interactions.tsv"),
+        type=Path,
+        help="PomBase GO physical interactions",
+    )
+    parser.add_argument(
+        "-i",
+        "--interactions",
+        dest="interaction_file",
+        default=Path("./references/pombase_annotation/20241001/pombase-interactions-since-v62-2017-01-30"),
+        type=Path,
+        help="PomBase curated physical and genetic interactions",
+    )
+    parser.add_argument(
+        "-k",
+        "--neighbours",
+        dest="k",
+        default=10,
+        type=int,
+        help="Neighbours kept per gene",
+    )
+    parser.add_argument(
+        "-c",
+        "--min-correlation",
+        dest="min_correlation",
+        default=0.9,
+        type=float,
+        help="Lowest correlation of an edge",
+    )
+    parser.add_argument(
+        "--unweighted",
+        dest="unweighted",
+        action="store_true",
+        help="Do not weight the timepoints by -log10(pvalue)",
+    )
+    parser.add_argument(
+        "-b",
+        "--block-size",
+        dest="block_size",
+        default=2048,
+        type=int,
+        help="Genes per block of the all-vs-all correlation",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        required=True,
+        type=Path,
+        help="Output CSV of the edges",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
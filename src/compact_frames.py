@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+# Object columns with fewer distinct values than this fraction of their rows become categorical
+MAX_CATEGORY_FRACTION = 0.5
+# Insertion statistics kept in float64: the M of the panels, curve fits, feature
+# summaries and genome browser, and the weights derived from -log10(padj)
+FLOAT64_STATISTICS = ["log2FoldChange", "padj"]
+# Bump when the compact dtypes change, to republish the shared copies built with them
+COMPACT_LAYOUT = 2
+
+
+def categorize_strings(df: pd.DataFrame, columns=None) -> pd.DataFrame:
+    """
+    Store repeated strings (gene IDs, chromosomes, strands, types) as categoricals.
+
+    Args:
+        columns (list): Columns to convert; by default every object or string
+            column with few enough distinct values.
+    """
+    if columns is None:
+        columns = [
+            col for col in df.columns
+            if (df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype))
+            and not isinstance(df[col].dtype, pd.CategoricalDtype)
+            and df[col].nunique(dropna=True) <= MAX_CATEGORY_FRACTION * max(len(df), 1)
+        ]
+    return df.astype({col: "category" for col in columns}) if columns else df
+
+
+def downcast_integers(df: pd.DataFrame) -> pd.DataFrame:
+    integer_columns = df.select_dtypes(include="integer").columns
+    for col in integer_columns:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
+
+
+def compact_insertion_LFCs(insertion_LFCs: pd.DataFrame) -> pd.DataFrame:
+    """
+    float32 LFC statistics (first column level), except FLOAT64_STATISTICS.
+
+    The statistics read downstream keep their exact values: a float32
+    log2FoldChange would show in the panels as e.g. 3.2513630390167236, and
+    -log10 of a float32 p-value close to 1 is off by up to ~1e-6 relative.
+    """
+    statistics = insertion_LFCs.columns.get_level_values(0)
+    return insertion_LFCs.astype({
+        col: np.float64 if statistic in FLOAT64_STATISTICS else np.float32
+        for col, statistic in zip(insertion_LFCs.columns, statistics)
+    })
+
+
+def compact_insertion_annotations(insertion_annotations: pd.DataFrame) -> pd.DataFrame:
+    """
+    Categorical string columns and the smallest integer types; float columns are kept as they are.
+    """
+    return downcast_integers(categorize_strings(insertion_annotations.copy()))
+
+
+def compact_gene_level_LFCs(gene_level_LFCs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Categorical Name and Essentiality. The values stay float64: the table is
+    small and its p-values give the gene-level weights.
+    """
+    return categorize_strings(gene_level_LFCs, [col for col in ["Name", "Essentiality"] if col in gene_level_LFCs.columns])
+
+
+def compact_depletion_curves(LFCs: pd.DataFrame, timepoints: list) -> pd.DataFrame:
+    """
+    Categorical genes and integer-coded (ordered categorical) timepoints. The
+    values stay float64: the frame is plotted as is, and float32 p-values and
+    Confidence would show in the chart tooltips as e.g. 0.0123000001907.
+    """
+    LFCs = LFCs.copy()
+    LFCs["Gene"] = LFCs["Gene"].astype("category")
+    LFCs["Timepoint"] = pd.Categorical(LFCs["Timepoint"], categories=timepoints, ordered=True)
+    return LFCs
+
+
+def memory_footprint(frames: dict) -> pd.DataFrame:
+    """
+    Rows, columns and deep memory usage (MB, index included) of named frames.
+    """
+    rows = []
+    for name, frame in frames.items():
+        usage = frame.memory_usage(deep=True, index=True)
+        rows.append({
+            "Frame": name,
+            "Rows": len(frame),
+            "Columns": frame.shape[1] if frame.ndim > 1 else 1,
+            "MB": round((usage.sum() if frame.ndim > 1 else usage) / 1024 ** 2, 2),
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,235 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from src.enrichment_engine import fdr_bh
+from src.similarity_engine import METRICS, build_similarity_index, pairwise_distances
+
+# Random gene sets of one size gathered at once, bounded by the number of
+# distances they read (n_sets x size x size)
+MAX_GATHERED_DISTANCES = 20_000_000
+
+# Gene-by-gene distances of the worker processes
+_distances = None
+
+
+def read_complexes(complex_file) -> pd.DataFrame:
+    """
+    Subunits of every GO complex of Complex_annotation.tsv, once per complex and gene.
+
+    Returns:
+        pd.DataFrame: acc, GO_name, systematic_id and symbol.
+    """
+    complexes = pd.read_csv(complex_file, sep="\t", header=0, usecols=["acc", "GO_name", "systematic_id", "symbol"])
+    return complexes.dropna(subset=["acc", "systematic_id"]).drop_duplicates(["acc", "systematic_id"], ignore_index=True)
+
+
+def distance_matrix(similarity_index, metric="custom", weighted=True, block_size=2048) -> np.ndarray:
+    """
+    Distances between the curves of all genes, computed in blocks of rows, as float32 with a zero diagonal.
+    """
+    n_genes = len(similarity_index.genes)
+    all_rows = np.arange(n_genes)
+    distances = np.empty((n_genes, n_genes), dtype=np.float32)
+    for start in range(0, n_genes, block_size):
+        rows = all_rows[start:start + block_size]
+        distances[rows] = pairwise_distances(similarity_index, rows, all_rows, metric, weighted)
+    np.fill_diagonal(distances, 0)
+    return distances
+
+
+def random_gene_sets(rng, n_genes, size, n_sets) -> np.ndarray:
+    """
+    n_sets sets of size distinct gene rows, drawn as one integer array.
+
+    Repeated genes within a set are redrawn until none are left, which is
+    rejection sampling of every position and keeps the sets uniform.
+    """
+    sets = rng.integers(0, n_genes, size=(n_sets, size))
+    while True:
+        sets.sort(axis=1)
+        repeated = np.zeros_like(sets, dtype=bool)
+        repeated[:, 1:] = sets[:, 1:] == sets[:, :-1]
+        if not repeated.any():
+            return sets
+        sets[repeated] = rng.integers(0, n_genes, size=repeated.sum())
+
+
+def mean_within_distances(distances, gene_sets) -> np.ndarray:
+    """
+    Mean distance over the pairs of genes of every set (rows of gene_sets).
+    """
+    size = gene_sets.shape[1]
+    within = distances[gene_sets[:, :, None], gene_sets[:, None, :]]
+    return within.sum(axis=(1, 2), dtype=np.float64) / (size * (size - 1))
+
+
+def null_mean_distances(size, n_permutations, seed, distances=None) -> np.ndarray:
+    """
+    Mean within-set distances of n_permutations random gene sets of the given size.
+
+    Uses the distances of the worker process when distances is None.
+    """
+    distances = _distances if distances is None else distances
+    rng = np.random.default_rng(seed)
+    batch_size = max(1, MAX_GATHERED_DISTANCES // (size * size))
+    return np.concatenate([
+        mean_within_distances(distances, random_gene_sets(rng, len(distances), size, min(batch_size, n_permutations - start)))
+        for start in range(0, n_permutations, batch_size)
+    ])
+
+
+def _attach(GWMs_file, metric, weighted):
+    global _distances
+    _distances = distance_matrix(build_similarity_index(pd.read_csv(GWMs_file, index_col=0)), metric, weighted)
+
+
+def score_complexes(GWMs_file, complex_file, metric="custom", weighted=True, n_permutations=10000, min_size=2, seed=0, jobs=1) -> pd.DataFrame:
+    """
+    Score every complex by the mean distance between the depletion curves of its subunits.
+
+    Only subunits in GWMs.csv count. The null distribution of a complex of
+    s subunits is the mean distance within n_permutations random sets of s
+    genes of GWMs.csv; it is drawn once per size and shared by all the
+    complexes of that size. The sizes are spread over jobs processes, each
+    holding its own distance matrix. The empirical p-value is the fraction
+    of random sets at least as close as the complex, with one pseudocount.
+
+    Returns:
+        pd.DataFrame: One row per complex, sorted by p-value then z-score.
+    """
+    similarity_index = build_similarity_index(pd.read_csv(GWMs_file, index_col=0))
+    distances = distance_matrix(similarity_index, metric, weighted)
+
+    complexes = read_complexes(complex_file)
+    complexes["row"] = complexes["systematic_id"].map(similarity_index.gene_index)
+    subunits = complexes.groupby("acc", sort=False).agg(
+        GO_name=("GO_name", "first"),
+        annotated_subunits=("systematic_id", "size"),
+    )
+    members = complexes.dropna(subset=["row"]).groupby("acc", sort=False).agg(
+        subunits=("row", "size"),
+        rows=("row", list),
+        genes=("symbol", lambda symbols: ", ".join(symbols.fillna("").astype(str))),
+    )
+    scored = subunits.join(members, how="inner")
+    scored = scored[scored["subunits"] >= min_size]
+    scored["mean_distance"] = [mean_within_distances(distances, np.array(rows, dtype=np.int64)[None, :])[0] for rows in scored["rows"]]
+
+    sizes = sorted(scored["subunits"].unique())
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_attach, initargs=(GWMs_file, metric, weighted)) as executor:
+            nulls = dict(zip(sizes, executor.map(null_mean_distances, sizes, [n_permutations] * len(sizes), seeds)))
+    else:
+        nulls = {size: null_mean_distances(size, n_permutations, size_seed, distances) for size, size_seed in zip(sizes, seeds)}
+
+    scored["null_mean"] = scored["subunits"].map({size: null.mean() for size, null in nulls.items()})
+    scored["null_std"] = scored["subunits"].map({size: null.std() for size, null in nulls.items()})
+    scored["z_score"] = (scored["mean_distance"] - scored["null_mean"]) / scored["null_std"]
+    scored["pvalue"] = [
+        (1 + np.count_nonzero(nulls[size] <= distance)) / (1 + n_permutations)
+        for size, distance in zip(scored["subunits"], scored["mean_distance"])
+    ]
+    scored["FDR"] = fdr_bh(scored["pvalue"].to_numpy())
+
+    return scored.drop(columns="rows").rename_axis("GO term").reset_index().sort_values(["pvalue", "z_score"], ignore_index=True)
+
+
+@st.cache_data
+def load_complex_coherence(GWMs_file, complex_file, metric="custom", weighted=True, n_permutations=10000, seed=0, jobs=1):
+    return score_complexes(GWMs_file, complex_file, metric, weighted, n_permutations, seed=seed, jobs=jobs)
+
+
+def main(args):
+
+    start = time.perf_counter()
+    scored = score_complexes(args.GWMs_file, args.complex_file, args.metric, not args.unweighted, args.n_permutations, args.min_size, args.seed, args.jobs)
+    print(f"{len(scored)} complexes scored with {args.n_permutations} permutations in {time.perf_counter() - start:.2f} s")
+    print(scored.head(20).to_string(index=False))
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    scored.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Score the coherence of the depletion curves of the subunits of protein complexes.")
+    parser.add_argument(
+        "-g",
+        "--GWMs",
+        dest="GWMs_file",
+        default=Path("./data/0_raw/GWMs.csv"),
+        type=Path,
+        help="File of gene-level LFCs",
+    )
+    parser.add_argument(
+        "-c",
+        "--complexes",
+        dest="complex_file",
+        default=Path("./references/pombase_annotation/20241001/Complex_annotation.tsv"),
+        type=Path,
+        help="PomBase complex annotation",
+    )
+    parser.add_argument(
+        "-m",
+        "--metric",
+        dest="metric",
+        default="custom",
+        choices=METRICS,
+        help="Distance between depletion curves",
+    )
+    parser.add_argument(
+        "--unweighted",
+        dest="unweighted",
+        action="store_true",
+        help="Do not weight the timepoints by -log10(pvalue)",
+    )
+    parser.add_argument(
+        "-n",
+        "--permutations",
+        dest="n_permutations",
+        default=10000,
+        type=int,
+        help="Random gene sets per complex size",
+    )
+    parser.add_argument(
+        "--min-size",
+        dest="min_size",
+        default=2,
+        type=int,
+        help="Fewest subunits in GWMs.csv of a scored complex",
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        dest="seed",
+        default=0,
+        type=int,
+        help="Seed of the random gene sets",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        default=1,
+        type=int,
+        help="Number of processes drawing random gene sets",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        required=True,
+        type=Path,
+        help="Output CSV of the complex scores",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,240 @@
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from src.compact_frames import COMPACT_LAYOUT
+from src.shared_dataset import SHARED_DATASET_DIR, shared_frames
+
+# Curve models of M versus G, all linear in their parameters
+CURVE_MODELS = {
+    "linear": ["intercept", "DR"],
+    "proportional": ["DR"],
+    "quadratic": ["intercept", "DR", "curvature"],
+}
+# Weights below this count as this, like the Confidence of plot_insertion, so
+# that curves without any significant timepoint still get a (flat) fit
+MIN_WEIGHT = 0.1
+
+
+def design_matrix(G, model="linear"):
+    """
+    Returns:
+        np.ndarray: len(G) x len(CURVE_MODELS[model]) columns 1, G and G**2 as used by the model.
+    """
+    G = np.asarray(G, dtype=np.float64)
+    columns = {
+        "linear": [np.ones_like(G), G],
+        "proportional": [G],
+        "quadratic": [np.ones_like(G), G, G ** 2],
+    }
+    if model not in columns:
+        raise ValueError(f"`model` should be one of {list(CURVE_MODELS)}")
+    return np.stack(columns[model], axis=1)
+
+
+def padj_to_weights(padj):
+    """
+    -log10(padj) with padj clipped to [1e-10, 1], as the weights of extract_DIT_HAP_data.
+    """
+    padj = np.asarray(padj, dtype=np.float64)
+    return -np.log10(np.where(padj <= 1e-10, 1e-10, np.where(padj > 1 - 1e-10, 1, padj)))
+
+
+def fit_curves(M, weights, G, model="linear", min_weight=MIN_WEIGHT):
+    """
+    Weighted least-squares fits of M versus G for every row at once.
+
+    Every row is one curve (an insertion or a gene) over the timepoints in
+    the columns. The normal equations of all rows are built with einsum and
+    solved as one batch of small p x p systems. Timepoints with a missing M
+    or weight are left out of their row; rows with fewer timepoints than
+    parameters get NaN.
+
+    Args:
+        M (np.ndarray): n x T M values.
+        weights (np.ndarray): n x T weights, e.g. padj_to_weights(padj).
+        G (np.ndarray): T generations.
+        model (str): One of CURVE_MODELS.
+        min_weight (float): Lower bound of the weights.
+    Returns:
+        pd.DataFrame: The parameters of the model, DL (fitted M at the last G), r2 (weighted) and n_points per row.
+    """
+    X = design_matrix(G, model)
+    M = np.asarray(M, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    valid = ~np.isnan(M) & ~np.isnan(weights)
+    W = np.where(valid, np.maximum(weights, min_weight), 0)
+    Y = np.where(valid, M, 0)
+
+    n_points = valid.sum(axis=1)
+    fitted = n_points >= X.shape[1]
+    XtWX = np.einsum("tp,nt,tq->npq", X, W, X)
+    XtWy = np.einsum("tp,nt,nt->np", X, W, Y)
+    # rows without enough points get an identity system and NaN parameters afterwards
+    XtWX[~fitted] = np.eye(X.shape[1])
+    params = np.linalg.solve(XtWX, XtWy[..., None])[..., 0]
+    params[~fitted] = np.nan
+
+    predicted = params @ X.T
+    sum_w = W.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weighted_mean = (W * Y).sum(axis=1) / sum_w
+        ss_res = (W * (Y - predicted) ** 2).sum(axis=1)
+        ss_tot = (W * (Y - weighted_mean[:, None]) ** 2).sum(axis=1)
+        r2 = np.where(ss_tot > 0, 1 - ss_res / ss_tot, np.nan)
+
+    fits = pd.DataFrame(params, columns=CURVE_MODELS[model])
+    fits["DL"] = predicted[:, -1]
+    fits["r2"] = np.where(fitted, r2, np.nan)
+    fits["n_points"] = n_points
+    return fits
+
+
+def fit_insertion_curves(insertion_LFCs, timepoints, model="linear", min_weight=MIN_WEIGHT):
+    """
+    Fits of every insertion, indexed like insertion_LFCs (the M and padj of its timepoints).
+    """
+    tps = [tp for tp in timepoints.index if tp in insertion_LFCs["log2FoldChange"].columns]
+    fits = fit_curves(
+        insertion_LFCs["log2FoldChange"][tps].to_numpy(dtype=np.float64),
+        padj_to_weights(insertion_LFCs["padj"][tps].to_numpy(dtype=np.float64)),
+        timepoints.loc[tps].to_numpy(dtype=np.float64),
+        model, min_weight,
+    )
+    fits.index = insertion_LFCs.index
+    return fits
+
+
+def fit_gene_curves(gene_level_LFCs, timepoints, model="linear", min_weight=MIN_WEIGHT):
+    """
+    Fits of every gene of GWMs.csv (YES0..YES4 and their _pvalue columns), indexed by Systematic ID.
+    """
+    tps = [tp for tp in timepoints.index if tp in gene_level_LFCs.columns and f"{tp}_pvalue" in gene_level_LFCs.columns]
+    fits = fit_curves(
+        gene_level_LFCs[tps].to_numpy(dtype=np.float64),
+        padj_to_weights(gene_level_LFCs[[f"{tp}_pvalue" for tp in tps]].to_numpy(dtype=np.float64)),
+        timepoints.loc[tps].to_numpy(dtype=np.float64),
+        model, min_weight,
+    )
+    fits.index = gene_level_LFCs.index
+    return fits
+
+
+@st.cache_resource
+def load_curve_fits(_insertion_LFCs, _gene_level_LFCs, _timepoints, source_files, model="linear", min_weight=MIN_WEIGHT, curve_fit_dir=SHARED_DATASET_DIR):
+    """
+    Insertion and gene fits, computed once per version of the source files and memory-mapped from disk afterwards.
+
+    Args:
+        source_files (tuple): Files the frames were loaded from, which identify the fits on disk.
+    Returns:
+        tuple: (insertion_fits, gene_fits)
+    """
+    frames = shared_frames(
+        f"curve_fits_{model}", source_files,
+        lambda: {
+            "insertion_fits": fit_insertion_curves(_insertion_LFCs, _timepoints, model, min_weight),
+            "gene_fits": fit_gene_curves(_gene_level_LFCs, _timepoints, model, min_weight),
+        },
+        # fitted from the loaded frames, so republished with them
+        curve_fit_dir, min_weight=min_weight, layout=COMPACT_LAYOUT,
+    )
+    return frames["insertion_fits"], frames["gene_fits"]
+
+
+def main(args):
+
+    from src.load_basic_data import read_data
+
+    start = time.perf_counter()
+    insertion_LFCs, gene_level_LFCs, _, timepoints = read_data(
+        args.insertion_LFCs_file, args.gene_level_LFCs_file, args.insertion_annotations_file, args.timepoint_file, args.insertion_store_dir
+    )
+    print(f"load: {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    insertion_fits = fit_insertion_curves(insertion_LFCs, timepoints, args.model, args.min_weight)
+    print(f"{len(insertion_fits)} insertions fitted in {time.perf_counter() - start:.2f} s")
+    start = time.perf_counter()
+    gene_fits = fit_gene_curves(gene_level_LFCs, timepoints, args.model, args.min_weight)
+    print(f"{len(gene_fits)} genes fitted in {time.perf_counter() - start:.2f} s")
+
+    if args.output is not None:
+        args.output.mkdir(parents=True, exist_ok=True)
+        insertion_fits.to_csv(args.output / f"insertion_curve_fits_{args.model}.csv")
+        gene_fits.to_csv(args.output / f"gene_curve_fits_{args.model}.csv")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Weighted least-squares fits of M versus G for every insertion and gene.")
+    parser.add_argument(
+        "-l",
+        "--insertion-LFCs",
+        dest="insertion_LFCs_file",
+        default=Path("./data/0_raw/insertions_LFC.csv"),
+        type=Path,
+        help="File of insertion LFCs",
+    )
+    parser.add_argument(
+        "-g",
+        "--gene-level-LFCs",
+        dest="gene_level_LFCs_file",
+        default=Path("./data/0_raw/GWMs.csv"),
+        type=Path,
+        help="File of gene-level LFCs",
+    )
+    parser.add_argument(
+        "-a",
+        "--insertion-annotations",
+        dest="insertion_annotations_file",
+        default=Path("./data/0_raw/DIT_HAP_20241001.annotated.csv"),
+        type=Path,
+        help="File of insertion annotations",
+    )
+    parser.add_argument(
+        "-t",
+        "--timepoints",
+        dest="timepoint_file",
+        default=Path("./data/0_raw/samples_timepoints.csv"),
+        type=Path,
+        help="File of sample timepoints",
+    )
+    parser.add_argument(
+        "--store",
+        dest="insertion_store_dir",
+        default=Path("./data/1_insertion_store"),
+        type=Path,
+        help="Columnar insertion store, used when it exists",
+    )
+    parser.add_argument(
+        "-m",
+        "--model",
+        dest="model",
+        default="linear",
+        choices=list(CURVE_MODELS),
+        help="Curve model of M versus G",
+    )
+    parser.add_argument(
+        "--min-weight",
+        dest="min_weight",
+        default=MIN_WEIGHT,
+        type=float,
+        help="Lower bound of the -log10(padj) weights",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        default=None,
+        type=Path,
+        help="Output folder of the insertion and gene fits as CSV",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
@@ -3,8 +3,22 @@ import numpy as np
 import streamlit as st
 import altair as alt
 
-@st.cache_data
-def get_depletion_curve_data(GWMs_file, timepoints_file):
+from src.compact_frames import COMPACT_LAYOUT, compact_depletion_curves
+from src.shared_dataset import shared_frames
+
+@st.cache_resource
+def get_depletion_curve_data(GWMs_file, timepoints_file, compact=True, shared_dataset_dir=None):
+    # with shared_dataset_dir, every process memory-maps one published copy (see src.shared_dataset)
+    if shared_dataset_dir is not None:
+        return shared_frames(
+            "depletion_curves", [GWMs_file, timepoints_file],
+            lambda: {"LFCs": read_depletion_curve_data(GWMs_file, timepoints_file, compact)},
+            shared_dataset_dir, compact=compact, layout=COMPACT_LAYOUT,
+        )["LFCs"]
+    return read_depletion_curve_data(GWMs_file, timepoints_file, compact)
+
+
+def read_depletion_curve_data(GWMs_file, timepoints_file, compact):
     timepoints = pd.read_csv(timepoints_file, index_col=0)
     Gs = timepoints.mean(axis=1).rename("G").round(3)
 
@@ -17,9 +31,59 @@ def get_depletion_curve_data(GWMs_file, timepoints_file):
     LFCs = LFCs.merge(Gs, left_on="Timepoint", right_index=True, how="left")
     LFCs["Confidence"] = -np.log10(LFCs["pvalue"].apply(lambda x: 1e-10 if x <= 1e-10 else 1 if x > 1-1e-10 else x))
 
+    # shared by all sessions of the server process, do not modify in place
+    if compact:
+        LFCs = compact_depletion_curves(LFCs, timepoints.index.tolist())
+
     return LFCs
 
-def plot_depletion_curve(sub_LFCs):
+# Gene sets larger than this are drawn as summaries instead of one curve per gene
+MAX_GENES_PER_CURVE_PLOT = 200
+LFC_DOMAIN = (-3, 10)
+
+def summarize_depletion_curves(sub_LFCs, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), LFC_bin_width=0.25):
+    """
+    Per-generation LFC quantiles and 2D (generation, LFC) counts of a set of depletion curves.
+
+    Returns:
+        tuple: (ribbons, density). ribbons has one row per generation G with
+        columns q5, q25, ... for the quantiles; density has one row per
+        non-empty bin with G, LFC_start, LFC_end and count.
+    """
+    G, G_codes = np.unique(sub_LFCs["G"].to_numpy(dtype=float), return_inverse=True)
+    LFC = sub_LFCs["LFC"].to_numpy(dtype=float)
+    valid = ~np.isnan(LFC)
+
+    ribbons = pd.DataFrame({"G": G})
+    for quantile in quantiles:
+        ribbons[f"q{round(quantile * 100)}"] = [
+            np.quantile(LFC[valid & (G_codes == code)], quantile) if (valid & (G_codes == code)).any() else np.nan
+            for code in range(len(G))
+        ]
+
+    LFC_edges = np.arange(LFC_DOMAIN[0], LFC_DOMAIN[1] + LFC_bin_width, LFC_bin_width)
+    counts, _, _ = np.histogram2d(
+        G_codes[valid], np.clip(LFC[valid], LFC_DOMAIN[0], LFC_DOMAIN[1] - 1e-9),
+        bins=[np.arange(len(G) + 1) - 0.5, LFC_edges]
+    )
+    G_idx, LFC_idx = np.nonzero(counts)
+    density = pd.DataFrame({
+        "G": G[G_idx],
+        "LFC_start": LFC_edges[LFC_idx],
+        "LFC_end": LFC_edges[LFC_idx + 1],
+        "count": counts[G_idx, LFC_idx].astype(int),
+    })
+
+    return ribbons, density
+
+def plot_depletion_curve(sub_LFCs, highlight_genes=None, max_genes=MAX_GENES_PER_CURVE_PLOT):
+    """
+    Depletion curves of the genes in sub_LFCs. Above max_genes genes, only
+    the quantile ribbons and density bins of summarize_depletion_curves are
+    embedded in the chart, with the curves of highlight_genes on top.
+    """
+    if sub_LFCs["Gene"].nunique() > max_genes:
+        return plot_depletion_curve_summary(sub_LFCs, highlight_genes)
 
     gene_selector = alt.selection_multi(fields=["Gene"], bind="legend")
 
@@ -47,4 +111,59 @@ def plot_depletion_curve(sub_LFCs):
         height=800
     ).add_params(gene_selector)
 
-    return line_point_plot
\ No newline at end of file
+    return line_point_plot
+
+def plot_depletion_curve_summary(sub_LFCs, highlight_genes=None):
+
+    ribbons, density = summarize_depletion_curves(sub_LFCs)
+    # half the smallest gap between generations, so the density columns do not overlap
+    half_width = np.diff(ribbons["G"]).min() / 4 if len(ribbons) > 1 else 0.5
+    density["G_start"] = density["G"] - half_width
+    density["G_end"] = density["G"] + half_width
+
+    x_scale = alt.Scale(domain=(ribbons["G"].min() - half_width, ribbons["G"].max() + half_width))
+    y_scale = alt.Scale(domain=LFC_DOMAIN)
+
+    density_plot = alt.Chart(density).mark_rect(opacity=0.8).encode(
+        x=alt.X("G_start:Q", title="Generations", scale=x_scale),
+        x2="G_end:Q",
+        y=alt.Y("LFC_start:Q", title="Log2 Fold Change", scale=y_scale),
+        y2="LFC_end:Q",
+        color=alt.Color("count:Q", title="Genes", scale=alt.Scale(type="log", scheme="greys")),
+        tooltip=["G", "LFC_start", "LFC_end", "count"],
+    )
+    base = alt.Chart(ribbons)
+    outer_ribbon = base.mark_area(opacity=0.15, color="steelblue").encode(
+        x=alt.X("G:Q", scale=x_scale), y=alt.Y("q5:Q", scale=y_scale), y2="q95:Q",
+        tooltip=ribbons.columns.tolist(),
+    )
+    inner_ribbon = base.mark_area(opacity=0.3, color="steelblue").encode(
+        x=alt.X("G:Q", scale=x_scale), y=alt.Y("q25:Q", scale=y_scale), y2="q75:Q",
+    )
+    median_line = base.mark_line(color="steelblue", size=3).encode(
+        x=alt.X("G:Q", scale=x_scale), y=alt.Y("q50:Q", scale=y_scale),
+    )
+    summary_plot = density_plot + outer_ribbon + inner_ribbon + median_line
+
+    highlighted = sub_LFCs[sub_LFCs["Gene"].isin(highlight_genes or [])]
+    if not highlighted.empty:
+        highlight_base = alt.Chart(highlighted)
+        summary_plot += highlight_base.mark_line(size=3).encode(
+            x=alt.X("G:Q", scale=x_scale),
+            y=alt.Y("LFC:Q", scale=y_scale),
+            color=alt.Color("Gene:N", title="Gene", legend=alt.Legend(columns=10, symbolLimit=100, orient="bottom")),
+            tooltip=["Gene", "G", "LFC", "pvalue"],
+        )
+        summary_plot += highlight_base.mark_circle().encode(
+            x=alt.X("G:Q", scale=x_scale),
+            y=alt.Y("LFC:Q", scale=y_scale),
+            color=alt.Color("Gene:N"),
+            size=alt.Size("Confidence:Q", title="-log10(pvalue)", legend=alt.Legend(orient="top"), scale=alt.Scale(type='sqrt')),
+            tooltip=["Gene", "G", "LFC", "pvalue"],
+        )
+
+    return summary_plot.properties(
+        title=f"{sub_LFCs['Gene'].nunique()} genes: 5-95% and 25-75% quantiles, median and density",
+        width=600,
+        height=800
+    ).resolve_scale(color="independent")
@@ -3,10 +3,9 @@ import numpy as np
 import pandas as pd
 import altair as alt
 import streamlit as st
-import requests
 import io
-from requests.exceptions import ConnectionError, RequestException
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from goatools.obo_parser import GODag
 from goatools.rpt.rpt_lev_depth import RptLevDepth
@@ -20,9 +19,17 @@ from goatools.godag_plot import plot_gos, plot_results, plot_goid2goobj
 from goatools.godag.go_tasks import get_go2parents
 
 from src.utils_functions import *
+from src.enrichment_engine import PROPAGATION_RELATIONSHIPS, compile_ns2assoc, run_enrichment
+from src.result_cache import ResultCache, make_cache_key
+from src.ontology_snapshot import SnapshotDAG, load_or_compile_snapshot
+from src.string_client import STRING_BASE_URL, StringClient
 
 @st.cache_resource
-def load_GO_data(obo_file, gaf_file):
+def load_GO_data(obo_file, gaf_file, snapshot_dir=None):
+
+    # A binary snapshot keyed by the hash of both files skips the OBO and GAF parsing
+    if snapshot_dir is not None:
+        return load_or_compile_snapshot(obo_file, gaf_file, snapshot_dir)
 
     godag = GODag(str(obo_file), optional_attrs=["defn", "relationship"])
     objanno = GafReader(gaf_file, godag=godag)
@@ -30,12 +37,33 @@ def load_GO_data(obo_file, gaf_file):
 
     return godag, ns2assoc
 
-def GOEA(query_genes, bg_genes, godag, ns2assoc):
+@st.cache_resource
+def load_enrichment_engine(obo_file, gaf_file, snapshot_dir=None):
+    """
+    Compile the associations of an ontology once per process into sparse gene x term matrices.
+    """
+    godag, ns2assoc = load_GO_data(obo_file, gaf_file, snapshot_dir)
+    return compile_ns2assoc(godag, ns2assoc)
+
+def GOEA(query_genes, bg_genes, godag, ns2assoc, engine=None, propagate_counts=True):
+    # goatools needs a GODag; a snapshot (load_GO_data with snapshot_dir) is only read by the compiled engine
+    if engine is None and isinstance(godag, SnapshotDAG):
+        engine = compile_ns2assoc(godag, ns2assoc)
+
+    # The compiled engine gives the same results without rebuilding a goatools study on every call
+    if engine is not None:
+        return run_enrichment(query_genes, bg_genes, engine, alpha=0.05, propagate_counts=propagate_counts)
+
+    if propagate_counts:
+        # goatools propagates the associations in place, which would alter the cached ns2assoc
+        ns2assoc = {ns: {gene: set(goids) for gene, goids in assoc.items()} for ns, assoc in ns2assoc.items()}
+
     goeaobj = GOEnrichmentStudyNS(
         bg_genes,  # List of mouse protein-coding genes
         ns2assoc,  # geneid/GO associations
         godag,  # Ontologies
-        propagate_counts=False,
+        propagate_counts=propagate_counts,
+        relationships=PROPAGATION_RELATIONSHIPS,
         alpha=0.05,  # default significance cut-off
         methods=["fdr_bh"],
     )  # defult multipletest correction method
@@ -51,6 +79,26 @@ def GOEA(query_genes, bg_genes, godag, ns2assoc):
     return goea_results_sig
 
 
+@st.cache_resource
+def load_result_cache(cache_dir, max_size_MB=256):
+    return ResultCache(cache_dir, max_size_bytes=max_size_MB * 1024 ** 2)
+
+def cached_GOEA(query_genes, bg_genes, godag, ns2assoc, result_cache, ontology_files, engine=None, propagate_counts=True):
+    """
+    GOEA with a persistent result cache keyed by the query, the background, the ontology files and the method parameters.
+    """
+    params = {
+        "propagate_counts": propagate_counts,
+        "relationships": sorted(PROPAGATION_RELATIONSHIPS) if propagate_counts else [],
+        "alpha": 0.05,
+        "method": "fdr_bh",
+    }
+    key = make_cache_key("GOEA", query_genes, bg_genes, ontology_files, params)
+    return result_cache.get_or_compute(
+        key, lambda: GOEA(query_genes, bg_genes, godag, ns2assoc, engine=engine, propagate_counts=propagate_counts)
+    )
+
+
 def format_GOEA_results(goea_results_sig, gene_id_to_name=None):
     enriched_variables = [
         'GO',
@@ -135,73 +183,45 @@ def plot_GOEA_results(enrichment_results):
 
     return alt.hconcat(*charts)
 
-def parse_string_enrichment(query_genes, bg_genes, max_retries=3, retry_delay=5):
-
-    output_format = "tsv"
-    # Try to get the current STRING version
-    for attempt in range(max_retries):
-        try:
-            string_version = requests.post(f"https://string-db.org/api/{output_format}/version").text
-            string_api_url = "https" + str(string_version.split("https")[1].strip()) + "/api"
-            break
-        except (ConnectionError, RequestException) as e:
-            if attempt == max_retries - 1:
-                st.error(f"Failed to connect to STRING database after {max_retries} attempts. Error: {str(e)}")
-                return pd.DataFrame()  # Return an empty DataFrame
-            time.sleep(retry_delay)
-
-    method = "get_string_ids"
-    params = {
-        "identifiers" : "\r".join(bg_genes),
-        "species" : 4896,
-        "limit" : 1,
-        "echo_query" : 1,
-        "caller_identity" : "DIT_HAP_visualization"
-    }
-    
-    # Try to get STRING IDs
-    for attempt in range(max_retries):
-        try:
-            request_url = "/".join([string_api_url, output_format, method])
-            results = requests.post(request_url, data=params)
-            results.raise_for_status()  # Raise an exception for bad status codes
-            break
-        except (ConnectionError, RequestException) as e:
-            if attempt == max_retries - 1:
-                st.error(f"Failed to get STRING IDs after {max_retries} attempts. Error: {str(e)}")
-                return pd.DataFrame()  # Return an empty DataFrame
-            time.sleep(retry_delay)
-
-    bg_string_ids = []
-    for line in results.text.strip().split("\n")[1:]:
-        l = line.split("\t")
-        string_identifier = l[2]
-        bg_string_ids.append(string_identifier)
-
-    method = "enrichment"
-    params = {
-        "identifiers" : "%0d".join(query_genes),
-        "background_string_identifiers" : "%0d".join(bg_string_ids),
-        "species" : 4896,
-        "caller_identity" : "DIT_HAP_visualization",
-    }
-    
-    # Try to get enrichment results
-    for attempt in range(max_retries):
-        try:
-            request_url = "/".join([string_api_url, output_format, method])
-            response = requests.post(request_url, data=params)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            break
-        except (ConnectionError, RequestException) as e:
-            if attempt == max_retries - 1:
-                st.error(f"Failed to get enrichment results after {max_retries} attempts. Error: {str(e)}")
-                return pd.DataFrame()  # Return an empty DataFrame
-            time.sleep(retry_delay)
-
-    data = response.text
-    dataframe = pd.read_csv(io.StringIO(data), sep="\t")
-    return dataframe
+def _timed(function):
+    start = time.perf_counter()
+    try:
+        return function(), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+def run_concurrently(analyses, max_workers=None):
+    """
+    Run independent analyses in a thread pool and yield each one as soon as it finishes.
+
+    The functions run outside the script thread and must not call streamlit;
+    load the cached ontologies and clients before, and display the results
+    from the loop over this generator.
+
+    Args:
+        analyses (dict): Name to function without arguments.
+        max_workers (int): Threads, one per analysis by default.
+    Yields:
+        tuple: (name, result, exception, seconds) in order of completion; result is None when the function raised.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(analyses), thread_name_prefix="enrichment")
+    try:
+        futures = {executor.submit(_timed, function): name for name, function in analyses.items()}
+        for future in as_completed(futures):
+            yield (futures[future], *future.result())
+    finally:
+        # a caller leaving the loop early (e.g. a rerun) does not wait for the analyses still running
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@st.cache_resource
+def load_string_client(_result_cache, base_url=STRING_BASE_URL):
+    """
+    One pooled STRING client per process, caching its responses in the result cache.
+    """
+    return StringClient(base_url=base_url, cache=_result_cache)
+
+def display_string_error(container, string_client, error):
+    container.error(f"Failed to get STRING enrichment results from {string_client.base_url}. Error: {str(error)}")
 
 def display_string_enrichment(container, dataframe):
     if dataframe.empty:
@@ -0,0 +1,412 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from src.ontology_snapshot import SnapshotDAG
+
+# Same namespace abbreviations as goatools' GOEnrichmentRecord
+NAMESPACE2NS = {
+    "biological_process": "BP",
+    "molecular_function": "MF",
+    "cellular_component": "CC",
+}
+
+# Relationships followed, besides is_a, when annotations are propagated to
+# ancestor terms (the true path rule)
+PROPAGATION_RELATIONSHIPS = frozenset({"part_of"})
+
+
+class EnrichmentRecord(NamedTuple):
+    """
+    One enrichment result, with the attributes of goatools' GOEnrichmentRecord read by format_GOEA_results.
+    """
+    GO: str
+    NS: str
+    enrichment: str
+    name: str
+    p_fdr_bh: float
+    p_uncorrected: float
+    study_count: int
+    pop_count: int
+    study_n: int
+    pop_n: int
+    ratio_in_study: tuple
+    ratio_in_pop: tuple
+    study_items: set
+    pop_items: set
+
+
+class NamespaceMatrix(NamedTuple):
+    """
+    Gene x term incidence matrices of one namespace of ns2assoc.
+
+    incidence holds the direct annotations and propagated the annotations
+    propagated to all ancestor terms, on the same term axis.
+    """
+    genes: np.ndarray
+    gene_index: dict
+    terms: np.ndarray
+    names: np.ndarray
+    NSs: np.ndarray
+    incidence: sp.csr_matrix
+    propagated: sp.csr_matrix
+
+
+class AncestorClosure(NamedTuple):
+    """
+    Term x ancestor closure of an ontology DAG as a boolean CSR matrix, self excluded.
+    """
+    terms: np.ndarray
+    term_index: dict
+    ancestors: sp.csr_matrix
+
+
+def _parent_edges(godag, relationships):
+    if isinstance(godag, SnapshotDAG):
+        return godag.parent_edges(relationships)
+
+    children, parents = [], []
+    for term in {term.id: term for term in godag.values()}.values():
+        targets = list(term.parents)
+        for rel in relationships:
+            targets.extend(getattr(term, "relationship", {}).get(rel, ()))
+        children.extend([term.id] * len(targets))
+        parents.extend(target.id for target in targets)
+    return np.array(children, dtype=object), np.array(parents, dtype=object)
+
+
+def build_ancestor_closure(godag, relationships=PROPAGATION_RELATIONSHIPS) -> AncestorClosure:
+    """
+    Transitive closure of the is_a edges and the given relationships of a DAG.
+
+    The child -> parent adjacency matrix A is closed by repeated squaring,
+    C <- C | C @ C, so a DAG of depth d takes about log2(d) sparse products.
+
+    Args:
+        godag: GO DAG (goatools GODag loaded with the relationship attribute, or SnapshotDAG).
+        relationships (set): Relationship types followed besides is_a.
+    Returns:
+        AncestorClosure
+    """
+    terms = np.array(sorted({godag[goid].id for goid in godag}), dtype=object)
+    term_index = {term: idx for idx, term in enumerate(terms)}
+
+    children, parents = _parent_edges(godag, relationships)
+    ancestors = sp.csr_matrix(
+        (np.ones(len(children), dtype=bool), ([term_index[term] for term in children], [term_index[term] for term in parents])),
+        shape=(len(terms), len(terms))
+    )
+    while True:
+        closed = (ancestors + ancestors @ ancestors).astype(bool)
+        if closed.nnz == ancestors.nnz:
+            break
+        ancestors = closed
+    ancestors.sort_indices()
+
+    return AncestorClosure(terms, term_index, ancestors)
+
+
+def compile_ns2assoc(godag, ns2assoc, relationships=PROPAGATION_RELATIONSHIPS) -> dict:
+    """
+    Compile the gene -> GO term associations of every namespace into sparse gene x term matrices.
+
+    As in goatools, alternative term IDs are mapped onto their main ID and
+    terms missing from the DAG are dropped. The propagated matrix is the
+    direct one OR-reduced over the ancestor closure of every term, i.e. what
+    goatools' propagate_counts=True computes gene by gene.
+
+    Args:
+        godag: GO DAG (goatools GODag or compatible mapping of term ID to term).
+        ns2assoc (dict): Namespace to {gene: set of term IDs}, as returned by load_GO_data.
+        relationships (set): Relationship types followed besides is_a when propagating.
+    Returns:
+        dict: Namespace to NamespaceMatrix.
+    """
+    closure = build_ancestor_closure(godag, relationships)
+    # each term and its ancestors
+    up_closure = (closure.ancestors + sp.identity(len(closure.terms), dtype=bool, format="csr")).astype(np.int32)
+
+    compiled = {}
+    for ns, assoc in sorted(ns2assoc.items()):
+        genes = np.array(sorted(assoc), dtype=object)
+        gene_index = {gene: idx for idx, gene in enumerate(genes)}
+
+        rows, cols = [], []
+        for gene_idx, gene in enumerate(genes):
+            for goid in assoc[gene]:
+                if goid not in godag:
+                    continue
+                rows.append(gene_idx)
+                cols.append(closure.term_index[godag[goid].id])
+
+        direct = sp.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(genes), len(closure.terms))
+        )
+        # alternative IDs of the same term count once
+        direct.sum_duplicates()
+        direct.data = np.minimum(direct.data, 1)
+        propagated = direct @ up_closure
+        propagated.data = np.minimum(propagated.data, 1)
+
+        # keep the terms annotated directly or through a descendant
+        term_cols = np.flatnonzero(propagated.getnnz(axis=0))
+        terms = closure.terms[term_cols]
+        incidence = direct[:, term_cols].tocsr()
+        propagated = propagated[:, term_cols].tocsr()
+
+        names = np.array([godag[term].name for term in terms], dtype=object)
+        NSs = np.array([NAMESPACE2NS.get(godag[term].namespace, godag[term].namespace) for term in terms], dtype=object)
+        compiled[ns] = NamespaceMatrix(genes, gene_index, terms, names, NSs, incidence, propagated)
+
+    return compiled
+
+
+def _log_factorials(n):
+    return np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, n + 1)))])
+
+
+def hypergeom_pvalues(study_counts, study_n, pop_counts, pop_n, alternative="two-sided", block_size=2_000_000):
+    """
+    Vectorized Fisher's exact test on the 2x2 tables of many terms sharing study_n and pop_n.
+
+    "two-sided" matches scipy.stats.fisher_exact as called by goatools: the sum
+    of the probabilities of all tables not more likely than the observed one.
+    "greater" is the one-sided hypergeometric upper tail.
+    """
+    # Relative tolerance for "equally likely" tables. scipy uses 1e-14 on
+    # probabilities computed one by one; summed log-factorials carry slightly
+    # larger rounding errors, which must not split exact ties.
+    tolerance = 1e-9
+
+    study_counts = np.asarray(study_counts, dtype=np.int64)
+    pop_counts = np.asarray(pop_counts, dtype=np.int64)
+    pvalues = np.ones(len(study_counts))
+    if len(study_counts) == 0 or study_n == 0 or study_n == pop_n:
+        return pvalues
+
+    log_fact = _log_factorials(pop_n)
+
+    def log_comb(n, k):
+        valid = (k >= 0) & (k <= n)
+        k = np.clip(k, 0, n)
+        return np.where(valid, log_fact[n] - log_fact[k] - log_fact[n - k], -np.inf)
+
+    rest_n = pop_n - study_n
+    # every term is tested over the same grid of possible study counts
+    max_x = int(min(study_n, pop_counts.max()))
+    xs = np.arange(max_x + 1)
+    terms_per_block = max(1, block_size // len(xs))
+
+    for start in range(0, len(study_counts), terms_per_block):
+        block = slice(start, start + terms_per_block)
+        pop_count = pop_counts[block, None]
+        log_pmf = log_comb(study_n, xs[None, :]) + log_comb(rest_n, pop_count - xs[None, :]) - log_comb(pop_n, pop_count)
+        pmf = np.exp(log_pmf)
+        observed = study_counts[block]
+        if alternative == "two-sided":
+            pexact = np.take_along_axis(pmf, observed[:, None], axis=1)
+            pvalue = np.where(pmf <= pexact * (1 + tolerance), pmf, 0).sum(axis=1)
+            # the observed table is the most likely one
+            pmode = pmf.max(axis=1)
+            pvalue[np.abs(pexact[:, 0] - pmode) / pmode <= tolerance] = 1.0
+        elif alternative == "greater":
+            pvalue = np.where(xs[None, :] >= observed[:, None], pmf, 0).sum(axis=1)
+        else:
+            raise ValueError("`alternative` should be one of {'two-sided', 'greater'}")
+        # tables with an empty margin
+        pvalue[(pop_counts[block] == pop_n)] = 1.0
+        pvalues[block] = np.minimum(pvalue, 1.0)
+
+    return pvalues
+
+
+def fdr_bh(pvalues):
+    """
+    Benjamini/Hochberg adjusted p-values, as statsmodels' multipletests(method="fdr_bh").
+    """
+    pvalues = np.asarray(pvalues, dtype=float)
+    n_tests = len(pvalues)
+    if n_tests == 0:
+        return pvalues
+    order = np.argsort(pvalues)
+    corrected_sorted = pvalues[order] / (np.arange(1, n_tests + 1) / n_tests)
+    corrected_sorted = np.minimum.accumulate(corrected_sorted[::-1])[::-1]
+    corrected = np.empty(n_tests)
+    corrected[order] = np.minimum(corrected_sorted, 1.0)
+    return corrected
+
+
+def _gene_rows(genes, gene_index):
+    return np.array(sorted(gene_index[gene] for gene in genes if gene in gene_index), dtype=np.int64)
+
+
+def score_namespace(incidence, study_rows, study_n, pop_rows, pop_n, alternative="two-sided"):
+    """
+    Count and test every term of one namespace annotated in the population.
+
+    Returns:
+        tuple: Tested term positions, study counts, population counts, p-values and BH-adjusted p-values.
+    """
+    pop_counts = np.asarray(incidence[pop_rows].sum(axis=0)).ravel()
+    study_counts = np.asarray(incidence[study_rows].sum(axis=0)).ravel()
+
+    tested = np.flatnonzero(pop_counts > 0)
+    pvalues = hypergeom_pvalues(study_counts[tested], study_n, pop_counts[tested], pop_n, alternative)
+
+    return tested, study_counts[tested], pop_counts[tested], pvalues, fdr_bh(pvalues)
+
+
+def run_enrichment(query_genes, bg_genes, compiled, alpha=0.05, alternative="two-sided", significant_only=True, propagate_counts=False):
+    """
+    Enrichment of the query genes against the background genes in every compiled namespace.
+
+    Mirrors GOEnrichmentStudyNS(bg_genes, ns2assoc, godag, propagate_counts=...,
+    relationships=PROPAGATION_RELATIONSHIPS, methods=["fdr_bh"]).run_study(query_genes):
+    query genes outside the background are ignored, pop_n is the number of
+    distinct background genes and p-values are BH-adjusted within each namespace.
+    Unlike goatools, which takes the length of bg_genes as pop_n, repeated
+    background genes are counted once.
+
+    Args:
+        query_genes (list): Query (study) genes.
+        bg_genes (list): Background (population) genes.
+        compiled (dict): Output of compile_ns2assoc.
+        alpha (float): Cut-off on p_fdr_bh when significant_only is set.
+        alternative (str): "two-sided" (Fisher's exact test, as goatools) or "greater".
+        significant_only (bool): Only return enriched terms with p_fdr_bh < alpha.
+        propagate_counts (bool): Count genes annotated to a descendant of a term towards the term.
+    Returns:
+        list: EnrichmentRecord objects, in goatools' default order.
+    """
+    pop = set(bg_genes)
+    pop_n = len(pop)
+    study_in_pop = pop.intersection(query_genes)
+    study_n = len(study_in_pop)
+    if study_n == 0:
+        return []
+
+    results = []
+    for ns, matrix in sorted(compiled.items()):
+        ns_results = []
+        incidence = matrix.propagated if propagate_counts else matrix.incidence
+        study_rows = _gene_rows(study_in_pop, matrix.gene_index)
+        pop_rows = _gene_rows(pop, matrix.gene_index)
+        tested, study_counts, pop_counts, pvalues, pvalues_bh = score_namespace(
+            incidence, study_rows, study_n, pop_rows, pop_n, alternative
+        )
+
+        enriched = study_counts / study_n > pop_counts / pop_n
+        keep = enriched & (pvalues_bh < alpha) if significant_only else np.ones(len(tested), dtype=bool)
+
+        # gene sets are only built for the reported terms
+        kept_terms = tested[keep]
+        pop_sub = incidence[pop_rows][:, kept_terms].tocsc()
+        study_sub = incidence[study_rows][:, kept_terms].tocsc()
+        for idx, term_pos in enumerate(kept_terms):
+            pop_items = set(matrix.genes[pop_rows[pop_sub.indices[pop_sub.indptr[idx]:pop_sub.indptr[idx + 1]]]])
+            study_items = set(matrix.genes[study_rows[study_sub.indices[study_sub.indptr[idx]:study_sub.indptr[idx + 1]]]])
+            result_idx = np.flatnonzero(keep)[idx]
+            ns_results.append(EnrichmentRecord(
+                GO=matrix.terms[term_pos],
+                NS=matrix.NSs[term_pos],
+                enrichment="e" if enriched[result_idx] else "p",
+                name=matrix.names[term_pos],
+                p_fdr_bh=float(pvalues_bh[result_idx]),
+                p_uncorrected=float(pvalues[result_idx]),
+                study_count=int(study_counts[result_idx]),
+                pop_count=int(pop_counts[result_idx]),
+                study_n=study_n,
+                pop_n=pop_n,
+                ratio_in_study=(int(study_counts[result_idx]), study_n),
+                ratio_in_pop=(int(pop_counts[result_idx]), pop_n),
+                study_items=study_items,
+                pop_items=pop_items,
+            ))
+
+        ns_results.sort(key=lambda r: [r.enrichment, r.NS, r.p_uncorrected])
+        results.extend(ns_results)
+
+    return results
+
+
+def run_batch_enrichment(query_sets, bg_genes, compiled, alpha=0.05, alternative="two-sided", significant_only=True, propagate_counts=False):
+    """
+    Enrichment of many query gene sets against one background in a single pass per namespace.
+
+    The query-set x term overlaps are computed with one sparse matrix product;
+    each set is then tested and BH-adjusted as run_enrichment would.
+
+    Args:
+        query_sets (dict): Query set name to list of genes, e.g. the clusters of load_cluster_info.
+        bg_genes (list): Background (population) genes shared by all query sets.
+        compiled (dict): Output of compile_ns2assoc.
+        alpha (float): Cut-off on p_fdr_bh when significant_only is set.
+        alternative (str): "two-sided" (Fisher's exact test, as goatools) or "greater".
+        significant_only (bool): Only report enriched terms with p_fdr_bh < alpha.
+        propagate_counts (bool): Count genes annotated to a descendant of a term towards the term.
+    Returns:
+        pd.DataFrame: One row per query set and term.
+    """
+    pop = set(bg_genes)
+    pop_n = len(pop)
+    set_names = list(query_sets)
+    studies_in_pop = [pop.intersection(query_sets[name]) for name in set_names]
+    study_ns = np.array([len(study) for study in studies_in_pop])
+
+    records = []
+    for ns, matrix in sorted(compiled.items()):
+        pop_rows = _gene_rows(pop, matrix.gene_index)
+        incidence = matrix.propagated if propagate_counts else matrix.incidence
+        pop_counts = np.asarray(incidence[pop_rows].sum(axis=0)).ravel()
+        tested = np.flatnonzero(pop_counts > 0)
+        incidence = incidence[:, tested].tocsc()
+
+        # query set x gene membership matrix
+        membership_rows, membership_cols = [], []
+        for set_idx, study in enumerate(studies_in_pop):
+            gene_rows = _gene_rows(study, matrix.gene_index)
+            membership_rows.append(np.full(len(gene_rows), set_idx))
+            membership_cols.append(gene_rows)
+        membership_rows = np.concatenate(membership_rows) if membership_rows else np.array([], dtype=np.int64)
+        membership_cols = np.concatenate(membership_cols) if membership_cols else np.array([], dtype=np.int64)
+        membership = sp.csr_matrix(
+            (np.ones(len(membership_rows), dtype=np.int32), (membership_rows, membership_cols)),
+            shape=(len(set_names), len(matrix.genes))
+        )
+        study_counts = (membership @ incidence).toarray()
+
+        for set_idx, set_name in enumerate(set_names):
+            study_n = study_ns[set_idx]
+            if study_n == 0:
+                continue
+            pvalues = hypergeom_pvalues(study_counts[set_idx], study_n, pop_counts[tested], pop_n, alternative)
+            pvalues_bh = fdr_bh(pvalues)
+            enriched = study_counts[set_idx] / study_n > pop_counts[tested] / pop_n
+            keep = enriched & (pvalues_bh < alpha) if significant_only else np.ones(len(tested), dtype=bool)
+
+            set_genes = membership_cols[membership_rows == set_idx]
+            for term_idx in np.flatnonzero(keep):
+                term_pos = tested[term_idx]
+                term_genes = incidence.indices[incidence.indptr[term_idx]:incidence.indptr[term_idx + 1]]
+                records.append({
+                    "query_set": set_name,
+                    "GO": matrix.terms[term_pos],
+                    "NS": matrix.NSs[term_pos],
+                    "enrichment": "e" if enriched[term_idx] else "p",
+                    "name": matrix.names[term_pos],
+                    "p_fdr_bh": pvalues_bh[term_idx],
+                    "p_uncorrected": pvalues[term_idx],
+                    "study_count": study_counts[set_idx, term_idx],
+                    "pop_count": pop_counts[term_pos],
+                    "study_n": study_n,
+                    "pop_n": pop_n,
+                    "study_items": ", ".join(sorted(matrix.genes[np.intersect1d(set_genes, term_genes)])),
+                })
+
+    columns = [
+        "query_set", "GO", "NS", "enrichment", "name", "p_fdr_bh", "p_uncorrected",
+        "study_count", "pop_count", "study_n", "pop_n", "study_items"
+    ]
+    return pd.DataFrame(records, columns=columns)
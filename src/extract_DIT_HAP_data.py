@@ -2,18 +2,146 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 
+from src.peptide_index import add_residue_context
 
-def get_insertions_in_genes(sysID, insertion_annotations, insertion_LFCs, gene_level_LFCs, timepoints):
 
-    insertions_in_current_genes = insertion_annotations.query(
-        "(`Systematic ID` == @sysID) and (Distance_to_stop_codon > 4)"
-    ).index.intersection(insertion_LFCs.index)
+@st.cache_resource
+def build_gene_insertion_index(_insertion_annotations, _insertion_LFCs, dataset_key):
+    """
+    Sort the insertions by gene once and store the row range of every gene.
+
+    Only insertions kept by get_insertions_in_genes (Distance_to_stop_codon > 4
+    and present in the LFC table) are indexed. Both frames are reordered to the
+    same row order, so that a gene is a positional slice of each of them.
+
+    Args:
+        _insertion_annotations (pd.DataFrame): Insertion annotations from load_data.
+        _insertion_LFCs (pd.DataFrame): Insertion LFCs from load_data.
+        dataset_key (str): Identifies the dataset for caching, e.g. the input file paths.
+    Returns:
+        tuple: A tuple containing:
+            - indexed_annotations: Annotations of the kept insertions sorted by Systematic ID.
+            - indexed_LFCs: LFCs in the same row order as indexed_annotations.
+            - gene_offsets: Dict of Systematic ID to (start, stop) row offsets.
+    """
+    kept_annotations = _insertion_annotations[_insertion_annotations["Distance_to_stop_codon"] > 4]
+    kept_annotations = kept_annotations[
+        kept_annotations.index.isin(_insertion_LFCs.index) & kept_annotations["Systematic ID"].notna()
+    ]
+    # stable sort keeps the original order of insertions within a gene
+    indexed_annotations = kept_annotations.sort_values("Systematic ID", kind="stable")
+    indexed_LFCs = _insertion_LFCs.loc[indexed_annotations.index]
+
+    gene_offsets = _contiguous_blocks(indexed_annotations["Systematic ID"].to_numpy())
+
+    return indexed_annotations, indexed_LFCs, gene_offsets
+
+
+def gather_gene_insertions(sysIDs, gene_index):
+    """
+    Fetch the annotations and LFCs of the insertions in one or many genes with a single gather.
+    """
+    indexed_annotations, indexed_LFCs, gene_offsets = gene_index
+    if isinstance(sysIDs, str):
+        sysIDs = [sysIDs]
+    ranges = [np.arange(*gene_offsets[sysID]) for sysID in sysIDs if sysID in gene_offsets]
+    rows = np.concatenate(ranges) if len(ranges) > 0 else np.array([], dtype=int)
+
+    return indexed_annotations.iloc[rows], indexed_LFCs.iloc[rows]
+
+
+def get_insertions_in_genes(sysID, insertion_annotations, insertion_LFCs, gene_level_LFCs, timepoints, gene_index=None):
+
+    if gene_index is not None:
+        insertion_annotations, insertion_LFCs = gather_gene_insertions(sysID, gene_index)
+        insertions_in_current_genes = insertion_annotations.index
+    else:
+        insertions_in_current_genes = insertion_annotations.query(
+            "(`Systematic ID` == @sysID) and (Distance_to_stop_codon > 4)"
+        ).index.intersection(insertion_LFCs.index)
+
+    return _format_gene_insertions(sysID, insertions_in_current_genes, insertion_annotations, insertion_LFCs, gene_level_LFCs, timepoints)
+
+
+def get_insertions_in_gene_list(sysIDs, gene_level_LFCs, timepoints, gene_index, peptides=None):
+    """
+    Batch version of get_insertions_in_genes: gather and reshape the insertions of all genes at once, then split them per gene.
+
+    With a PeptideReader, the insertions also get the Residue and
+    Residue_context of their affected residue, read for all genes at once.
+
+    Returns:
+        dict: Systematic ID to the (insertion_GMs, gene_level_GMs, insertion_last_tp) tuple of get_insertions_in_genes.
+    """
+    sysIDs = [sysID for sysID in dict.fromkeys(sysIDs) if sysID in gene_level_LFCs.index]
+    insertion_annotations, insertion_LFCs = gather_gene_insertions(sysIDs, gene_index)
+
+    last_tp = timepoints.index.tolist()[-1]
+    insertion_GMs = _format_insertion_GMs(insertion_annotations.index, insertion_annotations, insertion_LFCs, timepoints, extra_cols=["Systematic ID"])
+    if peptides is not None:
+        residue_context = add_residue_context(insertion_annotations, peptides)
+        insertion_GMs[residue_context.columns] = residue_context.loc[insertion_GMs.index.droplevel(-1)].to_numpy()
+    insertion_last_tp = insertion_GMs.query("Timepoint == @last_tp")
+
+    insertion_GMs_per_gene = _split_by_gene(insertion_GMs, sysIDs)
+    insertion_last_tp_per_gene = _split_by_gene(insertion_last_tp, sysIDs)
+
+    # gene-level values of all genes in one vectorized pass
+    tps_without_init = timepoints.index.tolist()[1:]
+    gene_level_Ms = gene_level_LFCs.loc[sysIDs, tps_without_init].to_numpy()
+    gene_level_pvalues = _rename_gene_level_pvalues(gene_level_LFCs).loc[sysIDs, tps_without_init].to_numpy()
+    gene_level_weights = -np.log10(np.where(gene_level_pvalues <= 1e-10, 1e-10, np.where(gene_level_pvalues > 1-1e-10, 1, gene_level_pvalues)))
+    Gs = timepoints.loc[tps_without_init].values
+    tp_index = pd.Index(tps_without_init, name=gene_level_LFCs.columns.name)
+
+    gene_insertions = {}
+    for idx, sysID in enumerate(sysIDs):
+        gene_level_GMs = pd.DataFrame({
+            "M": gene_level_Ms[idx], "Padj": gene_level_pvalues[idx], "G": Gs, "weights": gene_level_weights[idx]
+        }, index=tp_index)
+        gene_insertions[sysID] = (insertion_GMs_per_gene[sysID], gene_level_GMs, insertion_last_tp_per_gene[sysID])
+
+    return gene_insertions
+
+
+def _contiguous_blocks(labels):
+    """
+    Return a dict of label to (start, stop) for an array in which equal labels are contiguous.
+    """
+    if len(labels) == 0:
+        return {}
+    boundaries = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    starts = np.concatenate([[0], boundaries])
+    stops = np.concatenate([boundaries, [len(labels)]])
+    return {labels[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+
+def _split_by_gene(GMs, sysIDs):
+
+    # rows are gathered gene by gene, so every gene is a contiguous block
+    gene_blocks = _contiguous_blocks(GMs["Systematic ID"].to_numpy())
+    GMs = GMs.drop(columns="Systematic ID")
+
+    return {sysID: GMs.iloc[slice(*gene_blocks.get(sysID, (0, 0)))].copy() for sysID in sysIDs}
+
+
+def _format_gene_insertions(sysID, insertions_in_current_genes, insertion_annotations, insertion_LFCs, gene_level_LFCs, timepoints):
 
     tps_without_init = timepoints.index.tolist()[1:]
     last_tp = tps_without_init[-1]
 
-    insertion_Ms = insertion_LFCs.loc[insertions_in_current_genes]["log2FoldChange"].stack().rename("M")
-    insertion_pvalues = insertion_LFCs.loc[insertions_in_current_genes]["padj"].stack().rename("Padj")
+    insertion_GMs = _format_insertion_GMs(insertions_in_current_genes, insertion_annotations, insertion_LFCs, timepoints)
+    gene_level_GMs = _format_gene_level_GMs(sysID, gene_level_LFCs, timepoints)
+
+    insertion_last_tp = insertion_GMs.query("Timepoint == @last_tp")
+
+    return insertion_GMs, gene_level_GMs, insertion_last_tp
+
+
+def _format_insertion_GMs(insertions, insertion_annotations, insertion_LFCs, timepoints, extra_cols=None):
+
+    insertion_Ms = insertion_LFCs.loc[insertions]["log2FoldChange"].stack().rename("M")
+    insertion_pvalues = insertion_LFCs.loc[insertions]["padj"].stack().rename("Padj")
     insertion_GMs = pd.concat([insertion_Ms, insertion_pvalues], axis=1).rename_axis(["#Chr", "Coordinate", "Strand", "Target", "Timepoint"], axis=0)
     insertion_GMs["G"] = timepoints.loc[insertion_GMs.index.get_level_values(-1)].values
     insertion_GMs["weights"] = -np.log10(insertion_GMs["Padj"].apply(lambda x: 1e-10 if x <= 1e-10 else 1 if x > 1-1e-10 else x))
@@ -24,16 +152,31 @@ def get_insertions_in_genes(sysID, insertion_annotations, insertion_LFCs, gene_l
         "Residue_frame", "Insertion_direction"
     ]
 
+    if extra_cols is not None:
+        insertion_info_cols = insertion_info_cols + extra_cols
+
     insertion_GMs[insertion_info_cols] = insertion_annotations.loc[insertion_GMs.index.droplevel(-1), insertion_info_cols].values
 
-    gene_level_Ms = gene_level_LFCs.loc[sysID, tps_without_init].rename("M")
+    return insertion_GMs
+
+
+def _rename_gene_level_pvalues(gene_level_LFCs):
+
     gene_level_pvalues = gene_level_LFCs.filter(like="_pvalue")
     gene_level_pvalues.columns = [f"{col.split('_pvalue')[0]}" for col in gene_level_pvalues.columns]
+
+    return gene_level_pvalues
+
+
+def _format_gene_level_GMs(sysID, gene_level_LFCs, timepoints):
+
+    tps_without_init = timepoints.index.tolist()[1:]
+
+    gene_level_pvalues = _rename_gene_level_pvalues(gene_level_LFCs)
+    gene_level_Ms = gene_level_LFCs.loc[sysID, tps_without_init].rename("M")
     gene_level_pvalues = gene_level_pvalues.loc[sysID, tps_without_init].rename("Padj")
     gene_level_GMs = pd.concat([gene_level_Ms, gene_level_pvalues], axis=1)
     gene_level_GMs["G"] = timepoints.loc[gene_level_GMs.index.get_level_values(-1)].values
     gene_level_GMs["weights"] = -np.log10(gene_level_GMs["Padj"].apply(lambda x: 1e-10 if x <= 1e-10 else 1 if x > 1-1e-10 else x))
 
-    insertion_last_tp = insertion_GMs.query("Timepoint == @last_tp")
-
-    return insertion_GMs, gene_level_GMs, insertion_last_tp
+    return gene_level_GMs
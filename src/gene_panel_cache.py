@@ -0,0 +1,150 @@
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import altair as alt
+import streamlit as st
+
+from src.extract_DIT_HAP_data import get_insertions_in_gene_list
+from src.plot_insertion import combine_plots
+
+# Total size of the specs kept in memory (their embedded insertion rows
+# included), least recently used ones are dropped first
+MAX_CACHED_PANEL_MB = 64
+# Genes computed together by the prefetch thread
+PREFETCH_BLOCK_SIZE = 10
+
+
+class GenePanelCache:
+    """
+    Vega-Lite specs of the combine_plots panels of genes, computed on demand and prefetched in the background.
+
+    Specs are computed for blocks of genes with one get_insertions_in_gene_list
+    call. Genes that are not visible yet are computed by a single background
+    thread, which does not call streamlit. The cache is shared by all sessions,
+    so the prefetch queue of every caller (owner) is tracked separately. A gene
+    without data has the spec None.
+
+    Args:
+        gene_level_LFCs (pd.DataFrame): Gene-level LFCs from load_data.
+        timepoints (pd.Series): Timepoints from load_data.
+        gene_index (tuple): Gene index from build_gene_insertion_index.
+        max_MB (float): Total JSON size of the specs kept in memory.
+        peptides (PeptideReader): Adds the residue context of the insertions to the tooltips, optional.
+    """
+
+    def __init__(self, gene_level_LFCs, timepoints, gene_index, max_MB=MAX_CACHED_PANEL_MB, peptides=None):
+        self.gene_level_LFCs = gene_level_LFCs
+        self.timepoints = timepoints
+        self.gene_index = gene_index
+        self.max_bytes = max_MB * 1024 ** 2
+        self.peptides = peptides
+        # Systematic ID to (spec, size in bytes)
+        self._specs = OrderedDict()
+        self._cached_bytes = 0
+        self._pending = {}
+        # owner to the genes queued by its prefetch calls and not computed yet
+        self._owned = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gene-panel-prefetch")
+        # the specs embed their data; st.altair_chart does not have this limit either
+        alt.data_transformers.disable_max_rows()
+
+    def _compute(self, sysIDs):
+        gene_insertions = get_insertions_in_gene_list(sysIDs, self.gene_level_LFCs, self.timepoints, self.gene_index, self.peptides)
+        specs = {
+            sysID: combine_plots(*gene_insertions[sysID]).to_dict() if sysID in gene_insertions else None
+            for sysID in sysIDs
+        }
+        sizes = {sysID: len(json.dumps(spec, default=str)) if spec is not None else 0 for sysID, spec in specs.items()}
+        with self._lock:
+            for sysID, spec in specs.items():
+                if sysID in self._specs:
+                    self._cached_bytes -= self._specs[sysID][1]
+                self._specs[sysID] = (spec, sizes[sysID])
+                self._specs.move_to_end(sysID)
+                self._cached_bytes += sizes[sysID]
+            while self._cached_bytes > self.max_bytes and self._specs:
+                _, (_, size) = self._specs.popitem(last=False)
+                self._cached_bytes -= size
+        return specs
+
+    def _compute_prefetched(self, sysIDs, owner):
+        try:
+            return self._compute(sysIDs)
+        finally:
+            with self._lock:
+                for sysID in sysIDs:
+                    self._pending.pop(sysID, None)
+                owned = self._owned.get(owner)
+                if owned is not None:
+                    owned.difference_update(sysIDs)
+                    if not owned:
+                        del self._owned[owner]
+
+    def get_many(self, sysIDs):
+        """
+        Specs of the genes, computing the ones that are neither cached nor being prefetched.
+
+        Returns:
+            dict: Systematic ID to spec (None for genes without data).
+        """
+        specs, waiting, missing = {}, {}, []
+        with self._lock:
+            for sysID in dict.fromkeys(sysIDs):
+                if sysID in self._specs:
+                    self._specs.move_to_end(sysID)
+                    specs[sysID] = self._specs[sysID][0]
+                elif sysID in self._pending:
+                    waiting[sysID] = self._pending[sysID]
+                else:
+                    missing.append(sysID)
+        for sysID, future in waiting.items():
+            try:
+                specs[sysID] = future.result()[sysID]
+            except CancelledError:
+                # dropped from the queue by a later prefetch call
+                missing.append(sysID)
+        if missing:
+            specs.update(self._compute(missing))
+        return specs
+
+    def prefetch(self, sysIDs, block_size=PREFETCH_BLOCK_SIZE, owner=None):
+        """
+        Queue the genes that are not cached, in order, replacing the queue of the previous call of the same owner.
+
+        Blocks of the owner already being computed are finished; its queued
+        ones are cancelled. The blocks queued by other owners, e.g. other
+        sessions, are left alone.
+
+        Args:
+            owner (hashable): Caller the queue belongs to, e.g. a session id.
+        """
+        with self._lock:
+            owned = self._owned.pop(owner, set())
+            cancelled = {self._pending[sysID] for sysID in owned if sysID in self._pending and self._pending[sysID].cancel()}
+            for sysID in owned:
+                if self._pending.get(sysID) in cancelled:
+                    del self._pending[sysID]
+            owned = {sysID for sysID in owned if sysID in self._pending}
+            todo = [sysID for sysID in dict.fromkeys(sysIDs) if sysID not in self._specs and sysID not in self._pending]
+            for start in range(0, len(todo), block_size):
+                block = todo[start:start + block_size]
+                future = self._executor.submit(self._compute_prefetched, block, owner)
+                for sysID in block:
+                    self._pending[sysID] = future
+            owned.update(todo)
+            if owned:
+                self._owned[owner] = owned
+
+
+@st.cache_resource(max_entries=1)
+def load_gene_panel_cache(_gene_level_LFCs, _timepoints, _gene_index, dataset_version, _peptides=None):
+    """
+    One GenePanelCache for the current dataset version, shared by all sessions; the caches of older versions are dropped.
+
+    Args:
+        dataset_version (str): Identifies the data the specs are computed from, e.g. a dataset_fingerprint of the input files.
+    """
+    return GenePanelCache(_gene_level_LFCs, _timepoints, _gene_index, peptides=_peptides)
@@ -0,0 +1,104 @@
+import bisect
+
+import pandas as pd
+import streamlit as st
+
+# Identifier kinds, in the order they take precedence when the same key names several genes
+IDENTIFIER_KINDS = ["systematic ID", "gene name", "synonym", "UniProt ID"]
+
+
+class GeneResolver:
+    """
+    Maps systematic IDs, gene names, synonyms and UniProt IDs to systematic IDs.
+
+    Exact matches are tried first, then case-insensitive ones. A key shared by
+    several genes resolves through the kind of identifier that comes first in
+    IDENTIFIER_KINDS, then through the first gene in the files.
+
+    Args:
+        gene_info (pd.DataFrame): gene_IDs_names_products.tsv, indexed by gene_systematic_id.
+        uniprot_mapping (pd.DataFrame): uniprot_id_mapping.tsv with columns uniprot_id, sysID and gene_name, or None.
+    """
+
+    def __init__(self, gene_info, uniprot_mapping=None):
+        gene_names = gene_info["gene_name"].fillna(gene_info.index.to_series())
+        self.gene_id_to_name = gene_names.to_dict()
+
+        synonyms = gene_info["synonyms"].dropna().str.split(",").explode().str.strip()
+        synonyms = synonyms[synonyms != ""]
+        uniprot_ids = gene_info["uniprot_id"].dropna()
+        if uniprot_mapping is not None:
+            uniprot_ids = pd.concat([uniprot_ids, uniprot_mapping.set_index("sysID")["uniprot_id"]])
+
+        key_lists = {
+            "systematic ID": zip(gene_info.index, gene_info.index),
+            "gene name": zip(gene_names, gene_names.index),
+            "synonym": zip(synonyms, synonyms.index),
+            "UniProt ID": zip(uniprot_ids, uniprot_ids.index),
+        }
+        self.exact = {}
+        self.lower = {}
+        self.identifiers = {}
+        for kind in IDENTIFIER_KINDS:
+            for key, sysID in key_lists[kind]:
+                self.exact.setdefault(key, (sysID, kind))
+                self.lower.setdefault(key.lower(), (sysID, kind))
+                self.identifiers.setdefault(key.lower(), key)
+
+        # sorted lower-case keys for prefix search
+        self.sorted_keys = sorted(self.lower)
+
+    def resolve(self, query):
+        """
+        Returns:
+            tuple: (sysID, kind of identifier matched), or (None, None) when nothing matches.
+        """
+        if query in self.exact:
+            return self.exact[query]
+        return self.lower.get(query.lower(), (None, None))
+
+    def resolve_many(self, queries):
+        """
+        Returns:
+            tuple: sysIDs found (in query order), queries not found, and {query: (sysID, kind)} of the
+            queries that were not systematic IDs.
+        """
+        sysIDs, missing, renamed = [], [], {}
+        for query in queries:
+            sysID, kind = self.resolve(query)
+            if sysID is None:
+                missing.append(query)
+                continue
+            sysIDs.append(sysID)
+            if query != sysID:
+                renamed[query] = (sysID, kind)
+        return sysIDs, missing, renamed
+
+    def search(self, prefix, limit=20):
+        """
+        Case-insensitive prefix search over all identifiers.
+
+        Returns:
+            pd.DataFrame: Identifier, kind, Systematic ID and gene name of up to limit matches.
+        """
+        prefix = prefix.strip().lower()
+        matches = []
+        if prefix:
+            start = bisect.bisect_left(self.sorted_keys, prefix)
+            for key in self.sorted_keys[start:start + limit]:
+                if not key.startswith(prefix):
+                    break
+                matches.append(key)
+        rows = [(self.identifiers[key], *self.lower[key]) for key in matches]
+        results = pd.DataFrame(rows, columns=["Identifier", "Systematic ID", "kind"])
+        results["gene name"] = results["Systematic ID"].map(self.gene_id_to_name)
+        return results[["Identifier", "kind", "Systematic ID", "gene name"]]
+
+
+@st.cache_resource
+def load_gene_resolver(gene_info_file, uniprot_mapping_file=None):
+    gene_info = pd.read_csv(gene_info_file, index_col=0, sep="\t")
+    uniprot_mapping = None
+    if uniprot_mapping_file is not None:
+        uniprot_mapping = pd.read_csv(uniprot_mapping_file, sep="\t", header=None, names=["uniprot_id", "sysID", "gene_name"])
+    return GeneResolver(gene_info, uniprot_mapping)
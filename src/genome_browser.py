@@ -0,0 +1,172 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Windows with more insertions than this are drawn as binned averages
+MAX_INSERTIONS_PER_POINT_PLOT = 3000
+DEFAULT_N_BINS = 200
+
+
+class GenomeIndex(NamedTuple):
+    """
+    Genome regions and insertions of every chromosome sorted by position, for searchsorted window queries.
+
+    Regions can overlap (genes on opposite strands), so besides the sorted
+    starts the running maximum of their ends is kept: the regions
+    overlapping [start, end) are the ones between the first running
+    maximum above start and the last start below end whose own end is
+    above start.
+    """
+    chromosome_lengths: dict
+    regions: dict
+    region_starts: dict
+    region_ends: dict
+    region_max_ends: dict
+    insertions: dict
+    insertion_coordinates: dict
+    insertion_Ms: dict
+    timepoints: list
+
+
+def build_genome_index(genome_regions, insertion_annotations, insertion_LFCs, timepoints) -> GenomeIndex:
+    """
+    Args:
+        genome_regions (pd.DataFrame): Genome_regions_CDS_intron_IGR_annotated.bed from load_additional_info.
+        insertion_annotations (pd.DataFrame): Insertion annotations from load_data.
+        insertion_LFCs (pd.DataFrame): Insertion LFCs from load_data.
+        timepoints (pd.Series): Timepoints from load_data.
+    """
+    tps = [tp for tp in timepoints.index if tp in insertion_LFCs["log2FoldChange"].columns]
+    Ms = insertion_LFCs["log2FoldChange"][tps]
+    insertions = insertion_annotations.reindex(Ms.index)[["Systematic ID", "Type"]].reset_index()
+    insertions[tps] = Ms.to_numpy(dtype=np.float64)
+    insertions["#Chr"] = insertions["#Chr"].astype(str)
+
+    chromosome_lengths = genome_regions.groupby("#Chr", sort=False)["End"].max().to_dict()
+    regions, region_starts, region_ends, region_max_ends = {}, {}, {}, {}
+    for chrom, chrom_regions in genome_regions.groupby("#Chr", sort=False):
+        chrom_regions = chrom_regions.sort_values(["Start", "End"], kind="stable").reset_index(drop=True)
+        regions[chrom] = chrom_regions
+        region_starts[chrom] = chrom_regions["Start"].to_numpy(dtype=np.int64)
+        region_ends[chrom] = chrom_regions["End"].to_numpy(dtype=np.int64)
+        region_max_ends[chrom] = np.maximum.accumulate(region_ends[chrom])
+
+    chrom_insertions, insertion_coordinates, insertion_Ms = {}, {}, {}
+    for chrom, insertions_of_chrom in insertions.groupby("#Chr", sort=False):
+        insertions_of_chrom = insertions_of_chrom.sort_values("Coordinate", kind="stable").reset_index(drop=True)
+        chrom_insertions[chrom] = insertions_of_chrom
+        insertion_coordinates[chrom] = insertions_of_chrom["Coordinate"].to_numpy(dtype=np.int64)
+        insertion_Ms[chrom] = insertions_of_chrom[tps].to_numpy(dtype=np.float64)
+        chromosome_lengths[chrom] = max(chromosome_lengths.get(chrom, 0), int(insertion_coordinates[chrom][-1]) + 1)
+
+    return GenomeIndex(
+        chromosome_lengths=chromosome_lengths,
+        regions=regions,
+        region_starts=region_starts,
+        region_ends=region_ends,
+        region_max_ends=region_max_ends,
+        insertions=chrom_insertions,
+        insertion_coordinates=insertion_coordinates,
+        insertion_Ms=insertion_Ms,
+        timepoints=tps,
+    )
+
+
+@st.cache_resource
+def load_genome_index(_genome_regions, _insertion_annotations, _insertion_LFCs, _timepoints, dataset_version):
+    """
+    Args:
+        dataset_version (str): Identifies the data the index is built from, e.g. a dataset_fingerprint of the input files.
+    """
+    return build_genome_index(_genome_regions, _insertion_annotations, _insertion_LFCs, _timepoints)
+
+
+def regions_in_window(index, chrom, start, end) -> pd.DataFrame:
+    """
+    CDS, intron and intergenic regions overlapping [start, end) of a chromosome.
+    """
+    if chrom not in index.regions:
+        return next(iter(index.regions.values())).iloc[:0]
+    first = np.searchsorted(index.region_max_ends[chrom], start, side="right")
+    last = np.searchsorted(index.region_starts[chrom], end, side="left")
+    rows = first + np.flatnonzero(index.region_ends[chrom][first:last] > start)
+    return index.regions[chrom].iloc[rows]
+
+
+def _insertion_rows(index, chrom, start, end):
+    if chrom not in index.insertion_coordinates:
+        return 0, 0
+    coordinates = index.insertion_coordinates[chrom]
+    return np.searchsorted(coordinates, start, side="left"), np.searchsorted(coordinates, end, side="left")
+
+
+def count_insertions_in_window(index, chrom, start, end) -> int:
+    first, last = _insertion_rows(index, chrom, start, end)
+    return int(last - first)
+
+
+def insertions_in_window(index, chrom, start, end) -> pd.DataFrame:
+    """
+    Insertions with Start <= Coordinate < end, with their annotation and their M value at every timepoint.
+    """
+    if chrom not in index.insertions:
+        return next(iter(index.insertions.values())).iloc[:0]
+    first, last = _insertion_rows(index, chrom, start, end)
+    return index.insertions[chrom].iloc[first:last]
+
+
+def binned_insertion_LFCs(index, chrom, start, end, n_bins=DEFAULT_N_BINS) -> pd.DataFrame:
+    """
+    Number of insertions and mean, minimum and maximum M value per timepoint in n_bins equal bins of [start, end).
+
+    Returns:
+        pd.DataFrame: One row per non-empty bin and timepoint with bin_start, bin_end, Timepoint, insertions, mean_M, min_M and max_M.
+    """
+    first, last = _insertion_rows(index, chrom, start, end)
+    edges = np.linspace(start, end, n_bins + 1)
+    if last == first:
+        return pd.DataFrame(columns=["bin_start", "bin_end", "Timepoint", "insertions", "mean_M", "min_M", "max_M"])
+
+    bins = np.searchsorted(edges, index.insertion_coordinates[chrom][first:last], side="right") - 1
+    bins = np.clip(bins, 0, n_bins - 1)
+    Ms = index.insertion_Ms[chrom][first:last]
+
+    binned = []
+    for tp_idx, tp in enumerate(index.timepoints):
+        M = Ms[:, tp_idx]
+        valid = ~np.isnan(M)
+        counts = np.bincount(bins[valid], minlength=n_bins)
+        sums = np.bincount(bins[valid], weights=M[valid], minlength=n_bins)
+        minimums = np.full(n_bins, np.inf)
+        maximums = np.full(n_bins, -np.inf)
+        np.minimum.at(minimums, bins[valid], M[valid])
+        np.maximum.at(maximums, bins[valid], M[valid])
+        kept = np.flatnonzero(counts > 0)
+        binned.append(pd.DataFrame({
+            "bin_start": edges[kept].round().astype(np.int64),
+            "bin_end": edges[kept + 1].round().astype(np.int64),
+            "Timepoint": tp,
+            "insertions": counts[kept],
+            "mean_M": sums[kept] / counts[kept],
+            "min_M": minimums[kept],
+            "max_M": maximums[kept],
+        }))
+    return pd.concat(binned, ignore_index=True)
+
+
+def gene_window(index, sysID, padding=2000):
+    """
+    Chromosome, start and end of the CDS and introns of a gene, extended by padding on both sides.
+
+    Returns:
+        tuple: (chrom, start, end), or None when the gene has no region.
+    """
+    for chrom, chrom_regions in index.regions.items():
+        gene_regions = chrom_regions[chrom_regions["Systematic ID"] == sysID]
+        if len(gene_regions) > 0:
+            start = max(int(gene_regions["Start"].min()) - padding, 0)
+            end = min(int(gene_regions["End"].max()) + padding, index.chromosome_lengths[chrom])
+            return chrom, start, end
+    return None
@@ -0,0 +1,176 @@
+import argparse
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from src.compact_frames import FLOAT64_STATISTICS, compact_insertion_annotations, compact_insertion_LFCs
+
+# The two insertion-level tables are stored as uncompressed Arrow IPC files,
+# one file per chromosome, so that they can be memory-mapped and read with
+# column projection instead of being parsed from CSV on every cold start.
+LFC_TABLE = "insertion_LFCs"
+ANNOTATION_TABLE = "insertion_annotations"
+COLUMN_LEVEL_SEPARATOR = "|"
+
+# Columns used by the curve plot page; everything else stays on disk.
+DEFAULT_LFC_STATISTICS = ["log2FoldChange", "padj"]
+DEFAULT_ANNOTATION_COLUMNS = [
+    "Systematic ID", "Type", "Distance_to_start_codon", "Distance_to_stop_codon",
+    "Fraction_to_start_codon", "Fraction_to_stop_codon", "Residue_affected",
+    "Residue_frame", "Insertion_direction"
+]
+
+
+def insertion_store_exists(store_dir) -> bool:
+    store_dir = Path(store_dir)
+    return (store_dir / LFC_TABLE).is_dir() and (store_dir / ANNOTATION_TABLE).is_dir()
+
+
+def insertion_store_files(store_dir) -> list:
+    """
+    Partition files of the store, e.g. to fingerprint data read from it; empty when there is no store.
+    """
+    if store_dir is None or not insertion_store_exists(store_dir):
+        return []
+    store_dir = Path(store_dir)
+    return sorted((store_dir / LFC_TABLE).glob("*.arrow")) + sorted((store_dir / ANNOTATION_TABLE).glob("*.arrow"))
+
+
+def flatten_columns(df: pd.DataFrame) -> pd.DataFrame:
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.copy()
+        df.columns = [COLUMN_LEVEL_SEPARATOR.join(map(str, col)) for col in df.columns]
+    return df
+
+
+def restore_columns(df: pd.DataFrame) -> pd.DataFrame:
+    if len(df.columns) > 0 and all(COLUMN_LEVEL_SEPARATOR in col for col in df.columns):
+        df.columns = pd.MultiIndex.from_tuples([tuple(col.split(COLUMN_LEVEL_SEPARATOR)) for col in df.columns])
+    return df
+
+
+def _read_schema(file: Path) -> pa.Schema:
+    with pa.memory_map(str(file)) as source:
+        return pa.ipc.open_file(source).schema
+
+
+def _write_partitions(df: pd.DataFrame, table_dir: Path):
+    table_dir.mkdir(parents=True, exist_ok=True)
+    for old_file in table_dir.glob("*.arrow"):
+        old_file.unlink()
+    chr_level = df.index.names[0]
+    for chrom, chrom_df in df.groupby(level=chr_level, sort=True):
+        table = pa.Table.from_pandas(flatten_columns(chrom_df), preserve_index=True)
+        # Uncompressed so the buffers can be memory-mapped without decoding
+        feather.write_feather(table, table_dir / f"{chrom}.arrow", compression="uncompressed")
+
+
+def convert_insertion_data_to_store(insertion_LFCs_file, insertion_annotations_file, store_dir):
+    """
+    Convert the insertion-level CSV files into a columnar store partitioned by chromosome.
+
+    Args:
+        insertion_LFCs_file (str): Path to the insertion LFCs CSV file.
+        insertion_annotations_file (str): Path to the insertion annotations CSV file.
+        store_dir (str): Output directory of the store.
+    """
+    store_dir = Path(store_dir)
+
+    insertion_LFCs = pd.read_csv(insertion_LFCs_file, index_col=[0, 1, 2, 3], header=[0, 1]).reorder_levels([1, 0], axis=1)
+    # stored in the compact dtypes of load_data, so nothing is converted after memory-mapping;
+    # load_data(compact=False) reads the CSV files instead
+    _write_partitions(compact_insertion_LFCs(insertion_LFCs), store_dir / LFC_TABLE)
+    del insertion_LFCs
+
+    insertion_annotations = pd.read_csv(insertion_annotations_file, index_col=[0, 1, 2, 3], header=0)
+    _write_partitions(compact_insertion_annotations(insertion_annotations), store_dir / ANNOTATION_TABLE)
+
+
+def _read_table(table_dir: Path, columns=None, chromosomes=None) -> pd.DataFrame:
+    files = sorted(table_dir.glob("*.arrow"))
+    if chromosomes is not None:
+        files = [file for file in files if file.stem in set(map(str, chromosomes))]
+
+    frames = []
+    for file in files:
+        if columns is not None:
+            # Index columns are stored as regular fields and must always be projected
+            index_fields = [name for name in _read_schema(file).pandas_metadata["index_columns"] if isinstance(name, str)]
+            table = feather.read_table(file, columns=index_fields + list(columns), memory_map=True)
+        else:
+            table = feather.read_table(file, memory_map=True)
+        frames.append(table.to_pandas(split_blocks=True))
+
+    if len(frames) == 0:
+        raise FileNotFoundError(f"No partitions found in {table_dir}")
+    return restore_columns(pd.concat(frames, axis=0))
+
+
+def load_insertion_store(store_dir, LFC_statistics=DEFAULT_LFC_STATISTICS, annotation_columns=DEFAULT_ANNOTATION_COLUMNS, chromosomes=None) -> tuple:
+    """
+    Memory-map the columnar insertion store, reading only the requested columns.
+
+    Args:
+        store_dir (str): Directory written by convert_insertion_data_to_store.
+        LFC_statistics (list): Statistics (first column level) to read from the LFC table. None reads all.
+        annotation_columns (list): Columns to read from the annotation table. None reads all.
+        chromosomes (list): Chromosomes to read. None reads all.
+    Returns:
+        tuple: A tuple containing two pandas DataFrames:
+            - insertion_LFCs: DataFrame with insertion LFCs data.
+            - insertion_annotations: DataFrame with insertion annotations data.
+    """
+    store_dir = Path(store_dir)
+
+    LFC_columns = None
+    if LFC_statistics is not None:
+        first_file = next((store_dir / LFC_TABLE).glob("*.arrow"))
+        all_columns = _read_schema(first_file).names
+        LFC_columns = [
+            col for col in all_columns
+            if col.split(COLUMN_LEVEL_SEPARATOR)[0] in LFC_statistics and COLUMN_LEVEL_SEPARATOR in col
+        ]
+
+    insertion_LFCs = _read_table(store_dir / LFC_TABLE, LFC_columns, chromosomes)
+    # stores written before these statistics were kept in float64 have lost their exact values
+    downcast = sorted({col[0] for col in insertion_LFCs.columns[insertion_LFCs.dtypes == "float32"] if col[0] in FLOAT64_STATISTICS})
+    if downcast:
+        raise ValueError(f"{store_dir} stores {', '.join(downcast)} as float32, rebuild it with `python -m src.insertion_store`")
+    insertion_annotations = _read_table(store_dir / ANNOTATION_TABLE, annotation_columns, chromosomes)
+
+    return insertion_LFCs, insertion_annotations
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Convert the insertion-level CSV files into a columnar store.")
+    parser.add_argument(
+        "-l",
+        "--insertion-LFCs",
+        dest="insertion_LFCs_file",
+        required=True,
+        type=Path,
+        help="File of insertion LFCs",
+    )
+    parser.add_argument(
+        "-a",
+        "--insertion-annotations",
+        dest="insertion_annotations_file",
+        required=True,
+        type=Path,
+        help="File of insertion annotations",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="store_dir",
+        required=True,
+        type=Path,
+        help="Output folder of the store",
+    )
+
+    args = parser.parse_args()
+
+    convert_insertion_data_to_store(args.insertion_LFCs_file, args.insertion_annotations_file, args.store_dir)
@@ -3,24 +3,15 @@ from pathlib import Path
 import pandas as pd
 
 import streamlit as st
-def display_basic_information(container, query, merged_gene_info):
+def display_basic_information(container, query, merged_gene_info, gene_resolver):
 
-    sysIDs_names = merged_gene_info[["gene_name"]].copy()
-    names_sysIDs = merged_gene_info[["gene_name"]].copy().reset_index(drop=False).set_index("gene_name")
-    synonyms = merged_gene_info["synonyms"].str.split(",").explode().str.strip().to_frame("synonyms").reset_index(drop=False)
-    synonyms_sysIDs = synonyms.set_index("synonyms")
-    if query in sysIDs_names.index:
-        sysID = query
-        gene_name = sysIDs_names.loc[query, "gene_name"]
-    elif query in names_sysIDs.index:
-        sysID = names_sysIDs.loc[query, "Systematic ID"]
-        gene_name = query
-    elif query in synonyms_sysIDs.index:
-        sysID = synonyms_sysIDs.loc[query, "Systematic ID"]
-        gene_name = sysIDs_names.loc[sysID, "gene_name"]
-        container.text(f"The gene name {query} has been updated to {sysID} / {gene_name}")
-    else:
+    sysID, kind = gene_resolver.resolve(query)
+    if sysID is None or sysID not in merged_gene_info.index:
         container.text(f"No gene information found for {query}")
+        return sysID, container
+    gene_name = merged_gene_info.loc[sysID, "gene_name"]
+    if kind in ["synonym", "UniProt ID"]:
+        container.text(f"The gene name {query} has been updated to {sysID} / {gene_name}")
     
     pombase_link = f"https://www.pombase.org/gene/{sysID}"
     # info_col, pombase_col = container.columns([6,4])
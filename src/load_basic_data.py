@@ -1,16 +1,39 @@
 import pandas as pd
 import streamlit as st
 
-@st.cache_data
-def load_data(insertion_LFCs_file: str, gene_level_LFCs_file: str, insertion_annotations_file: str, timepoint_file: str) -> tuple:
+from src.compact_frames import COMPACT_LAYOUT, compact_gene_level_LFCs, compact_insertion_annotations, compact_insertion_LFCs
+from src.insertion_store import insertion_store_exists, insertion_store_files, load_insertion_store
+from src.shared_dataset import shared_frames
+
+BASIC_DATA_FRAMES = ["insertion_LFCs", "gene_level_LFCs", "insertion_annotations", "timepoints"]
+ADDITIONAL_INFO_FRAMES = ["merged_gene_info", "genome_regions"]
+
+@st.cache_resource
+def load_data(insertion_LFCs_file: str, gene_level_LFCs_file: str, insertion_annotations_file: str, timepoint_file: str, insertion_store_dir: str = None, compact: bool = True, shared_dataset_dir: str = None) -> tuple:
     """
     Load and process data from CSV files.
 
+    With compact, the frames use categorical strings and float32 insertion
+    LFC statistics that are not read downstream (see src.compact_frames). The frames are shared by all sessions of
+    the server process and must not be modified in place.
+
+    If a columnar insertion store built by src.insertion_store exists, the
+    compact insertion-level tables are memory-mapped from it instead of parsed
+    from CSV. The store only holds the compact dtypes, so without compact the
+    insertion CSV files are always read.
+
+    With shared_dataset_dir, the processed frames are published there once
+    (see src.shared_dataset) and every process memory-maps the same files
+    instead of building its own copy.
+
     Args:
         insertion_LFCs_file (str): Path to the insertion LFCs CSV file.
         gene_level_LFCs_file (str): Path to the gene-level LFCs CSV file.
         insertion_annotations_file (str): Path to the insertion annotations CSV file.
         timepoint_file (str): Path to the timepoint CSV file.
+        insertion_store_dir (str): Path to the columnar insertion store (optional, only read with compact).
+        compact (bool): Use the compact dtypes.
+        shared_dataset_dir (str): Directory of the shared datasets (optional).
     Returns:
         tuple: A tuple containing three pandas DataFrames:
             - insertion_LFCs: DataFrame with insertion LFCs data.
@@ -19,29 +42,99 @@ def load_data(insertion_LFCs_file: str, gene_level_LFCs_file: str, insertion_ann
             - timepoints: DataFrame with timepoints data.
     """
 
-    insertion_LFCs = pd.read_csv(insertion_LFCs_file, index_col=[0, 1, 2, 3], header=[0, 1]).reorder_levels([1, 0], axis=1)
+    if shared_dataset_dir is not None:
+        return shared_basic_data(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir, compact, shared_dataset_dir)
+
+    return read_data(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir, compact)
+
+
+def shared_basic_data(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir, compact, shared_dataset_dir, attach_only=False) -> tuple:
+    """
+    The frames of read_data through shared_frames, published once per version of the input files and loading options.
+
+    Args:
+        attach_only (bool): Only map a dataset published before, e.g. by the parent of worker processes.
+    """
+    frames = shared_frames(
+        "basic_data",
+        basic_data_files(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir),
+        None if attach_only else lambda: dict(zip(BASIC_DATA_FRAMES, read_data(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir, compact))),
+        shared_dataset_dir,
+        compact=compact,
+        layout=COMPACT_LAYOUT,
+    )
+    return tuple(frames[name] for name in BASIC_DATA_FRAMES)
+
+
+def basic_data_files(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir=None) -> list:
+    """
+    Files the frames of load_data are read from: the four input files and, when it exists, the partitions of the insertion store that replaces the insertion CSVs.
+
+    Data derived from these frames should be fingerprinted with this list, so
+    that rebuilding the store publishes a new version.
+    """
+    return [insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, *insertion_store_files(insertion_store_dir)]
+
+
+def read_data(insertion_LFCs_file, gene_level_LFCs_file, insertion_annotations_file, timepoint_file, insertion_store_dir=None, compact=True):
+    """
+    The frames of load_data, read without any caching or sharing.
+    """
+
+    # the store is compact-only: float32 statistics cannot be converted back to the CSV values
+    if compact and insertion_store_dir is not None and insertion_store_exists(insertion_store_dir):
+        insertion_LFCs, insertion_annotations = load_insertion_store(insertion_store_dir)
+    else:
+        insertion_LFCs = pd.read_csv(insertion_LFCs_file, index_col=[0, 1, 2, 3], header=[0, 1]).reorder_levels([1, 0], axis=1)
+        insertion_annotations = pd.read_csv(insertion_annotations_file, index_col=[0, 1, 2, 3], header=0)
     gene_level_LFCs = pd.read_csv(gene_level_LFCs_file, index_col=0, header=0)
-    insertion_annotations = pd.read_csv(insertion_annotations_file, index_col=[0, 1, 2, 3], header=0)
     timepoints = pd.read_csv(timepoint_file, index_col=0, header=0).mean(axis=1).sort_values()
 
+    if compact:
+        insertion_LFCs = compact_insertion_LFCs(insertion_LFCs)
+        insertion_annotations = compact_insertion_annotations(insertion_annotations)
+        gene_level_LFCs = compact_gene_level_LFCs(gene_level_LFCs)
+
     return insertion_LFCs, gene_level_LFCs, insertion_annotations, timepoints
 
 
-@st.cache_data
-def load_additional_info(gene_description_file: str, gene_essentiality_file: str, genome_region_file: str) -> tuple:
+@st.cache_resource
+def load_additional_info(gene_description_file: str, gene_essentiality_file: str, genome_region_file: str, shared_dataset_dir: str = None) -> tuple:
     """
     Load and process additional information from various files.
 
+    The frames are shared by all sessions of the server process and must not
+    be modified in place. With shared_dataset_dir, they are also shared
+    across processes as in load_data.
+
     Args:
         gene_description_file (str): Path to the gene description TSV file.
         gene_essentiality_file (str): Path to the gene essentiality Excel file.
         genome_region_file (str): Path to the genome region TSV file.
+        shared_dataset_dir (str): Directory of the shared datasets (optional).
 
     Returns:
         tuple: A tuple containing two pandas DataFrames:
             - merged_gene_info: DataFrame with merged gene information.
             - genome_regions: DataFrame with genome region information.
     """
+    if shared_dataset_dir is not None:
+        frames = shared_frames(
+            "additional_info",
+            [gene_description_file, gene_essentiality_file, genome_region_file],
+            lambda: dict(zip(ADDITIONAL_INFO_FRAMES, read_additional_info(gene_description_file, gene_essentiality_file, genome_region_file))),
+            shared_dataset_dir,
+        )
+        return tuple(frames[name] for name in ADDITIONAL_INFO_FRAMES)
+
+    return read_additional_info(gene_description_file, gene_essentiality_file, genome_region_file)
+
+
+def read_additional_info(gene_description_file, gene_essentiality_file, genome_region_file):
+    """
+    The frames of load_additional_info, read without any caching or sharing.
+    """
+
     # Load gene descriptions
     gene_info = pd.read_csv(gene_description_file, sep="\t")[
         ["gene_systematic_id", "gene_name", "gene_product", "synonyms"]]
@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from src.result_cache import file_fingerprint
+
+# Bump when the layout of the snapshot changes
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotTerm(NamedTuple):
+    """
+    The attributes of a goatools GOTerm used by the enrichment code.
+    """
+    id: str
+    name: str
+    namespace: str
+    depth: int
+
+
+class SnapshotDAG:
+    """
+    Read-only ontology DAG backed by the arrays of a snapshot.
+
+    Supports the mapping interface of goatools' GODag used for enrichment
+    (``goid in dag``, ``dag[goid].id/.name/.namespace/.depth``), with
+    alternative IDs resolving to their main term, plus CSR arrays of the
+    is_a parents, the is_a ancestors and the other relationships.
+    """
+
+    def __init__(self, arrays):
+        self.ids = arrays["term_ids"]
+        self.names = arrays["term_names"]
+        self.namespaces = arrays["term_namespaces"]
+        self.depths = arrays["term_depths"]
+        self.parent_indptr, self.parent_indices = arrays["parent_indptr"], arrays["parent_indices"]
+        self.ancestor_indptr, self.ancestor_indices = arrays["ancestor_indptr"], arrays["ancestor_indices"]
+        self.relationship_types = arrays["relationship_types"]
+        self.relationship_edges = arrays["relationship_edges"]
+
+        ids = self.ids.tolist()
+        self.index = dict(zip(ids, range(len(ids))))
+        self.index.update(zip(arrays["alt_ids"].tolist(), arrays["alt_id_terms"].tolist()))
+        self._ids = ids
+        self._names = self.names.tolist()
+        self._namespaces = self.namespaces.tolist()
+        self._depths = self.depths.tolist()
+
+    def __contains__(self, goid):
+        return goid in self.index
+
+    def __getitem__(self, goid):
+        idx = self.index[goid]
+        return SnapshotTerm(self._ids[idx], self._names[idx], self._namespaces[idx], self._depths[idx])
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def parent_edges(self, relationships=()):
+        """
+        (child, parent) term ID pairs of the is_a edges and of the given relationships.
+        """
+        children = np.repeat(np.arange(len(self._ids)), np.diff(self.parent_indptr))
+        parents = self.parent_indices
+        relationship_codes = [code for code, rel in enumerate(self.relationship_types.tolist()) if rel in relationships]
+        selected = np.isin(self.relationship_edges[:, 2], relationship_codes)
+        children = np.concatenate([children, self.relationship_edges[selected, 0]])
+        parents = np.concatenate([parents, self.relationship_edges[selected, 1]])
+        return self.ids[children], self.ids[parents]
+
+
+def snapshot_key(obo_file, gaf_file) -> str:
+    content = f"{SNAPSHOT_VERSION}:{file_fingerprint(obo_file)}:{file_fingerprint(gaf_file)}"
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def _csr(lists):
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(items) for items in lists])
+    indices = np.fromiter((item for items in lists for item in items), dtype=np.int32, count=indptr[-1])
+    return indptr, indices
+
+
+def compile_ontology_snapshot(obo_file, gaf_file, snapshot_dir) -> Path:
+    """
+    Parse the OBO and GAF files with goatools once and store the DAG and the
+    ns -> gene -> term associations as arrays in snapshot_dir.
+
+    Returns:
+        Path: The snapshot file, named by the hash of both source files.
+    """
+    from goatools.obo_parser import GODag
+    from goatools.anno.gaf_reader import GafReader
+
+    godag = GODag(str(obo_file), optional_attrs=["defn", "relationship"])
+    objanno = GafReader(gaf_file, godag=godag)
+    ns2assoc = objanno.get_ns2assc()
+
+    terms = sorted({term for term in godag.values()}, key=lambda term: term.id)
+    term_index = {term.id: idx for idx, term in enumerate(terms)}
+    alt_ids = sorted(goid for goid, term in godag.items() if goid != term.id)
+
+    parent_indptr, parent_indices = _csr([sorted(term_index[parent.id] for parent in term.parents) for term in terms])
+    ancestor_indptr, ancestor_indices = _csr([sorted(term_index[goid] for goid in term.get_all_parents()) for term in terms])
+
+    relationship_types = sorted({rel for term in terms for rel in getattr(term, "relationship", {})})
+    relationship_edges = np.array([
+        (term_index[term.id], term_index[target.id], relationship_types.index(rel))
+        for term in terms
+        for rel, targets in getattr(term, "relationship", {}).items()
+        for target in targets
+    ], dtype=np.int32).reshape(-1, 3)
+
+    namespaces = sorted(ns2assoc)
+    associations = [
+        (ns_idx, gene, goid)
+        for ns_idx, ns in enumerate(namespaces)
+        for gene, goids in ns2assoc[ns].items()
+        for goid in goids
+    ]
+
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    snapshot_file = snapshot_dir / f"{snapshot_key(obo_file, gaf_file)}.npz"
+    # a unique temporary file, so that processes compiling the same snapshot do not write to the same file
+    with tempfile.NamedTemporaryFile(dir=snapshot_dir, prefix=f"{snapshot_file.stem}.", suffix=".tmp.npz", delete=False) as tmp:
+        tmp_file = Path(tmp.name)
+    try:
+        np.savez(
+            tmp_file,
+            term_ids=np.array([term.id for term in terms], dtype=str),
+            term_names=np.array([term.name for term in terms], dtype=str),
+            term_namespaces=np.array([term.namespace for term in terms], dtype=str),
+            term_depths=np.array([term.depth for term in terms], dtype=np.int32),
+            alt_ids=np.array(alt_ids, dtype=str),
+            alt_id_terms=np.array([term_index[godag[goid].id] for goid in alt_ids], dtype=np.int64),
+            parent_indptr=parent_indptr,
+            parent_indices=parent_indices,
+            ancestor_indptr=ancestor_indptr,
+            ancestor_indices=ancestor_indices,
+            relationship_types=np.array(relationship_types, dtype=str),
+            relationship_edges=relationship_edges,
+            assoc_namespaces=np.array(namespaces, dtype=str),
+            assoc_ns=np.array([ns_idx for ns_idx, _, _ in associations], dtype=np.int8),
+            assoc_genes=np.array([gene for _, gene, _ in associations], dtype=str),
+            assoc_terms=np.array([goid for _, _, goid in associations], dtype=str),
+        )
+        tmp_file.replace(snapshot_file)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+
+    return snapshot_file
+
+
+def load_ontology_snapshot(snapshot_file) -> tuple:
+    """
+    Load a snapshot written by compile_ontology_snapshot.
+
+    Returns:
+        tuple: (SnapshotDAG, ns2assoc), interchangeable with the output of load_GO_data.
+    """
+    with np.load(snapshot_file, allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+
+    godag = SnapshotDAG(arrays)
+
+    ns2assoc = {}
+    namespaces = arrays["assoc_namespaces"].tolist()
+    for ns_idx, gene, goid in zip(arrays["assoc_ns"].tolist(), arrays["assoc_genes"].tolist(), arrays["assoc_terms"].tolist()):
+        ns2assoc.setdefault(namespaces[ns_idx], {}).setdefault(gene, set()).add(goid)
+
+    return godag, ns2assoc
+
+
+def load_or_compile_snapshot(obo_file, gaf_file, snapshot_dir) -> tuple:
+    """
+    Load the snapshot of the current OBO and GAF files, compiling it first if it does not exist yet.
+    """
+    snapshot_file = Path(snapshot_dir) / f"{snapshot_key(obo_file, gaf_file)}.npz"
+    if not snapshot_file.exists():
+        snapshot_file = compile_ontology_snapshot(obo_file, gaf_file, snapshot_dir)
+    return load_ontology_snapshot(snapshot_file)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compile OBO and GAF files into a binary ontology snapshot.")
+    parser.add_argument(
+        "--obo",
+        dest="obo_file",
+        required=True,
+        type=Path,
+        help="OBO file of the ontology",
+    )
+    parser.add_argument(
+        "--gaf",
+        dest="gaf_file",
+        required=True,
+        type=Path,
+        help="GAF file of the associations",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="snapshot_dir",
+        required=True,
+        type=Path,
+        help="Output folder of the snapshots",
+    )
+
+    args = parser.parse_args()
+
+    print(compile_ontology_snapshot(args.obo_file, args.gaf_file, args.snapshot_dir))
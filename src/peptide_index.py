@@ -0,0 +1,213 @@
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Columns of a samtools faidx index
+FAI_COLUMNS = ["name", "length", "offset", "linebases", "linewidth"]
+# Residues shown on each side of the affected residue
+DEFAULT_FLANK = 7
+MISSING_RESIDUE = ord("-")
+
+
+def build_fasta_index(fasta_file) -> pd.DataFrame:
+    """
+    faidx index of a FASTA file, computed from the newline positions of the memory-mapped file.
+
+    As with samtools faidx, every sequence line but the last of a record is
+    assumed to have the same length.
+
+    Returns:
+        pd.DataFrame: FAI_COLUMNS, one row per record in file order.
+    """
+    data = np.memmap(fasta_file, dtype=np.uint8, mode="r")
+    line_ends = np.flatnonzero(data == ord("\n"))
+    if len(line_ends) == 0 or line_ends[-1] != len(data) - 1:
+        line_ends = np.append(line_ends, len(data))
+    line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+    line_lengths = line_ends - line_starts
+
+    headers = np.flatnonzero(data[np.minimum(line_starts, len(data) - 1)] == ord(">"))
+    first_lines = headers + 1
+    has_sequence = first_lines < np.append(headers[1:], len(line_starts))
+    # bases per record: sum of the lengths of the lines between two headers
+    sequence_lengths = np.add.reduceat(np.where(np.isin(np.arange(len(line_starts)), headers), 0, line_lengths), headers)
+
+    names = [
+        bytes(data[line_starts[header] + 1:line_ends[header]]).decode().split()[0]
+        for header in headers
+    ]
+    first_lines = np.minimum(first_lines, len(line_starts) - 1)
+    return pd.DataFrame({
+        "name": names,
+        "length": sequence_lengths,
+        "offset": np.where(has_sequence, line_starts[first_lines], line_ends[headers] + 1),
+        "linebases": np.where(has_sequence, line_lengths[first_lines], 0),
+        "linewidth": np.where(has_sequence, line_lengths[first_lines] + 1, 0),
+    })
+
+
+def read_fasta_index(fai_file) -> pd.DataFrame:
+    return pd.read_csv(fai_file, sep="\t", header=None, names=FAI_COLUMNS, usecols=range(5))
+
+
+def write_fasta_index(fasta_index, fai_file):
+    fasta_index[FAI_COLUMNS].to_csv(fai_file, sep="\t", header=False, index=False)
+
+
+def load_fasta_index(fasta_file, fai_file=None) -> pd.DataFrame:
+    """
+    The faidx index next to the FASTA file (fasta_file + ".fai"), built and written when missing or older than the FASTA file.
+
+    The index is still returned when it cannot be written, e.g. on a read-only reference folder.
+    """
+    fasta_file = Path(fasta_file)
+    fai_file = Path(f"{fasta_file}.fai") if fai_file is None else Path(fai_file)
+    if fai_file.exists() and fai_file.stat().st_mtime >= fasta_file.stat().st_mtime:
+        return read_fasta_index(fai_file)
+    fasta_index = build_fasta_index(fasta_file)
+    try:
+        write_fasta_index(fasta_index, fai_file)
+    except OSError:
+        pass
+    return fasta_index
+
+
+class PeptideReader:
+    """
+    Random access to the sequences of peptide.fa through its faidx index and a memory map of the file.
+
+    A residue is read at a computed byte offset, so a lookup does not
+    depend on the size of the file, and only the pages holding the fetched
+    residues are read from disk. Records are found by their FASTA name
+    (e.g. SPAC1002.01.1:pep) or by the Systematic ID of their first
+    transcript (SPAC1002.01).
+
+    Args:
+        fasta_file (str): peptide.fa.
+        fai_file (str): faidx index, fasta_file + ".fai" by default.
+    """
+
+    def __init__(self, fasta_file, fai_file=None):
+        self.index = load_fasta_index(fasta_file, fai_file)
+        self._data = np.memmap(fasta_file, dtype=np.uint8, mode="r")
+        self._lengths = self.index["length"].to_numpy(dtype=np.int64)
+        self._offsets = self.index["offset"].to_numpy(dtype=np.int64)
+        self._linebases = np.maximum(self.index["linebases"].to_numpy(dtype=np.int64), 1)
+        self._linewidths = self.index["linewidth"].to_numpy(dtype=np.int64)
+
+        names = self.index["name"]
+        # SPAC1002.01.1:pep -> SPAC1002.01, first transcript of a gene wins
+        sysIDs = names.str.split(":").str[0].str.replace(r"\.\d+$", "", regex=True)
+        first_transcript = ~sysIDs.duplicated()
+        self._rows = pd.Index(sysIDs[first_transcript]).append(pd.Index(names))
+        self._row_numbers = np.concatenate([np.flatnonzero(first_transcript), np.arange(len(names))])
+
+    def _records(self, sysIDs):
+        positions = self._rows.get_indexer(sysIDs)
+        return np.where(positions >= 0, self._row_numbers[positions], -1)
+
+    def _byte_offsets(self, records, positions):
+        # positions are 0-based residues of each record
+        return self._offsets[records] + positions // self._linebases[records] * self._linewidths[records] + positions % self._linebases[records]
+
+    def length(self, sysID) -> int:
+        record = self._records([sysID])[0]
+        return int(self._lengths[record]) if record >= 0 else 0
+
+    def fetch(self, sysID, start, end) -> str:
+        """
+        Residues start to end (1-based, inclusive) of a peptide, clipped to its length.
+        """
+        record = self._records([sysID])[0]
+        if record < 0:
+            raise KeyError(f"{sysID} is not in the peptide index")
+        positions = np.arange(max(start, 1) - 1, min(end, self._lengths[record]))
+        return self._data[self._byte_offsets(np.full(len(positions), record), positions)].tobytes().decode()
+
+    def residue_windows(self, sysIDs, residues, flank=DEFAULT_FLANK) -> pd.DataFrame:
+        """
+        The affected residue and its flank residues on each side for many insertions at once.
+
+        All windows are read with a single gather from the memory map. In
+        Residue_context the affected residue is upper case and the flanks are
+        lower case; positions outside the peptide are "-".
+
+        Args:
+            sysIDs (array-like): Systematic ID of every insertion.
+            residues (array-like): Residue_affected of every insertion (1-based, truncated like assign_protein_domains).
+        Returns:
+            pd.DataFrame: Residue and Residue_context, NaN for insertions without a peptide or with a residue outside it.
+        """
+        residues = np.trunc(pd.to_numeric(pd.Series(residues), errors="coerce").to_numpy(dtype=np.float64))
+        records = self._records(pd.Index(sysIDs, dtype=object))
+        found = (records >= 0) & ~np.isnan(residues)
+        found[found] = (residues[found] >= 1) & (residues[found] <= self._lengths[records[found]])
+
+        positions = np.where(found, residues, 1).astype(np.int64)[:, None] - 1 + np.arange(-flank, flank + 1)
+        records = np.where(found, records, 0)[:, None]
+        inside = (positions >= 0) & (positions < self._lengths[records])
+        byte_offsets = self._byte_offsets(records, np.where(inside, positions, 0))
+        windows = np.where(inside, self._data[byte_offsets], MISSING_RESIDUE).astype(np.uint8)
+        # lower case flanks, the affected residue stays as in the FASTA file
+        flanks = np.ones(windows.shape[1], dtype=bool)
+        flanks[flank] = False
+        windows[:, flanks] = np.where(np.isin(windows[:, flanks], np.arange(ord("A"), ord("Z") + 1)), windows[:, flanks] | 0x20, windows[:, flanks])
+
+        contexts = np.ascontiguousarray(windows).view(f"S{windows.shape[1]}").ravel().astype(str).astype(object)
+        centers = windows[:, flank].view("S1").astype(str).astype(object)
+        return pd.DataFrame({
+            "Residue": np.where(found, centers, np.nan),
+            "Residue_context": np.where(found, contexts, np.nan),
+        })
+
+
+@st.cache_resource
+def load_peptide_reader(fasta_file, fai_file=None):
+    return PeptideReader(fasta_file, fai_file)
+
+
+def add_residue_context(insertion_annotations, peptides, flank=DEFAULT_FLANK) -> pd.DataFrame:
+    """
+    Residue and Residue_context of every insertion, indexed like insertion_annotations.
+    """
+    context = peptides.residue_windows(insertion_annotations["Systematic ID"].to_numpy(), insertion_annotations["Residue_affected"].to_numpy(), flank)
+    context.index = insertion_annotations.index
+    return context
+
+
+def main(args):
+
+    start = time.perf_counter()
+    fasta_index = build_fasta_index(args.fasta_file)
+    fai_file = Path(f"{args.fasta_file}.fai") if args.fai_file is None else args.fai_file
+    write_fasta_index(fasta_index, fai_file)
+    print(f"{len(fasta_index)} records indexed to {fai_file} in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Write the faidx index of a FASTA file, e.g. peptide.fa.")
+    parser.add_argument(
+        "-f",
+        "--fasta",
+        dest="fasta_file",
+        default=Path("./references/pombase_annotation/20241001/peptide.fa"),
+        type=Path,
+        help="FASTA file",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="fai_file",
+        default=None,
+        type=Path,
+        help="Index file, the FASTA file with .fai appended by default",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
@@ -55,3 +55,14 @@ def combine_plots(insertion_GMs, gene_level_GMs, insertion_last_tp):
 
     return alt.hconcat(insertion_curve_plot, YES4_plot).resolve_scale(x='independent', y="shared", size="shared")
 
+
+
+def feature_track_plot(gene_feature_summary):
+    # One row per database, features colored by the confidence-weighted mean M of their insertions
+    return alt.Chart(gene_feature_summary).mark_bar(height=12).encode(
+        x=alt.X("feature_start:Q", title="Residue"),
+        x2="feature_end:Q",
+        y=alt.Y("database:N", title=None),
+        color=alt.Color("weighted_mean_M:Q", title="Weighted mean M", scale=alt.Scale(scheme="redblue", domainMid=0, reverse=True), legend=alt.Legend(orient="top")),
+        tooltip=["feature_id", "database", "feature_start", "feature_end", "Timepoint", "insertions", "median_M", "weighted_mean_M"]
+    ).properties(height=alt.Step(16))
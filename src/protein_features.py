@@ -0,0 +1,246 @@
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from src.compact_frames import COMPACT_LAYOUT
+from src.curve_fitting import MIN_WEIGHT, padj_to_weights
+from src.shared_dataset import SHARED_DATASET_DIR, shared_frames
+
+DISORDER_DATABASE = "disorder"
+FEATURE_COLUMNS = ["feature", "Systematic ID", "database", "feature_id", "feature_start", "feature_end"]
+
+
+def read_protein_features(protein_feature_file, disordered_region_file) -> pd.DataFrame:
+    """
+    Protein features of ProteinFeatures.tsv and disordered_regions.tsv as one table of residue intervals.
+
+    Disordered regions get the database "disorder" and the feature_id
+    "disordered". Every interval gets a feature number, which the insertion
+    mapping and the summary refer to.
+
+    Returns:
+        pd.DataFrame: FEATURE_COLUMNS, sorted by Systematic ID and feature_start.
+    """
+    protein_features = pd.read_csv(protein_feature_file, sep="\t", header=0)
+    disordered_regions = pd.read_csv(disordered_region_file, sep="\t", header=0)
+    disordered_regions["database"] = DISORDER_DATABASE
+    disordered_regions["domain_id"] = "disordered"
+
+    features = pd.concat([protein_features, disordered_regions], ignore_index=True).rename(columns={
+        "systematic_id": "Systematic ID",
+        "domain_id": "feature_id",
+        "seq_start": "feature_start",
+        "seq_end": "feature_end",
+    })
+    features = features.dropna(subset=["Systematic ID", "feature_start", "feature_end"])
+    features = features.sort_values(["Systematic ID", "feature_start", "feature_end"], kind="stable", ignore_index=True)
+    features["feature"] = np.arange(len(features))
+    features[["feature_start", "feature_end"]] = features[["feature_start", "feature_end"]].astype(np.int64)
+    return features[FEATURE_COLUMNS]
+
+
+def map_insertions_to_features(insertion_annotations, features) -> pd.DataFrame:
+    """
+    Join the insertions with every feature interval of their gene containing the affected residue.
+
+    Like assign_protein_domains, but an insertion is kept for all the
+    overlapping features (a PFAM domain, its PANTHER family and a
+    disordered region can share residues), not only the first one. Only
+    insertions kept by get_insertions_in_genes (Distance_to_stop_codon > 4)
+    are mapped.
+
+    Returns:
+        pd.DataFrame: One row per (insertion, feature) pair with the insertion row number in insertion_annotations and the feature number.
+    """
+    residues = np.trunc(pd.to_numeric(insertion_annotations["Residue_affected"], errors="coerce").to_numpy(dtype=np.float64))
+    kept = (
+        insertion_annotations["Systematic ID"].notna().to_numpy()
+        & (insertion_annotations["Distance_to_stop_codon"].to_numpy(dtype=np.float64) > 4)
+        & ~np.isnan(residues)
+    )
+    insertions = pd.DataFrame({
+        "row": np.flatnonzero(kept),
+        "Systematic ID": insertion_annotations["Systematic ID"].to_numpy()[kept],
+        "residue": residues[kept],
+    })
+
+    candidates = insertions.merge(features[["feature", "Systematic ID", "feature_start", "feature_end"]], on="Systematic ID", how="inner")
+    hits = (candidates["residue"] >= candidates["feature_start"]) & (candidates["residue"] <= candidates["feature_end"])
+    return candidates.loc[hits, ["row", "feature"]].reset_index(drop=True)
+
+
+def summarize_features(insertion_annotations, insertion_LFCs, timepoints, features, min_weight=MIN_WEIGHT) -> pd.DataFrame:
+    """
+    Median M, number of insertions and confidence-weighted mean M of every feature at every timepoint.
+
+    The confidence of an insertion is -log10(padj) with a floor of
+    min_weight, like the point sizes of plot_insertion.
+
+    Returns:
+        pd.DataFrame: One row per feature with insertions and timepoint, with FEATURE_COLUMNS, Timepoint, insertions, median_M and weighted_mean_M.
+    """
+    tps = [tp for tp in timepoints.index if tp in insertion_LFCs["log2FoldChange"].columns]
+    annotations = insertion_annotations[insertion_annotations.index.isin(insertion_LFCs.index)]
+    pairs = map_insertions_to_features(annotations, features)
+
+    LFCs = insertion_LFCs.loc[annotations.index]
+    Ms = LFCs["log2FoldChange"][tps].to_numpy(dtype=np.float64)[pairs["row"].to_numpy()]
+    weights = np.maximum(padj_to_weights(LFCs["padj"][tps].to_numpy(dtype=np.float64)), min_weight)[pairs["row"].to_numpy()]
+
+    # long table of (feature, timepoint) values, aggregated with one groupby
+    long = pd.DataFrame({
+        "feature": np.repeat(pairs["feature"].to_numpy(), len(tps)),
+        "Timepoint": np.tile(np.arange(len(tps)), len(pairs)),
+        "M": Ms.ravel(),
+        "weights": weights.ravel(),
+    }).dropna(subset=["M", "weights"])
+    long["weighted_M"] = long["M"] * long["weights"]
+    grouped = long.groupby(["feature", "Timepoint"], sort=True)
+    summary = pd.DataFrame({
+        "insertions": grouped["M"].size(),
+        "median_M": grouped["M"].median(),
+        "weighted_mean_M": grouped["weighted_M"].sum() / grouped["weights"].sum(),
+    }).reset_index()
+    summary["Timepoint"] = pd.Categorical.from_codes(summary["Timepoint"].to_numpy(), categories=tps)
+
+    # sorted by gene, so that the features of a gene are one slice (see feature_summary_offsets)
+    return features.merge(summary, on="feature", how="inner").sort_values(["Systematic ID", "feature", "Timepoint"], kind="stable", ignore_index=True)
+
+
+def build_feature_summary(protein_feature_file, disordered_region_file, insertion_annotations, insertion_LFCs, timepoints) -> dict:
+    features = read_protein_features(protein_feature_file, disordered_region_file)
+    return {
+        "features": features,
+        "feature_summary": summarize_features(insertion_annotations, insertion_LFCs, timepoints, features),
+    }
+
+
+@st.cache_resource
+def load_feature_summary(protein_feature_file, disordered_region_file, _insertion_annotations, _insertion_LFCs, _timepoints, source_files, feature_summary_dir=SHARED_DATASET_DIR):
+    """
+    Protein features and their insertion summary, computed once per version of the input files and memory-mapped afterwards.
+
+    Args:
+        source_files (tuple): Files the insertion frames were loaded from, which identify the summary on disk with the feature files.
+    Returns:
+        tuple: (features, feature_summary, gene_offsets), gene_offsets from feature_summary_offsets.
+    """
+    frames = shared_frames(
+        "feature_summary", [protein_feature_file, disordered_region_file, *source_files],
+        lambda: build_feature_summary(protein_feature_file, disordered_region_file, _insertion_annotations, _insertion_LFCs, _timepoints),
+        feature_summary_dir, layout=COMPACT_LAYOUT,
+    )
+    return frames["features"], frames["feature_summary"], feature_summary_offsets(frames["feature_summary"])
+
+
+def feature_summary_offsets(feature_summary) -> dict:
+    """
+    Systematic ID to the (start, stop) rows of its features in the summary, which is sorted by Systematic ID.
+    """
+    sysIDs, starts, counts = np.unique(feature_summary["Systematic ID"].to_numpy(dtype=object), return_index=True, return_counts=True)
+    return {sysID: (start, start + count) for sysID, start, count in zip(sysIDs, starts, counts)}
+
+
+def gene_feature_summary(feature_summary, gene_offsets, sysID, timepoint=None) -> pd.DataFrame:
+    """
+    Summary rows of the features of a gene, at one timepoint or at all of them.
+    """
+    gene_summary = feature_summary.iloc[slice(*gene_offsets.get(sysID, (0, 0)))]
+    if timepoint is not None:
+        gene_summary = gene_summary[gene_summary["Timepoint"] == timepoint]
+    return gene_summary
+
+
+def main(args):
+
+    from src.load_basic_data import read_data
+
+    start = time.perf_counter()
+    insertion_LFCs, _, insertion_annotations, timepoints = read_data(
+        args.insertion_LFCs_file, args.gene_level_LFCs_file, args.insertion_annotations_file, args.timepoint_file, args.insertion_store_dir
+    )
+    print(f"load: {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    frames = build_feature_summary(args.protein_feature_file, args.disordered_region_file, insertion_annotations, insertion_LFCs, timepoints)
+    print(f"{frames['feature_summary']['feature'].nunique()} of {len(frames['features'])} features summarized in {time.perf_counter() - start:.2f} s")
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    for name, frame in frames.items():
+        frame.to_parquet(args.output / f"{name}.parquet", index=False)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Summarize the insertion LFCs in every protein feature and disordered region.")
+    parser.add_argument(
+        "-l",
+        "--insertion-LFCs",
+        dest="insertion_LFCs_file",
+        default=Path("./data/0_raw/insertions_LFC.csv"),
+        type=Path,
+        help="File of insertion LFCs",
+    )
+    parser.add_argument(
+        "-g",
+        "--gene-level-LFCs",
+        dest="gene_level_LFCs_file",
+        default=Path("./data/0_raw/GWMs.csv"),
+        type=Path,
+        help="File of gene-level LFCs",
+    )
+    parser.add_argument(
+        "-a",
+        "--insertion-annotations",
+        dest="insertion_annotations_file",
+        default=Path("./data/0_raw/DIT_HAP_20241001.annotated.csv"),
+        type=Path,
+        help="File of insertion annotations",
+    )
+    parser.add_argument(
+        "-t",
+        "--timepoints",
+        dest="timepoint_file",
+        default=Path("./data/0_raw/samples_timepoints.csv"),
+        type=Path,
+        help="File of sample timepoints",
+    )
+    parser.add_argument(
+        "--store",
+        dest="insertion_store_dir",
+        default=Path("./data/1_insertion_store"),
+        type=Path,
+        help="Columnar insertion store, used when it exists",
+    )
+    parser.add_argument(
+        "-f",
+        "--protein-features",
+        dest="protein_feature_file",
+        default=Path("./references/pombase_annotation/20241001/ProteinFeatures.tsv"),
+        type=Path,
+        help="PomBase protein features",
+    )
+    parser.add_argument(
+        "-r",
+        "--disordered-regions",
+        dest="disordered_region_file",
+        default=Path("./references/pombase_annotation/20241001/disordered_regions.tsv"),
+        type=Path,
+        help="PomBase disordered regions",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        required=True,
+        type=Path,
+        help="Output folder of features.parquet and feature_summary.parquet",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,246 @@
+import argparse
+import html
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import altair as alt
+import pandas as pd
+
+from src.extract_DIT_HAP_data import build_gene_insertion_index, get_insertions_in_gene_list
+from src.load_basic_data import read_data, shared_basic_data
+from src.plot_insertion import combine_plots
+
+FORMATS = ["html", "json"]
+# Genes rendered so far, appended after every finished block so that an interrupted run can resume
+RENDER_LOG = "render_log.csv"
+INDEX_PAGE = "index.html"
+
+# Frames and gene index of the worker processes
+_gene_level_LFCs = None
+_timepoints = None
+_gene_index = None
+
+
+def _attach(data_args, shared_dataset_dir):
+    global _gene_level_LFCs, _timepoints, _gene_index
+    if shared_dataset_dir is not None:
+        # published by main before the pool starts, every worker maps the same files
+        insertion_LFCs, _gene_level_LFCs, insertion_annotations, _timepoints = shared_basic_data(*data_args, shared_dataset_dir, attach_only=True)
+    else:
+        insertion_LFCs, _gene_level_LFCs, insertion_annotations, _timepoints = read_data(*data_args)
+    _gene_index = build_gene_insertion_index(insertion_annotations, insertion_LFCs, dataset_key="|".join(map(str, data_args)))
+    # panels of genes with many insertions exceed altair's default limit of embedded rows
+    alt.data_transformers.disable_max_rows()
+    # combine_plots adds the same point selector to both panels, altair warns once per gene
+    warnings.filterwarnings("ignore", message="Automatically deduplicated selection parameter")
+
+
+def render_block(sysIDs, output_dir, fmt, inline=False):
+    """
+    Render the curve and insertion panels of a block of genes, one file per gene.
+
+    Files are written under a temporary name and renamed, so a file in
+    output_dir is always complete.
+
+    Returns:
+        list: One dict per gene with Systematic ID, insertions, file and status ("rendered" or "no data").
+    """
+    gene_insertions = get_insertions_in_gene_list(sysIDs, _gene_level_LFCs, _timepoints, _gene_index)
+    records = []
+    for sysID in sysIDs:
+        if sysID not in gene_insertions or len(gene_insertions[sysID][0]) == 0:
+            records.append({"Systematic ID": sysID, "insertions": 0, "file": "", "status": "no data"})
+            continue
+        insertion_GMs, gene_level_GMs, insertion_last_tp = gene_insertions[sysID]
+        chart = combine_plots(insertion_GMs, gene_level_GMs, insertion_last_tp).properties(title=sysID)
+
+        file = Path(output_dir) / f"{sysID}.{fmt}"
+        tmp_file = file.with_name(f".{file.name}.tmp")
+        if fmt == "html":
+            chart.save(tmp_file, format="html", inline=inline)
+        else:
+            tmp_file.write_text(chart.to_json())
+        os.replace(tmp_file, file)
+        records.append({"Systematic ID": sysID, "insertions": len(insertion_last_tp), "file": file.name, "status": "rendered"})
+    return records
+
+
+def read_render_log(output_dir):
+    """
+    Genes already handled by a previous run: rendered genes whose file exists and genes without data.
+    """
+    log_file = Path(output_dir) / RENDER_LOG
+    if not log_file.exists():
+        return pd.DataFrame(columns=["Systematic ID", "insertions", "file", "status"])
+    render_log = pd.read_csv(log_file, keep_default_na=False).drop_duplicates("Systematic ID", keep="last")
+    done = (render_log["status"] == "no data") | render_log["file"].map(lambda file: file != "" and (Path(output_dir) / file).exists())
+    return render_log[done]
+
+
+def write_index_page(render_log, gene_names, output_dir):
+    rows = []
+    for record in render_log.sort_values("Systematic ID").itertuples(index=False):
+        sysID, insertions, file, status = record
+        name = html.escape(str(gene_names.get(sysID, sysID)))
+        link = f'<a href="{html.escape(file)}">{html.escape(sysID)}</a>' if status == "rendered" else html.escape(sysID)
+        rows.append(f"<tr><td>{link}</td><td>{name}</td><td>{insertions}</td><td>{status}</td></tr>")
+    page = (
+        "<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>DIT-HAP gene panels</title></head>\n<body>\n"
+        f"<h1>DIT-HAP gene panels</h1>\n<p>{(render_log['status'] == 'rendered').sum()} genes rendered, "
+        f"{(render_log['status'] == 'no data').sum()} without insertion data.</p>\n"
+        "<table>\n<tr><th>Systematic ID</th><th>Name</th><th>Insertions</th><th>Status</th></tr>\n"
+        + "\n".join(rows) + "\n</table>\n</body>\n</html>\n"
+    )
+    (Path(output_dir) / INDEX_PAGE).write_text(page)
+
+
+def main(args):
+
+    data_args = (args.insertion_LFCs_file, args.gene_level_LFCs_file, args.insertion_annotations_file, args.timepoint_file, args.insertion_store_dir, True)
+    if args.shared_dataset_dir is not None:
+        shared_basic_data(*data_args, args.shared_dataset_dir)
+
+    gene_level_LFCs = pd.read_csv(args.gene_level_LFCs_file, index_col=0)
+    if args.genes == ["all"]:
+        sysIDs = gene_level_LFCs.index.tolist()
+    elif len(args.genes) == 1 and Path(args.genes[0]).is_file():
+        sysIDs = [line.strip() for line in Path(args.genes[0]).read_text().splitlines() if line.strip()]
+    else:
+        sysIDs = args.genes
+    sysIDs = list(dict.fromkeys(sysIDs))
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    log_file = args.output / RENDER_LOG
+    if args.overwrite and log_file.exists():
+        log_file.unlink()
+    render_log = read_render_log(args.output)
+    handled = set(render_log["Systematic ID"])
+    todo = [sysID for sysID in sysIDs if sysID not in handled]
+    print(f"{len(sysIDs)} genes, {len(sysIDs) - len(todo)} done by a previous run, {len(todo)} to render")
+
+    blocks = [todo[start:start + args.block_size] for start in range(0, len(todo), args.block_size)]
+    start = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_attach, initargs=(data_args, args.shared_dataset_dir)) as executor:
+        futures = [executor.submit(render_block, block, args.output, args.format, args.inline) for block in blocks]
+        for future in as_completed(futures):
+            records = pd.DataFrame(future.result())
+            records.to_csv(log_file, mode="a", header=not log_file.exists(), index=False)
+            render_log = pd.concat([render_log, records], ignore_index=True)
+            done += len(records)
+            elapsed = time.perf_counter() - start
+            print(f"{done}/{len(todo)} genes, {done / elapsed:.1f} genes/s, {(len(todo) - done) * elapsed / done:.0f} s left", flush=True)
+
+    write_index_page(render_log[render_log["Systematic ID"].isin(sysIDs)], gene_level_LFCs["Name"].to_dict(), args.output)
+    print(f"Index written to {args.output / INDEX_PAGE}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Render the curve and insertion panels of many genes to static files.")
+    parser.add_argument(
+        "-q",
+        "--genes",
+        dest="genes",
+        nargs="+",
+        default=["all"],
+        help="Systematic IDs, a file with one systematic ID per line, or all (every gene of the gene-level LFCs)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        required=True,
+        type=Path,
+        help="Output folder of the panels and the index page",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="format",
+        default="html",
+        choices=FORMATS,
+        help="html pages or Vega-Lite JSON specs",
+    )
+    parser.add_argument(
+        "--inline",
+        dest="inline",
+        action="store_true",
+        help="Embed the Vega libraries in every html page instead of loading them from a CDN (needs vl-convert-python)",
+    )
+    parser.add_argument(
+        "-l",
+        "--insertion-LFCs",
+        dest="insertion_LFCs_file",
+        default=Path("./data/0_raw/insertions_LFC.csv"),
+        type=Path,
+        help="File of insertion LFCs",
+    )
+    parser.add_argument(
+        "-g",
+        "--gene-level-LFCs",
+        dest="gene_level_LFCs_file",
+        default=Path("./data/0_raw/GWMs.csv"),
+        type=Path,
+        help="File of gene-level LFCs",
+    )
+    parser.add_argument(
+        "-a",
+        "--insertion-annotations",
+        dest="insertion_annotations_file",
+        default=Path("./data/0_raw/DIT_HAP_20241001.annotated.csv"),
+        type=Path,
+        help="File of insertion annotations",
+    )
+    parser.add_argument(
+        "-t",
+        "--timepoints",
+        dest="timepoint_file",
+        default=Path("./data/0_raw/samples_timepoints.csv"),
+        type=Path,
+        help="File of sample timepoints",
+    )
+    parser.add_argument(
+        "--store",
+        dest="insertion_store_dir",
+        default=Path("./data/1_insertion_store"),
+        type=Path,
+        help="Columnar insertion store, used when it exists",
+    )
+    parser.add_argument(
+        "-d",
+        "--shared-dataset-dir",
+        dest="shared_dataset_dir",
+        default=Path("./data/4_shared_dataset"),
+        type=Path,
+        help="Directory of the shared datasets mapped by the workers",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        default=os.cpu_count(),
+        type=int,
+        help="Rendering processes",
+    )
+    parser.add_argument(
+        "-b",
+        "--block-size",
+        dest="block_size",
+        default=25,
+        type=int,
+        help="Genes per task",
+    )
+    parser.add_argument(
+        "--overwrite",
+        dest="overwrite",
+        action="store_true",
+        help="Render every gene again instead of resuming",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
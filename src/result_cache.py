@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path, size, mtime_ns):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def file_fingerprint(path) -> str:
+    """
+    SHA-256 of a file's content, hashed again only when its size or modification time changes.
+    """
+    stat = os.stat(path)
+    return _file_digest(str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+
+
+def make_cache_key(name, query_genes, bg_genes, files=(), params=None) -> str:
+    """
+    Content address of an enrichment result.
+
+    Args:
+        name (str): Analysis name, e.g. "GOEA" or "STRING".
+        query_genes (list): Query genes (order does not matter).
+        bg_genes (list): Background genes (order does not matter).
+        files (list): Input files whose content the result depends on.
+        params (dict): Method parameters.
+    """
+    content = {
+        "name": name,
+        "query_genes": sorted(query_genes),
+        "bg_genes": sorted(bg_genes),
+        "files": [file_fingerprint(file) for file in files],
+        "params": params or {},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Disk-backed result cache with size-bounded LRU eviction.
+
+    Every entry is a pickle file named by its key. Reading an entry touches its
+    modification time, and the least recently used files are removed once the
+    directory grows beyond max_size_bytes. Entries are written atomically, so
+    several processes can share one cache directory.
+    """
+
+    def __init__(self, cache_dir, max_size_bytes=256 * 1024 ** 2):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.pkl"
+
+    def get(self, key, default=None, count=True):
+        """
+        The cached value of key, or default.
+
+        Args:
+            count (bool): Count the lookup in the hits and misses of stats(); off for bookkeeping entries such as the STRING version.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            if count:
+                with self._lock:
+                    self.misses += 1
+            return default
+        if count:
+            with self._lock:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def get_or_compute(self, key, compute, cache_if=None):
+        """
+        Return the cached value of key, or compute, store and return it.
+
+        Args:
+            key (str): Key from make_cache_key.
+            compute (callable): Called without arguments on a miss.
+            cache_if (callable): Only store values for which cache_if(value) is true, e.g. to skip failed requests.
+        """
+        _missing = object()
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = compute()
+            if cache_if is None or cache_if(value):
+                self.put(key, value)
+        return value
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "size_MB": round(sum(size for _, size, _ in entries) / 1024 ** 2, 2),
+        }
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from src.insertion_store import flatten_columns, restore_columns
+
+# Frames loaded by the pages are published here once and memory-mapped by
+# every server process and worker, so the page cache holds a single copy.
+SHARED_DATASET_DIR = "./data/4_shared_dataset"
+MANIFEST_FILE = "manifest.json"
+# Identifies the versions of a dataset that replace each other, see dataset_lineage
+LINEAGE_FILE = "lineage.txt"
+
+
+def dataset_fingerprint(source_files, **options) -> str:
+    """
+    Hash of the paths, sizes and modification times of the source files and of the loading options.
+
+    Missing files (e.g. a CSV replaced by the insertion store) only contribute their path.
+    """
+    sources = []
+    for file in source_files:
+        file = Path(file)
+        stat = file.stat() if file.exists() else None
+        sources.append([str(file.resolve()), stat and stat.st_size, stat and stat.st_mtime_ns])
+    key = json.dumps({"sources": sources, "options": options}, sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def dataset_lineage(dataset_name, source_files, **options) -> str:
+    """
+    Hash of the dataset name, the paths of the source files and the loading options.
+
+    Unlike dataset_fingerprint it ignores the file contents, so the versions
+    published as the same files are edited share a lineage, while datasets
+    built with other options or from other files do not.
+    """
+    key = json.dumps({"name": dataset_name, "sources": [str(Path(file).resolve()) for file in source_files], "options": options}, sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def publish_frames(frames: dict, dataset_path, lineage=None) -> Path:
+    """
+    Write named DataFrames or Series as uncompressed Arrow IPC files under dataset_path.
+
+    The files are written to a temporary directory that is renamed into
+    place, so a process attaching to dataset_path never sees a partial
+    dataset. When another process published the same dataset first, its
+    copy is kept. The directory gets the permissions of the umask, so that
+    the processes of other users can map it too.
+    """
+    dataset_path = Path(dataset_path)
+    dataset_path.parent.mkdir(parents=True, exist_ok=True)
+    # not tempfile.mkdtemp, whose directories are private to the user (0700)
+    tmp_path = dataset_path.parent / f".{dataset_path.name}-{uuid.uuid4().hex}"
+    tmp_path.mkdir()
+
+    manifest = {}
+    for name, frame in frames.items():
+        is_series = isinstance(frame, pd.Series)
+        manifest[name] = {"series": is_series, "series_name": frame.name if is_series else None}
+        df = frame.to_frame(name="values") if is_series else flatten_columns(frame)
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        # Uncompressed so the buffers can be memory-mapped without decoding
+        feather.write_feather(table, tmp_path / f"{name}.arrow", compression="uncompressed")
+    if lineage is not None:
+        (tmp_path / LINEAGE_FILE).write_text(lineage)
+    (tmp_path / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+
+    try:
+        os.rename(tmp_path, dataset_path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return dataset_path
+
+
+def attach_frames(dataset_path) -> dict:
+    """
+    Memory-map the frames written by publish_frames.
+
+    Numeric columns without missing values are views of the mapped files and
+    are read-only; indexes, categoricals and strings are rebuilt in the
+    calling process.
+    """
+    dataset_path = Path(dataset_path)
+    manifest = json.loads((dataset_path / MANIFEST_FILE).read_text())
+    frames = {}
+    for name, info in manifest.items():
+        table = feather.read_table(dataset_path / f"{name}.arrow", memory_map=True)
+        df = table.to_pandas(split_blocks=True)
+        frames[name] = df["values"].rename(info["series_name"]) if info["series"] else restore_columns(df)
+    return frames
+
+
+def shared_frames(dataset_name, source_files, build, dataset_dir=SHARED_DATASET_DIR, **options) -> dict:
+    """
+    Attach to the shared copy of a dataset, building and publishing it first if needed.
+
+    The dataset is identified by dataset_name and the fingerprint of its
+    source files and options, so editing a source file publishes a new
+    version. The older versions it replaces (same name, source paths and
+    options) are removed; processes still mapping them keep their pages until
+    they detach. Versions built with other options or from other files are
+    kept for their own callers.
+
+    Args:
+        dataset_name (str): Name of the dataset, e.g. "basic_data".
+        source_files (list): Files the dataset is built from.
+        build (callable): Returns a dict of named DataFrames or Series; None
+            to only attach to a dataset published before, e.g. by the parent
+            of worker processes.
+        dataset_dir (str): Parent directory of the published datasets.
+        options: Loading options that change the frames, part of the fingerprint.
+    Returns:
+        dict: The frames returned by build, memory-mapped.
+    """
+    dataset_dir = Path(dataset_dir)
+    dataset_path = dataset_dir / f"{dataset_name}-{dataset_fingerprint(source_files, **options)}"
+
+    if not (dataset_path / MANIFEST_FILE).exists():
+        if build is None:
+            raise FileNotFoundError(f"{dataset_path} is not published; publish it with a build function before attaching to it")
+        lineage = dataset_lineage(dataset_name, source_files, **options)
+        publish_frames(build(), dataset_path, lineage)
+        remove_older_versions(dataset_dir, dataset_name, dataset_path, lineage)
+
+    return attach_frames(dataset_path)
+
+
+def remove_older_versions(dataset_dir, dataset_name, dataset_path, lineage):
+    """
+    Remove the versions of the same lineage published before dataset_path.
+    """
+    published = (dataset_path / MANIFEST_FILE).stat().st_mtime_ns
+    for old_path in Path(dataset_dir).glob(f"{dataset_name}-*"):
+        if old_path == dataset_path or not (old_path / LINEAGE_FILE).exists():
+            continue
+        try:
+            if (old_path / LINEAGE_FILE).read_text() == lineage and (old_path / MANIFEST_FILE).stat().st_mtime_ns < published:
+                shutil.rmtree(old_path, ignore_errors=True)
+        except OSError:
+            # removed by another process meanwhile
+            continue
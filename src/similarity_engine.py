@@ -0,0 +1,152 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+TIMEPOINTS = ["YES0", "YES1", "YES2", "YES3", "YES4"]
+METRICS = ["custom", "euclidean", "correlation"]
+# Confidence (-log10 pvalue, capped at 10 as in get_depletion_curve_data) giving full weight
+MAX_CONFIDENCE = 10
+# Weight of a timepoint without any evidence of depletion, so that it still counts
+MIN_WEIGHT = 0.1
+
+
+class SimilarityIndex(NamedTuple):
+    """
+    Depletion curves of all genes with their per-timepoint weights, ready for vectorized distances.
+
+    For weights W and LFCs X, the products W*X and W*X**2 are precomputed
+    once, with and without the p-value weights (weighted=True/False).
+    """
+    genes: np.ndarray
+    gene_index: dict
+    LFCs: np.ndarray
+    weights: dict
+    weighted_LFCs: dict
+    weighted_squares: dict
+
+
+def build_similarity_index(GWMs) -> SimilarityIndex:
+    """
+    Args:
+        GWMs (pd.DataFrame): Genes x YES0..YES4 LFCs and YES0_pvalue..YES4_pvalue, as in GWMs.csv.
+    """
+    LFCs = GWMs[TIMEPOINTS].to_numpy(dtype=np.float64)
+    pvalues = GWMs[[f"{timepoint}_pvalue" for timepoint in TIMEPOINTS]].to_numpy(dtype=np.float64)
+    confidence = -np.log10(np.clip(pvalues, 10.0 ** -MAX_CONFIDENCE, 1))
+
+    weights = {
+        True: np.clip(confidence / MAX_CONFIDENCE, MIN_WEIGHT, 1),
+        False: np.ones_like(LFCs),
+    }
+    genes = GWMs.index.to_numpy()
+    return SimilarityIndex(
+        genes=genes,
+        gene_index={gene: idx for idx, gene in enumerate(genes)},
+        LFCs=LFCs,
+        weights=weights,
+        weighted_LFCs={weighted: W * LFCs for weighted, W in weights.items()},
+        weighted_squares={weighted: W * LFCs ** 2 for weighted, W in weights.items()},
+    )
+
+
+@st.cache_resource
+def load_similarity_index(GWMs_file):
+    return build_similarity_index(pd.read_csv(GWMs_file, index_col=0))
+
+
+def pairwise_distances(index, rows_a, rows_b, metric="custom", weighted=True):
+    """
+    Distances between the curves of two sets of genes (rows of the index).
+
+    Timepoint t of genes a and b is weighted by w_at * w_bt, so every sum
+    below is a (len(rows_a) x 5) @ (5 x len(rows_b)) product of precomputed
+    matrices. Without weights they reduce to the plain metrics.
+
+    - "euclidean": sqrt(T * weighted mean of (x_a - x_b)**2), the Euclidean
+      distance when unweighted.
+    - "correlation": 1 - weighted Pearson correlation of the two curves.
+    - "custom": the p-value weighted Euclidean distance, whatever weighted
+      is. The script that produced the shipped clustered_GWMs_customed_distance
+      files is not in the repository, so this is the reconstruction used from
+      here on, including by src/cluster_GWMs.py.
+
+    Returns:
+        np.ndarray: len(rows_a) x len(rows_b) distances.
+    """
+    if metric == "custom":
+        metric, weighted = "euclidean", True
+    W, WX, WX2 = index.weights[weighted], index.weighted_LFCs[weighted], index.weighted_squares[weighted]
+
+    sum_w = W[rows_a] @ W[rows_b].T
+    sum_xx_a = WX2[rows_a] @ W[rows_b].T / sum_w
+    sum_xx_b = W[rows_a] @ WX2[rows_b].T / sum_w
+    sum_ab = WX[rows_a] @ WX[rows_b].T / sum_w
+
+    if metric == "euclidean":
+        n_timepoints = W.shape[1]
+        return np.sqrt(np.maximum(n_timepoints * (sum_xx_a + sum_xx_b - 2 * sum_ab), 0))
+    if metric == "correlation":
+        mean_a = WX[rows_a] @ W[rows_b].T / sum_w
+        mean_b = W[rows_a] @ WX[rows_b].T / sum_w
+        covariance = sum_ab - mean_a * mean_b
+        variance = np.maximum(sum_xx_a - mean_a ** 2, 0) * np.maximum(sum_xx_b - mean_b ** 2, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation = np.where(variance > 0, covariance / np.sqrt(variance), 0)
+        return 1 - np.clip(correlation, -1, 1)
+    raise ValueError(f"`metric` should be one of {METRICS}")
+
+
+def top_k_neighbours(index, query_genes, k=10, metric="custom", weighted=True, block_size=2048, include_self=False):
+    """
+    The k genes with the closest depletion curves to each query gene.
+
+    Queries and candidates are both taken in blocks of block_size genes and
+    only the running top k per query is kept, so memory stays at
+    block_size x (k + block_size) distances.
+
+    Returns:
+        pd.DataFrame: Query, rank, Neighbour and distance, k rows per query gene found in the index.
+    """
+    query_genes = [gene for gene in query_genes if gene in index.gene_index]
+    query_rows = np.array([index.gene_index[gene] for gene in query_genes], dtype=np.int64)
+    k = min(k, len(index.genes) - (0 if include_self else 1))
+    if len(query_rows) == 0 or k <= 0:
+        return pd.DataFrame(columns=["Query", "rank", "Neighbour", "distance"])
+
+    best_rows, best_distances = zip(*[
+        _top_k_block(index, query_rows[start:start + block_size], k, metric, weighted, block_size, include_self)
+        for start in range(0, len(query_rows), block_size)
+    ])
+    best_rows, best_distances = np.concatenate(best_rows), np.concatenate(best_distances)
+
+    return pd.DataFrame({
+        "Query": np.repeat(query_genes, k),
+        "rank": np.tile(np.arange(1, k + 1), len(query_genes)),
+        "Neighbour": index.genes[best_rows.ravel()],
+        "distance": best_distances.ravel(),
+    })
+
+
+def _top_k_block(index, query_rows, k, metric, weighted, block_size, include_self):
+    n_genes = len(index.genes)
+    best_distances = np.full((len(query_rows), 0), np.inf)
+    best_rows = np.empty((len(query_rows), 0), dtype=np.int64)
+    for start in range(0, n_genes, block_size):
+        block_rows = np.arange(start, min(start + block_size, n_genes))
+        distances = pairwise_distances(index, query_rows, block_rows, metric, weighted)
+        if not include_self:
+            distances[query_rows[:, None] == block_rows[None, :]] = np.inf
+
+        distances = np.concatenate([best_distances, distances], axis=1)
+        rows = np.concatenate([best_rows, np.broadcast_to(block_rows, (len(query_rows), len(block_rows)))], axis=1)
+        keep = np.argpartition(distances, k - 1, axis=1)[:, :k] if distances.shape[1] > k else np.argsort(distances, axis=1)
+        best_distances = np.take_along_axis(distances, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+
+    order = np.argsort(best_distances, axis=1, kind="stable")
+    best_distances = np.take_along_axis(best_distances, order, axis=1)
+    best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+    return best_rows, best_distances
@@ -0,0 +1,185 @@
+import hashlib
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.result_cache import make_cache_key
+
+STRING_BASE_URL = "https://string-db.org"
+# Schizosaccharomyces pombe
+STRING_SPECIES = 4896
+CALLER_IDENTITY = "DIT_HAP_visualization"
+
+
+def request_fingerprint(method, data) -> str:
+    """
+    Identity of a STRING API call (method and form fields), shared with the stub server's recordings.
+    """
+    content = json.dumps([method, sorted((str(k), str(v)) for k, v in data.items())])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class StringResponseError(requests.RequestException):
+    """
+    A STRING response that is not in the expected format, e.g. an HTML error or maintenance page.
+    """
+
+
+def parse_version(text):
+    """
+    Parse the TSV of the version method into (string_version, stable_address).
+
+    Raises:
+        StringResponseError: The response is not the TSV of the version method.
+    """
+    try:
+        header, values = text.strip().split("\n")[:2]
+        version = dict(zip(header.split("\t"), values.split("\t")))
+        return version["string_version"].strip(), version["stable_address"].strip()
+    except (ValueError, KeyError) as error:
+        raise StringResponseError(f"Unexpected response of the STRING version method: {text[:200]!r}") from error
+
+
+class StringClient:
+    """
+    STRING API client sharing one pooled HTTP session.
+
+    Failed calls (connection errors and 429/5xx responses) are retried with
+    exponential backoff by urllib3. With a ResultCache, the background ID
+    mapping and the enrichment tables are stored under the STRING version and
+    the hash of the gene sets, so repeated queries are answered from disk; the
+    version itself is re-checked at most every version_ttl seconds.
+
+    Args:
+        base_url (str): STRING server, e.g. a local stub from benchmarks/string_stub_server.py.
+        cache (ResultCache): Persistent cache of responses, or None.
+        max_retries (int): Retries per call.
+        backoff_factor (float): Retry n waits backoff_factor * 2 ** (n - 1) seconds.
+        timeout (float): Seconds to wait for a response.
+        pool_size (int): Connections kept open, i.e. the number of concurrent calls.
+        record_dir (Path): Save every response fetched from the network there, for the stub server to replay.
+    """
+
+    def __init__(
+        self, base_url=STRING_BASE_URL, cache=None, species=STRING_SPECIES, max_retries=3,
+        backoff_factor=1.0, timeout=120, pool_size=4, version_ttl=24 * 3600, record_dir=None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.species = species
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.version_ttl = version_ttl
+        self.record_dir = Path(record_dir) if record_dir is not None else None
+        self.network_calls = 0
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _post(self, api_url, method, data):
+        response = self.session.post(f"{api_url}/tsv/{method}", data=data, timeout=self.timeout)
+        response.raise_for_status()
+        with self._lock:
+            self.network_calls += 1
+        if self.record_dir is not None:
+            self.record_dir.mkdir(parents=True, exist_ok=True)
+            (self.record_dir / f"{method}_{request_fingerprint(method, data)}.tsv").write_text(response.text)
+        return response.text
+
+    def version(self):
+        """
+        Current (string_version, API URL of the version's stable address).
+        """
+        with self._lock:
+            version = self._version
+        if version is not None and time.time() - version[0] < self.version_ttl:
+            return version[1:]
+
+        version_key = make_cache_key("STRING_version", [], [], params={"base_url": self.base_url})
+        if self.cache is not None:
+            # not a result of the user's query, so not part of the hit rate
+            version = self.cache.get(version_key, count=False)
+        if version is None or time.time() - version[0] >= self.version_ttl:
+            string_version, stable_address = parse_version(self._post(f"{self.base_url}/api", "version", {}))
+            # pin the calls to the address of the current version; a stand-in server is used as is
+            api_root = stable_address if self.base_url == STRING_BASE_URL else self.base_url
+            version = (time.time(), string_version, f"{api_root.rstrip('/')}/api")
+            if self.cache is not None:
+                self.cache.put(version_key, version)
+
+        with self._lock:
+            self._version = version
+        return version[1:]
+
+    def _cached(self, name, query_genes, bg_genes, compute):
+        string_version, api_url = self.version()
+        if self.cache is None:
+            return compute(api_url)
+        key = make_cache_key(name, query_genes, bg_genes, params={"string_version": string_version, "species": self.species})
+        return self.cache.get_or_compute(key, lambda: compute(api_url))
+
+    def string_ids(self, genes):
+        """
+        STRING identifiers of the genes, skipping unmapped genes.
+        """
+        def compute(api_url):
+            data = {
+                "identifiers": "\r".join(genes),
+                "species": self.species,
+                "limit": 1,
+                "echo_query": 1,
+                "caller_identity": CALLER_IDENTITY,
+            }
+            text = self._post(api_url, "get_string_ids", data)
+            return [line.split("\t")[2] for line in text.strip().split("\n")[1:] if line]
+
+        return self._cached("STRING_ids", genes, [], compute)
+
+    def enrichment(self, query_genes, bg_genes):
+        """
+        STRING functional enrichment of the query genes against the background genes.
+        """
+        def compute(api_url):
+            data = {
+                "identifiers": "%0d".join(query_genes),
+                "background_string_identifiers": "%0d".join(self.string_ids(bg_genes)),
+                "species": self.species,
+                "caller_identity": CALLER_IDENTITY,
+            }
+            text = self._post(api_url, "enrichment", data)
+            return pd.read_csv(io.StringIO(text), sep="\t") if text.strip() else pd.DataFrame()
+
+        return self._cached("STRING", query_genes, bg_genes, compute)
+
+    def enrichment_many(self, query_sets, bg_genes):
+        """
+        Enrichment of several query sets against one background, with up to pool_size requests in flight.
+
+        Returns:
+            dict: Query set name to DataFrame.
+        """
+        # map the background once before the concurrent calls
+        self.string_ids(bg_genes)
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            futures = {name: executor.submit(self.enrichment, genes, bg_genes) for name, genes in query_sets.items()}
+            return {name: future.result() for name, future in futures.items()}
@@ -1,7 +1,8 @@
 import pandas as pd
 import streamlit as st
 
-@st.cache_data
+# shared by all sessions, do not modify the returned dict and list
+@st.cache_resource
 def gene_information(gene_info_file):
 
     gene_info = pd.read_csv(gene_info_file, index_col=0, sep="\t")
@@ -12,30 +13,30 @@ def gene_information(gene_info_file):
     
     return gene_id_to_name, coding_genes
 
-def transform_query_genes_to_sysIDs(query_genes, gene_id_to_name, name_to_id):
+def transform_query_genes_to_sysIDs(query_genes, gene_resolver):
 
-    query_sysIDs = []
-    missing_genes = []
-    for query in query_genes:
-        if query in gene_id_to_name:
-            query_sysIDs.append(query)
-        elif query in name_to_id:
-            query_sysIDs.append(name_to_id[query])
-        else:
-            missing_genes.append(query)
+    query_sysIDs, missing_genes, renamed_genes = gene_resolver.resolve_many(query_genes)
     print_missing_genes = "\n".join(missing_genes)
     print_info = f"There are {len(query_genes)} genes in the list.\n{len(query_sysIDs)} were found.\nThe following {len(missing_genes)} genes were not found:\n{print_missing_genes}"
+    # names are expected; synonyms and UniProt IDs are worth reporting
+    updated_genes = [
+        f"{query} ({kind}) -> {sysID} / {gene_resolver.gene_id_to_name.get(sysID, sysID)}"
+        for query, (sysID, kind) in renamed_genes.items() if kind in ["synonym", "UniProt ID"]
+    ]
+    if updated_genes:
+        print_updated_genes = "\n".join(updated_genes)
+        print_info += f"\nThe following {len(updated_genes)} genes were found through a synonym or UniProt ID:\n{print_updated_genes}"
 
     return query_sysIDs, missing_genes, print_info
 
-def get_gene_list_from_text_area(container, key, gene_id_to_name, name_to_id):
+def get_gene_list_from_text_area(container, key, gene_resolver):
     genes = container.text_area(
         "Enter the genes (each gene by one row)", "SPAC1002.09c\nSPAC3G9.12", key=key)
     if "," in genes:
         genes = genes.replace(",", "\n")
     genes = genes.strip().split("\n")
     genes = [gene.strip() for gene in genes]
-    query_sysIDs, missing_genes, print_info = transform_query_genes_to_sysIDs(genes, gene_id_to_name, name_to_id)
+    query_sysIDs, missing_genes, print_info = transform_query_genes_to_sysIDs(genes, gene_resolver)
     container.text(print_info)
     return query_sysIDs, genes
 